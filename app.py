@@ -1,8 +1,36 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, g, has_app_context, has_request_context, Response, stream_with_context, abort, before_render_template, template_rendered
+from flask.globals import request_ctx
+from flask.sessions import SessionInterface, SessionMixin
+from flask.json.tag import TaggedJSONSerializer
+from werkzeug.datastructures import CallbackDict
+from itsdangerous import Signer, BadSignature
 import mysql.connector
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 import bcrypt
 from functools import wraps
+import click
+import os
+import sys
+import io
+import csv
+import json
+import re
+import collections
+import queue
+import threading
+import time
+import sqlite3
+import hashlib
+import uuid
+import marshal
+import secrets
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import heapq
+import bisect
+from array import array
+import numpy as np
 
 app = Flask(__name__)
 
@@ -11,6 +39,12 @@ def role_required(allowed_roles):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
+            if request.path.startswith('/api/'):
+                # API clients get a status, not a flash message and a login page
+                if 'role' not in session:
+                    return jsonify({'error': "Authentication required."}), 401
+                if session['role'] not in allowed_roles:
+                    return jsonify({'error': "You do not have permission to access this resource."}), 403
             if 'role' not in session:
                 flash("Please log in to access this page.", "error")
                 return redirect(url_for('login'))
@@ -45,37 +79,496 @@ DB_CONFIGS = {
 }
 # -----------------------------------
 
+# --- Connection Pool Settings ---
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))                # idle connections kept per role
+POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', 5))  # extra connections allowed under load
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))          # seconds to wait once the pool is exhausted
+POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', 30))   # ping connections idle longer than this
+POOL_RECYCLE = float(os.environ.get('DB_POOL_RECYCLE', 1800))       # reopen connections older than this
+
+class PoolExhaustedError(Exception):
+    """Raised when no pooled connection becomes free within POOL_TIMEOUT."""
+
+class _PoolSlot:
+    """A raw MySQL connection owned by a pool, plus its bookkeeping."""
+    def __init__(self, con):
+        self.con = con
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.statements = {}  # SQL text -> prepared cursor, kept for the life of the connection
+
+class PooledConnection:
+    """A single checkout of a pooled connection. close() returns it to the pool."""
+    def __init__(self, pool, slot):
+        self._pool = pool
+        self._slot = slot
+
+    def __getattr__(self, name):
+        return getattr(self._slot.con, name)
+
+    def cursor(self, *args, **kwargs):
+        cur = self._slot.con.cursor(*args, **kwargs)
+        return TimedCursor(cur) if INSTRUMENT else cur
+
+    def prepared(self, sql):
+        """Returns a prepared-statement cursor for sql, prepared once per pooled connection."""
+        cur = self._slot.statements.get(sql)
+        if cur is None:
+            cur = self._slot.statements[sql] = self._slot.con.cursor(prepared=True)
+        return TimedCursor(cur) if INSTRUMENT else cur
+
+    def close(self):
+        slot, self._slot = self._slot, None
+        if slot is not None:
+            self._pool.release(slot)
+
+class ConnectionPool:
+    """Per-role pool of MySQL connections with bounded overflow and checkout metrics."""
+    def __init__(self, role, config, size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW, timeout=POOL_TIMEOUT):
+        self.role = role
+        self.config = config
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self.stats = {
+            'checkouts': 0, 'waits': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0,
+            'timeouts': 0, 'created': 0, 'overflow_created': 0, 'health_failures': 0, 'discarded': 0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _healthy(self, slot):
+        """Pings connections that have been idle a while; recycles old ones."""
+        now = time.monotonic()
+        if now - slot.created_at > POOL_RECYCLE:
+            return False
+        if now - slot.last_used > POOL_PING_AFTER:
+            try:
+                return slot.con.is_connected()
+            except Exception:
+                return False
+        return True
+
+    def _discard(self, slot):
+        with self._lock:
+            self._open -= 1
+            self.stats['discarded'] += 1
+        try:
+            slot.con.close()
+        except Exception:
+            pass
+
+    def _create(self):
+        """Opens a new connection if the pool (plus overflow) has room, else returns None."""
+        with self._lock:
+            if self._open >= self.size + self.max_overflow:
+                return None
+            self._open += 1
+            overflow = self._open > self.size
+        try:
+            slot = _PoolSlot(mysql.connector.connect(**self.config))
+        except Exception:
+            with self._lock:
+                self._open -= 1
+            raise
+        self._count('created')
+        if overflow:
+            self._count('overflow_created')
+        return slot
+
+    def acquire(self):
+        """Borrows a connection, waiting up to `timeout` seconds when the pool is exhausted."""
+        start = time.monotonic()
+        waited = False
+        while True:
+            try:
+                slot = self._idle.get_nowait()
+            except queue.Empty:
+                slot = self._create()
+                if slot is None:
+                    remaining = self.timeout - (time.monotonic() - start)
+                    waited = True
+                    try:
+                        slot = self._idle.get(timeout=max(remaining, 0))
+                    except queue.Empty:
+                        self._count('timeouts')
+                        raise PoolExhaustedError(f"No '{self.role}' connection available after {self.timeout}s")
+                else:
+                    break
+            if self._healthy(slot):
+                break
+            self._count('health_failures')
+            self._discard(slot)
+
+        wait = time.monotonic() - start
+        if INSTRUMENT:
+            instrumentation.connected(self.role, wait)
+        with self._lock:
+            self.stats['checkouts'] += 1
+            if waited:
+                self.stats['waits'] += 1
+                self.stats['wait_seconds'] += wait
+                self.stats['max_wait_seconds'] = max(self.stats['max_wait_seconds'], wait)
+        return PooledConnection(self, slot)
+
+    def release(self, slot):
+        """Resets a connection's session state and returns it to the idle queue."""
+        con = slot.con
+        try:
+            if con.unread_result:
+                con.consume_results()
+            if con.in_transaction:
+                con.rollback()
+        except Exception:
+            self._discard(slot)
+            return
+        slot.last_used = time.monotonic()
+        if self._idle.qsize() >= self.size:
+            # Overflow connection: close it instead of growing the idle set.
+            self._discard(slot)
+        else:
+            self._idle.put(slot)
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.stats)
+            data['open'] = self._open
+        data['idle'] = self._idle.qsize()
+        data['in_use'] = data['open'] - data['idle']
+        data['size'] = self.size
+        data['max_overflow'] = self.max_overflow
+        return data
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(role='admin'):
+    """Returns the connection pool for a role, creating it on first use."""
+    role = role if role in DB_CONFIGS else 'admin'
+    pool = _pools.get(role)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(role)
+            if pool is None:
+                pool = _pools[role] = ConnectionPool(role, DB_CONFIGS[role])
+    return pool
+
+# --- Instrumentation ---
+INSTRUMENT = os.environ.get('INSTRUMENT', '0') == '1'                  # per-request spans, /metrics and slow-query log
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))            # queries slower than this are logged with EXPLAIN
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 1000))       # requests slower than this are logged with their spans
+EXPLAIN_INTERVAL = float(os.environ.get('EXPLAIN_INTERVAL', 300))      # seconds before the same statement is EXPLAINed again
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')                        # bearer token for scrapers (admins can always read /metrics)
+METRICS_MAX_STATEMENTS = int(os.environ.get('METRICS_MAX_STATEMENTS', 500))  # distinct statement labels before "other"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram:
+    """A Prometheus histogram with one series per label tuple."""
+    def __init__(self, name, help_text, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, values, seconds):
+        slot = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[slot] += 1
+            series[-1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {values: list(counts) for values, counts in self._series.items()}
+        for values, counts in sorted(series.items()):
+            labels = ','.join(f'{key}="{prometheus_escape(value)}"' for key, value in zip(self.labels, values))
+            sep = ',' if labels else ''
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                total += count
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{bound}"}} {total}')
+            lines.append(f"{self.name}_sum{{{labels}}} {counts[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {total}")
+        return lines
+
+def prometheus_escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+SQL_LITERALS = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|\b\d+(?:\.\d+)?\b|%s|%\(\w+\)s")
+SQL_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+class Instrumentation:
+    """
+    Request spans and Prometheus histograms. Only wired in when INSTRUMENT=1; otherwise
+    PooledConnection.cursor() hands out plain cursors and no request hooks are registered.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._statements = {}  # raw SQL -> normalised label
+        self._labels = set()
+        self._explained = {}   # label -> monotonic time of the last EXPLAIN
+        self._explain_queue = queue.Queue(maxsize=100)
+        self._explainer = None
+        self.slow_queries = collections.deque(maxlen=50)
+        self.requests = Histogram('http_request_duration_seconds', "Time spent handling a request.", ('endpoint', 'method', 'status'))
+        self.connects = Histogram('db_connect_duration_seconds', "Time spent checking a connection out of the pool.", ('role',))
+        self.queries = Histogram('db_query_duration_seconds', "Time spent executing a statement.", ('statement',))
+        self.fetches = Histogram('db_fetch_duration_seconds', "Time spent fetching result rows.", ('statement',))
+        self.renders = Histogram('template_render_duration_seconds', "Time spent rendering a template.", ('template',))
+
+    def statement(self, sql):
+        """Normalised SQL text used as a metric label: literals and IN lists collapsed."""
+        label = self._statements.get(sql)
+        if label is None:
+            label = SQL_LISTS.sub('(...)', SQL_LITERALS.sub('?', ' '.join(str(sql).split())))
+            with self._lock:
+                if label not in self._labels:
+                    if len(self._labels) >= METRICS_MAX_STATEMENTS:
+                        label = 'other'
+                    else:
+                        self._labels.add(label)
+                if len(self._statements) >= 10 * METRICS_MAX_STATEMENTS:
+                    self._statements.clear()  # generated SQL (IN lists of every length) maps many texts to one label
+                self._statements[sql] = label
+        return label
+
+    def span(self, kind, name, seconds):
+        """Adds a span to the current request, if there is one."""
+        if has_request_context():
+            spans = g.setdefault('_spans', [])
+            if len(spans) < 500:
+                spans.append((kind, name, seconds))
+            totals = g.setdefault('_span_totals', {})
+            count, total = totals.get(kind, (0, 0.0))
+            totals[kind] = (count + 1, total + seconds)
+
+    def connected(self, role, seconds):
+        self.connects.observe((role,), seconds)
+        self.span('connect', role, seconds)
+
+    def query(self, sql, params, seconds):
+        label = self.statement(sql)
+        self.queries.observe((label,), seconds)
+        self.span('query', label, seconds)
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            self._slow(sql, params, label, seconds)
+
+    def fetched(self, sql, seconds):
+        label = self.statement(sql)
+        self.fetches.observe((label,), seconds)
+        self.span('fetch', label, seconds)
+
+    def _slow(self, sql, params, label, seconds):
+        entry = {
+            'statement': label, 'ms': round(seconds * 1000, 2), 'at': datetime.now().isoformat(timespec='seconds'),
+            'endpoint': request.endpoint if has_request_context() else None, 'explain': None,
+        }
+        self.slow_queries.append(entry)
+        now = time.monotonic()
+        verb = label.split(' ', 1)[0].upper()
+        with self._lock:
+            due = verb in ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE') and now - self._explained.get(label, -EXPLAIN_INTERVAL) >= EXPLAIN_INTERVAL
+            if due:
+                self._explained[label] = now
+                if self._explainer is None:
+                    self._explainer = threading.Thread(target=self._explain_loop, name='slow-query-explain', daemon=True)
+                    self._explainer.start()
+        if due:
+            try:
+                self._explain_queue.put_nowait((sql, params, entry))
+            except queue.Full:
+                pass
+        else:
+            app.logger.warning("Slow query (%.1f ms): %s", entry['ms'], label)
+
+    def _explain_loop(self):
+        """EXPLAINs slow statements on a separate connection, off the request path."""
+        while True:
+            sql, params, entry = self._explain_queue.get()
+            try:
+                con = get_pool('admin').acquire()
+                try:
+                    cur = con._slot.con.cursor()  # raw cursor: EXPLAIN itself is not timed
+                    cur.execute("EXPLAIN " + sql, params)
+                    plan = [dict(zip(cur.column_names, row)) for row in cur.fetchall()]
+                finally:
+                    con.close()
+                entry['explain'] = [{key: value for key, value in row.items() if value is not None} for row in plan]
+            except Exception as e:
+                entry['explain'] = f"EXPLAIN failed: {e}"
+            app.logger.warning("Slow query (%.1f ms): %s\nEXPLAIN: %s", entry['ms'], entry['statement'], entry['explain'])
+
+    def render(self):
+        lines = []
+        for histogram in (self.requests, self.connects, self.queries, self.fetches, self.renders):
+            lines.extend(histogram.render())
+        for name, key, help_text in (('db_pool_in_use', 'in_use', "Connections checked out."),
+                                     ('db_pool_idle', 'idle', "Idle pooled connections.")):
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge"])
+            for role, pool in list(_pools.items()):
+                lines.append(f'{name}{{role="{role}"}} {pool.snapshot()[key]}')
+        return '\n'.join(lines) + '\n'
+
+instrumentation = Instrumentation()
+
+class TimedCursor:
+    """Wraps a MySQL cursor, timing execute() and fetch calls. Everything else passes through."""
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._sql = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._sql = operation
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            instrumentation.query(operation, params, time.perf_counter() - start)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        self._sql = operation
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            instrumentation.query(operation, None, time.perf_counter() - start)
+
+    def _fetch(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return getattr(self._cursor, method)(*args, **kwargs)
+        finally:
+            instrumentation.fetched(self._sql or '?', time.perf_counter() - start)
+
+    def fetchone(self):
+        return self._fetch('fetchone')
+
+    def fetchmany(self, *args, **kwargs):
+        return self._fetch('fetchmany', *args, **kwargs)
+
+    def fetchall(self):
+        return self._fetch('fetchall')
+
+def begin_request_timing():
+    g._started = time.perf_counter()
+
+def finish_request_timing(response):
+    started = g.pop('_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    instrumentation.requests.observe((request.endpoint or 'unmatched', request.method, str(response.status_code)), elapsed)
+    totals = g.get('_span_totals', {})
+    timing = [f'{kind};dur={total * 1000:.2f};desc="{count}x"' for kind, (count, total) in totals.items()]
+    timing.append(f"total;dur={elapsed * 1000:.2f}")
+    response.headers['Server-Timing'] = ', '.join(timing)
+    if elapsed * 1000 >= SLOW_REQUEST_MS:
+        spans = sorted(g.get('_spans', []), key=lambda span: span[2], reverse=True)[:10]
+        app.logger.warning(
+            "Slow request (%.1f ms): %s %s\n%s", elapsed * 1000, request.method, request.path,
+            '\n'.join(f"  {kind:8} {seconds * 1000:8.2f} ms  {name}" for kind, name, seconds in spans),
+        )
+    return response
+
+def begin_render(sender, template, context, **extra):
+    g.setdefault('_renders', []).append(time.perf_counter())
+
+def finish_render(sender, template, context, **extra):
+    renders = g.get('_renders')
+    if renders:
+        seconds = time.perf_counter() - renders.pop()
+        instrumentation.renders.observe((template.name,), seconds)
+        instrumentation.span('render', template.name, seconds)
+
+if INSTRUMENT:
+    app.before_request(begin_request_timing)
+    app.after_request(finish_request_timing)
+    before_render_template.connect(begin_render, app)
+    template_rendered.connect(finish_render, app)
+
+@app.route('/metrics')
+def metrics():
+    if not INSTRUMENT:
+        return jsonify({'error': "Instrumentation is disabled (set INSTRUMENT=1)."}), 404
+    token = request.headers.get('Authorization', '')
+    if session.get('role') != 'admin' and not (METRICS_TOKEN and token == f"Bearer {METRICS_TOKEN}"):
+        return jsonify({'error': "Forbidden"}), 403
+    return Response(instrumentation.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/slow')
+@role_required(['admin'])
+def slow_queries():
+    return jsonify(list(instrumentation.slow_queries))
+
 # --- Database Connection ---
 def connect_db(role='admin'):
-    """Establishes a connection to the MySQL database based on user role."""
-    config = DB_CONFIGS.get(role, DB_CONFIGS['admin'])
+    """Borrows a pooled connection for the given role. Call close() to hand it back."""
     try:
-        con = mysql.connector.connect(**config)
-        return con
+        con = get_pool(role).acquire()
+    except PoolExhaustedError as e:
+        if has_request_context():
+            flash(f"Database Busy: {e}. Please try again.", "error")
+        return None
     except Exception as e:
-        flash(f"Database Connection Error: Could not connect to database. Please check your config.\nError: {e}", "error")
+        if has_request_context():
+            flash(f"Database Connection Error: Could not connect to database. Please check your config.\nError: {e}", "error")
         return None
+    if has_app_context():
+        g.setdefault('_db_connections', []).append(con)
+    return con
+
+@app.teardown_appcontext
+def release_db_connections(exc):
+    """Returns any connection a handler forgot to close (e.g. after an exception)."""
+    for con in g.pop('_db_connections', []):
+        con.close()
 
 # --- Utility Functions ---
+def is_positive_int(value):
+    """True if value is a positive integer (given as a string or int)."""
+    value = str(value) if value is not None else ''
+    return value.isdigit() and int(value) > 0
+
+def is_non_negative_float(value):
+    """True if value parses as a non-negative number."""
+    try:
+        return not float(value) < 0
+    except (ValueError, TypeError):
+        return False
+
 def validate_int_input(value, field_name):
     """Validates if a value is a positive integer."""
-    if not value or not value.isdigit() or int(value) <= 0:
+    if not is_positive_int(value):
         flash(f"'{field_name}' must be a positive integer.", "error")
         return False
     return True
 
 def validate_float_input(value, field_name):
     """Validates if a value is a non-negative number."""
-    try:
-        f_val = float(value)
-        if f_val < 0:
-            raise ValueError
-        return True
-    except (ValueError, TypeError):
+    if not is_non_negative_float(value):
         flash(f"'{field_name}' must be a non-negative number.", "error")
         return False
+    return True
 
 # --- Dashboard Refresh ---
+DASHBOARD_TTL = float(os.environ.get('DASHBOARD_TTL', 300))  # seconds between COUNT(*) reconciliations
+
 def refresh_dashboard(role):
     """Fetches and updates the counts for the dashboard summary."""
     con = connect_db(role)
@@ -94,16 +587,97 @@ def refresh_dashboard(role):
             return total_customers, total_bookings, total_payments
         except Exception as e:
             flash(f"Dashboard Error: Failed to load dashboard data: {e}", "error")
-            return 0, 0, 0
+            return None
         finally:
             con.close()
-    return 0, 0, 0
+    return None
+
+class DashboardStats:
+    """
+    Cached dashboard counters.
+    Write handlers adjust them in place; they are reconciled against
+    refresh_dashboard() once they are older than DASHBOARD_TTL seconds.
+    """
+    def __init__(self, ttl=DASHBOARD_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._counts = None
+        self._loaded_at = 0.0
+
+    def get(self, role):
+        """Returns (customers, bookings, payments), reconciling if the cache is stale."""
+        with self._lock:
+            if self._counts is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return tuple(self._counts)
+        counts = refresh_dashboard(role)
+        with self._lock:
+            if counts is None:
+                return tuple(self._counts) if self._counts is not None else (0, 0, 0)
+            self._counts = list(counts)
+            self._loaded_at = time.monotonic()
+        return counts
+
+    def adjust(self, customers=0, bookings=0, payments=0):
+        """Applies the delta of a committed write. Does nothing until the first load."""
+        with self._lock:
+            if self._counts is not None:
+                self._counts[0] = max(self._counts[0] + customers, 0)
+                self._counts[1] = max(self._counts[1] + bookings, 0)
+                self._counts[2] = max(self._counts[2] + payments, 0)
+
+    def invalidate(self):
+        """Forces a reconciliation on the next read."""
+        with self._lock:
+            self._counts = None
+
+dashboard_stats = DashboardStats()
+
+# --- Data Version Stamps ---
+DATA_VERSION_DIR = os.environ.get('DATA_VERSION_DIR', os.path.join(app.instance_path, 'versions'))
+
+class VersionStamp:
+    """
+    A version token shared by all worker processes through a small file.
+    bump() atomically replaces the file, so readers only ever see whole tokens.
+    """
+    def __init__(self, name, directory=DATA_VERSION_DIR):
+        self.path = os.path.join(directory, f"{name}.version")
+
+    def current(self):
+        try:
+            with open(self.path) as f:
+                return f.read()
+        except FileNotFoundError:
+            return ''
+
+    def bump(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        token = f"{time.time_ns()}-{os.getpid()}-{threading.get_ident()}"
+        tmp = f"{self.path}.{token}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(token)
+        os.replace(tmp, self.path)
+        return token
+
+_stamps = {}
+
+def data_version(name):
+    """Returns the shared VersionStamp for a table (or other cached data set)."""
+    stamp = _stamps.get(name)
+    if stamp is None:
+        stamp = _stamps.setdefault(name, VersionStamp(name))
+    return stamp
+
+def bump_versions(*names):
+    """Bumps the stamp of every table a committed write touched, cascades included."""
+    for name in names:
+        data_version(name).bump()
 
 # --- PACKAGE UTILITIES ---
 def load_packages():
     """
     Fetches package names, IDs, and prices.
-    Returns: {PackageName: (PackageID, PackagePrice)}
+    Returns: {PackageName: (PackageID, PackagePrice)}, or None if the query failed.
     """
     con = connect_db()
     if con:
@@ -113,17 +687,814 @@ def load_packages():
             packages = cur.fetchall()
             return {name: (pid, price) for name, pid, price in packages}
         except Exception:
-            return {}
+            return None
+        finally:
+            con.close()
+    return None
+
+class PackageCatalog:
+    """
+    The package map, loaded lazily and kept until the TourPackage version stamp changes.
+    add_package / update_package / delete_package call invalidate(); every other
+    worker picks the change up on its next get().
+    """
+    def __init__(self, stamp):
+        self.stamp = stamp
+        self._lock = threading.Lock()
+        self._packages = None
+        self._version = None
+
+    def get(self):
+        version = self.stamp.current()
+        with self._lock:
+            if self._packages is not None and version == self._version:
+                return self._packages
+        packages = load_packages()
+        with self._lock:
+            if packages is None:
+                return self._packages or {}
+            # Store the version read *before* loading so a concurrent bump triggers another reload.
+            self._packages, self._version = packages, version
+        return packages
+
+    def names(self):
+        return list(self.get().keys())
+
+    def invalidate(self):
+        self.stamp.bump()
+
+package_catalog = PackageCatalog(data_version('TourPackage'))
+
+# --- Keyset Pagination ---
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 50))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 500))
+
+CUSTOMER_SELECT = "SELECT CustomerID, Cname, Email, State, City, Country, Refers FROM Customer"
+DEPENDENT_SELECT = "SELECT DependentID, DependentName, Age, Relation, CustomerID FROM TravelDependent"
+BOOKING_SELECT = "SELECT BookingID, BookingDate, Status, CustomerID, PackageID FROM Booking"
+PAYMENT_SELECT = "SELECT PaymentID, Amount, PaymentDate, PaymentMethod, BookingID FROM Payment"
+PACKAGE_SELECT = "SELECT PackageID, PackageName, PackagePrice, Duration, No_of_Travelers FROM TourPackage"
+DESTINATION_SELECT = "SELECT DestinationID, DestinationName, Dlocation FROM Destination"
+HOTEL_SELECT = "SELECT HotelID, HotelName, Address, Rating, HotelPrice, Rooms FROM Hotel"
+TRANSPORT_SELECT = "SELECT TransportID, TransportType, DepartLocation, ArrivalLocation, DepartDateTime, ArrivalDateTime, TransportPrice FROM Transport"
+ITINERARY_SELECT = "SELECT BookingID, HotelID, TransportID, RoomType, CheckInDate, CheckOutDate, SeatClass FROM Itinerary"
+
+def page_args():
+    """Reads the ?after=, ?before= and ?limit= keyset arguments, clamping the page size."""
+    limit = request.args.get('limit', PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return request.args.get('after', type=int), request.args.get('before', type=int), limit
+
+def fetch_page(cur, select, key):
+    """
+    Fetches one page of `select` ordered by `key`, which must be its first column.
+    Returns (rows, pager) where pager carries the next/prev cursors for the templates.
+    """
+    after, before, limit = page_args()
+    if before is not None:
+        cur.execute(f"{select} WHERE {key} < %s ORDER BY {key} DESC LIMIT %s", (before, limit + 1))
+        rows = cur.fetchall()
+        has_prev, has_next = len(rows) > limit, True
+        rows = rows[:limit][::-1]
+    else:
+        if after is not None:
+            cur.execute(f"{select} WHERE {key} > %s ORDER BY {key} LIMIT %s", (after, limit + 1))
+        else:
+            cur.execute(f"{select} ORDER BY {key} LIMIT %s", (limit + 1,))
+        rows = cur.fetchall()
+        has_prev, has_next = after is not None, len(rows) > limit
+        rows = rows[:limit]
+    pager = {
+        'limit': limit,
+        'next': rows[-1][0] if rows and has_next else None,
+        'prev': rows[0][0] if rows and has_prev else None,
+    }
+    return rows, pager
+
+def wants_json():
+    return request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json'
+
+def page_json(cur, rows, pager):
+    """JSON variant of a keyset page."""
+    columns = cur.column_names
+    return jsonify({
+        'items': [dict(zip(columns, row)) for row in rows],
+        'next_cursor': pager['next'],
+        'prev_cursor': pager['prev'],
+        'limit': pager['limit'],
+    })
+
+@app.route('/pool/stats')
+@role_required(['admin'])
+def pool_stats():
+    return jsonify({role: pool.snapshot() for role, pool in _pools.items()})
+
+# --- Idempotency Keys ---
+IDEMPOTENCY_DB = os.environ.get('IDEMPOTENCY_DB', os.path.join(app.instance_path, 'idempotency.sqlite3'))
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 86400))        # seconds a finished response is replayed
+IDEMPOTENCY_PENDING = int(os.environ.get('IDEMPOTENCY_PENDING', 300))  # seconds before an unfinished claim is abandoned
+IDEMPOTENCY_WAIT = float(os.environ.get('IDEMPOTENCY_WAIT', 30))       # seconds a duplicate waits for the first attempt
+
+class IdempotencyMismatch(Exception):
+    """An idempotency key was reused for a different submission."""
+
+class IdempotencyStore:
+    """
+    Idempotency key -> submission fingerprint and stored response, shared by every worker
+    on the host through a small SQLite file (WAL mode). claim() is an INSERT OR IGNORE, so
+    exactly one request per key runs the handler; duplicates wait for it to finish and
+    replay its response, and a different submission under the same key is refused.
+    """
+    def __init__(self, path=IDEMPOTENCY_DB, ttl=IDEMPOTENCY_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._done = {}  # key -> Event, wakes duplicates waiting in this process
+        self._claims = 0
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS idempotency (
+                    Key TEXT PRIMARY KEY,
+                    Fingerprint TEXT,
+                    Response TEXT,
+                    ExpiresAt REAL NOT NULL
+                )
+            """)
+            if 'Fingerprint' not in [row[1] for row in db.execute("PRAGMA table_info(idempotency)")]:
+                db.execute("ALTER TABLE idempotency ADD COLUMN Fingerprint TEXT")  # files from before fingerprints were stored
+            self._local.db = db
+        return db
+
+    def claim(self, key, fingerprint):
+        """
+        True if this request now owns the key and must run the handler, False if it repeats
+        the submission that owns it. Raises IdempotencyMismatch if the key belongs to a
+        submission with a different fingerprint.
+        """
+        now = time.time()
+        db = self._db()
+        db.execute("DELETE FROM idempotency WHERE Key = ? AND ExpiresAt < ?", (key, now))
+        for _ in range(2):
+            claimed = db.execute("INSERT OR IGNORE INTO idempotency (Key, Fingerprint, ExpiresAt) VALUES (?, ?, ?)",
+                                 (key, fingerprint, now + IDEMPOTENCY_PENDING)).rowcount == 1
+            if claimed:
+                break
+            row = db.execute("SELECT Fingerprint FROM idempotency WHERE Key = ?", (key,)).fetchone()
+            if row is None:
+                continue  # released between the two statements: try to claim it again
+            if row[0] != fingerprint:
+                raise IdempotencyMismatch(key)
+            return False
+        if claimed:
+            with self._lock:
+                self._done.setdefault(key, threading.Event())
+                self._claims += 1
+                sweep = self._claims % 1000 == 0
+            if sweep:
+                db.execute("DELETE FROM idempotency WHERE ExpiresAt < ?", (now,))
+        return claimed
+
+    def wait(self, key, timeout=IDEMPOTENCY_WAIT):
+        """The stored response for a claimed key, waiting for it to finish; None on timeout."""
+        deadline = time.monotonic() + timeout
+        delay = 0.01
+        while True:
+            row = self._db().execute("SELECT Response FROM idempotency WHERE Key = ?", (key,)).fetchone()
+            if row is None:
+                return None  # the first attempt failed and released the key
+            if row[0] is not None:
+                return json.loads(row[0])
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            with self._lock:
+                done = self._done.get(key)
+            if done is not None:
+                done.wait(min(delay, remaining))
+            else:
+                time.sleep(min(delay, remaining))  # claimed by another worker: poll
+            delay = min(delay * 2, 0.2)
+
+    def finish(self, key, response):
+        self._db().execute("UPDATE idempotency SET Response = ?, ExpiresAt = ? WHERE Key = ?",
+                           (json.dumps(response), time.time() + self.ttl, key))
+        self._wake(key)
+
+    def release(self, key):
+        """Forgets a claim whose handler raised, so a retry runs again."""
+        self._db().execute("DELETE FROM idempotency WHERE Key = ?", (key,))
+        self._wake(key)
+
+    def _wake(self, key):
+        with self._lock:
+            done = self._done.pop(key, None)
+        if done is not None:
+            done.set()
+
+idempotency_store = IdempotencyStore()
+
+@app.context_processor
+def inject_idempotency_key():
+    """Templates put {{ idempotency_key() }} in a hidden field of every mutating form."""
+    return {'idempotency_key': lambda: IDEMPOTENCY_HOLE if g.get('_idempotency_holes') else uuid.uuid4().hex}
+
+def request_fingerprint():
+    """Hash of the submitted form and files, so one key never replays or reruns a different submission."""
+    digest = hashlib.sha256(request.path.encode())
+    for name, value in sorted(request.form.items(multi=True)):
+        if name != 'idempotency_key':
+            digest.update(f"\0{name}={value}".encode())
+    for name, upload in sorted(request.files.items(multi=True)):
+        digest.update(f"\0{name}:{upload.filename}:".encode())
+        for chunk in iter(lambda: upload.stream.read(65536), b''):
+            digest.update(chunk)
+        upload.stream.seek(0)
+    return digest.hexdigest()
+
+def replay_response(stored):
+    for category, message in stored['flashes']:
+        flash(message, category)
+    response = Response(stored['body'], status=stored['status'], headers=stored['headers'])
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def idempotent(f):
+    """
+    Runs a mutating POST at most once per idempotency key (the idempotency_key form field
+    or an Idempotency-Key header). Duplicates get the first response, flashes included,
+    without touching MySQL. Requests without a key run as before.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+        if request.method != 'POST' or not token:
+            return f(*args, **kwargs)
+        key = f"{session.get('user_id', '-')}:{token}"
+
+        try:
+            claimed = idempotency_store.claim(key, request_fingerprint())
+        except IdempotencyMismatch:
+            message = "This form was already submitted with different values. Reload the page and submit again."
+            if wants_json() or request.headers.get('Idempotency-Key'):
+                return jsonify({'error': message}), 422
+            flash(message, "error")
+            return redirect(request.referrer or url_for('index'))
+        if not claimed:
+            stored = idempotency_store.wait(key)
+            if stored is not None:
+                return replay_response(stored)
+            message = "This request is already being processed. Check the result before submitting again."
+            if wants_json() or request.headers.get('Idempotency-Key'):
+                return jsonify({'error': message}), 409
+            flash(message, "warning")
+            return redirect(request.referrer or url_for('index'))
+
+        flashes_before = len(session.get('_flashes', []))
+        try:
+            response = app.make_response(f(*args, **kwargs))
+        except Exception:
+            idempotency_store.release(key)
+            raise
+        idempotency_store.finish(key, {
+            'status': response.status_code,
+            'headers': {name: value for name, value in response.headers.items() if name in ('Location', 'Content-Type')},
+            'body': response.get_data(as_text=True),
+            'flashes': [list(item) for item in session.get('_flashes', [])[flashes_before:]],
+        })
+        return response
+    return decorated_function
+
+# --- Response Cache ---
+RESPONSE_CACHE_BYTES = int(os.environ.get('RESPONSE_CACHE_BYTES', 32 * 1024 * 1024))  # LRU budget per worker, 0 disables
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 300))                # seconds before a page is re-rendered anyway
+IDEMPOTENCY_HOLE = '__idempotency_key__'
+
+class ResponseCache:
+    """
+    Rendered list pages, keyed by route, query string, role and user, valid while the
+    version stamps of the tables they show are unchanged. Least recently used pages are
+    evicted once the bodies exceed max_bytes.
+    """
+    def __init__(self, max_bytes=RESPONSE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # key -> (etag, body, mimetype)
+        self._bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'bypassed': 0, 'evictions': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def get(self, key, etag):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry
+
+    def put(self, key, etag, body, mimetype):
+        size = len(body)
+        if size > self.max_bytes // 4:
+            return  # one huge page would flush everything else
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._entries[key] = (etag, body, mimetype)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted[1])
+                self.stats['evictions'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.stats)
+            data.update({'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes})
+        return data
+
+response_cache = ResponseCache()
+
+def fill_idempotency_holes(body):
+    """Gives every form on a cached page its own fresh idempotency key."""
+    parts = body.split(IDEMPOTENCY_HOLE.encode())
+    if len(parts) == 1:
+        return body
+    out = [parts[0]]
+    for part in parts[1:]:
+        out.append(uuid.uuid4().hex.encode())
+        out.append(part)
+    return b''.join(out)
+
+def page_etag(key, tables):
+    """Changes whenever one of the tables is written or RESPONSE_CACHE_TTL elapses."""
+    versions = [data_version(table).current() for table in tables]
+    epoch = int(time.time() // RESPONSE_CACHE_TTL) if RESPONSE_CACHE_TTL else 0
+    return hashlib.sha1(repr((key, versions, epoch)).encode()).hexdigest()
+
+def cached_page(*tables):
+    """
+    Serves a GET list page from response_cache while the stamps of `tables` are unchanged,
+    with an ETag so browsers revalidate with a 304. Handlers bump the stamps after every
+    committed write. Requests with pending flash messages always render fresh, and pages
+    that displayed a flash message are never stored.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not RESPONSE_CACHE_BYTES or request.method != 'GET' or session.get('_flashes'):
+                response_cache._count('bypassed')
+                return f(*args, **kwargs)
+
+            key = (request.endpoint, request.full_path, wants_json(), session.get('role'), session.get('user_id'))
+            etag = page_etag(key, tables)
+            headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+
+            if etag in request.if_none_match:
+                response_cache._count('not_modified')
+                return Response(status=304, headers=headers)
+            entry = response_cache.get(key, etag)
+            if entry is not None:
+                return Response(fill_idempotency_holes(entry[1]), mimetype=entry[2], headers=headers)
+
+            g._idempotency_holes = True
+            try:
+                response = app.make_response(f(*args, **kwargs))
+            finally:
+                g._idempotency_holes = False
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            body = response.get_data()
+            if not request_ctx.flashes and not session.get('_flashes'):
+                response_cache.put(key, etag, body, response.mimetype)
+            response.set_data(fill_idempotency_holes(body))
+            response.headers.update(headers)
+            return response
+        return decorated_function
+    return decorator
+
+@app.route('/cache/stats')
+@role_required(['admin'])
+def cache_stats():
+    return jsonify(response_cache.snapshot())
+
+# --- Server-Side Sessions ---
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite')   # sqlite (shared by a host's workers), memory (one process) or cookie
+SESSION_DB = os.environ.get('SESSION_DB', os.path.join(app.instance_path, 'sessions.sqlite3'))
+SESSION_TTL = float(os.environ.get('SESSION_TTL', 12 * 3600))   # seconds of inactivity before a session expires
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 10000))  # sessions kept decoded-ready in each worker
+SESSION_SWEEP_INTERVAL = float(os.environ.get('SESSION_SWEEP_INTERVAL', 300))  # seconds between expired-session sweeps
+
+def encode_session(data):
+    """marshal for the plain values sessions hold here; tagged JSON for anything else (datetimes, Markup)."""
+    try:
+        return b'M' + marshal.dumps(data, 4)
+    except ValueError:
+        return b'J' + session_json.dumps(data).encode('utf-8')
+
+def new_session_version():
+    return secrets.token_hex(8)
+
+def decode_session(blob):
+    if blob[:1] == b'M':
+        return marshal.loads(blob[1:])
+    return session_json.loads(blob[1:].decode('utf-8'))
+
+class SessionStore:
+    """
+    Session blobs by ID: an LRU of the most recent ones in front of a SQLite file (WAL)
+    shared by every worker on the host, or the LRU alone when path is None. Each save
+    stores a new random version token, which the cookie carries. A cached blob is only
+    used when its version matches both the cookie and the row's current Version (one
+    indexed lookup, without the blob), so a session saved or deleted by another worker
+    is never served from a stale copy.
+    """
+    def __init__(self, path=SESSION_DB, capacity=SESSION_CACHE_SIZE, ttl=SESSION_TTL):
+        self.path = path
+        self.capacity = capacity
+        self.ttl = ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cache = collections.OrderedDict()  # sid -> (version, blob, expires_at)
+        self._swept_at = time.monotonic()
+        self.stats = {'hits': 0, 'misses': 0, 'saves': 0, 'touches': 0, 'deletes': 0, 'swept': 0}
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            columns = {row[1]: row[2] for row in db.execute("PRAGMA table_info(sessions)")}
+            if columns.get('Version') == 'INTEGER':
+                db.execute("DROP TABLE sessions")  # counter versions from an older build: those users log in again
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    ID TEXT PRIMARY KEY,
+                    Version TEXT NOT NULL,
+                    Data BLOB NOT NULL,
+                    ExpiresAt REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (ExpiresAt)")
+            self._local.db = db
+        return db
+
+    def _remember(self, sid, version, blob, expires_at):
+        with self._lock:
+            self._cache[sid] = (version, blob, expires_at)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+
+    def load(self, sid, version):
+        """(data, version, expires_at) for a live session, or None."""
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(sid)
+        if cached is not None and cached[0] == version:
+            if self.path is not None:
+                current = self._db().execute("SELECT Version, ExpiresAt FROM sessions WHERE ID = ?", (sid,)).fetchone()
+                expires_at = current[1] if current is not None and current[0] == version else 0.0
+            else:
+                expires_at = cached[2]
+            if expires_at > now:
+                with self._lock:
+                    if sid in self._cache:
+                        self._cache.move_to_end(sid)
+                    self.stats['hits'] += 1
+                return decode_session(cached[1]), version, expires_at
+        self._count('misses')
+        if self.path is None:
+            return None
+        row = self._db().execute("SELECT Version, Data, ExpiresAt FROM sessions WHERE ID = ?", (sid,)).fetchone()
+        if row is None or row[2] <= now:
+            return None
+        self._remember(sid, row[0], row[1], row[2])
+        return decode_session(row[1]), row[0], row[2]
+
+    def save(self, sid, version, data):
+        blob = encode_session(data)
+        expires_at = time.time() + self.ttl
+        if self.path is not None:
+            self._db().execute(
+                "INSERT INTO sessions (ID, Version, Data, ExpiresAt) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(ID) DO UPDATE SET Version = excluded.Version, Data = excluded.Data, ExpiresAt = excluded.ExpiresAt",
+                (sid, version, blob, expires_at),
+            )
+        self._remember(sid, version, blob, expires_at)
+        self._count('saves')
+        self._sweep()
+
+    def touch(self, sid, version):
+        """Extends an unchanged session's expiry."""
+        expires_at = time.time() + self.ttl
+        if self.path is not None:
+            self._db().execute("UPDATE sessions SET ExpiresAt = ? WHERE ID = ?", (expires_at, sid))
+        with self._lock:
+            cached = self._cache.get(sid)
+            if cached is not None and cached[0] == version:
+                self._cache[sid] = (version, cached[1], expires_at)
+        self._count('touches')
+
+    def delete(self, sid):
+        if self.path is not None:
+            self._db().execute("DELETE FROM sessions WHERE ID = ?", (sid,))
+        with self._lock:
+            self._cache.pop(sid, None)
+        self._count('deletes')
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._swept_at < SESSION_SWEEP_INTERVAL:
+                return
+            self._swept_at = now
+            expired = [sid for sid, (_, _, expires_at) in self._cache.items() if expires_at <= time.time()]
+            for sid in expired:
+                del self._cache[sid]
+        swept = len(expired)
+        if self.path is not None:
+            swept = self._db().execute("DELETE FROM sessions WHERE ExpiresAt <= ?", (time.time(),)).rowcount
+        self._count('swept', swept)
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, version=None, expires_at=0.0):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.version = version
+        self.expires_at = expires_at
+        self.new = sid is None
+        self.user_id = self.get('user_id')  # a login or logout changes it, and gets a fresh session ID
+        self.modified = False
+        self.accessed = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+class ServerSessionInterface(SessionInterface):
+    """
+    Keeps session data in a SessionStore; the cookie only carries "<id>.<version>", signed
+    with the app's secret key so guessed or tampered IDs are rejected without a lookup.
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-session')
+
+    def open_session(self, app, request):
+        value = request.cookies.get(self.get_cookie_name(app))
+        if value:
+            try:
+                sid, version = self._signer(app).unsign(value).decode('ascii').rsplit('.', 1)
+                loaded = self.store.load(sid, version)
+                if loaded is not None:
+                    data, version, expires_at = loaded
+                    return ServerSession(data, sid, version, expires_at)
+            except (BadSignature, ValueError, EOFError, TypeError, KeyError):
+                pass  # forged cookie or unreadable blob (truncated, other Python's marshal): start afresh
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain, path = self.get_cookie_domain(app), self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app), httponly=self.get_cookie_httponly(app))
+            return
+        if not session.modified:
+            if not session.new and session.expires_at - time.time() < 0.9 * self.store.ttl:
+                self.store.touch(session.sid, session.version)
+            return
+
+        if session.new or session.get('user_id') != session.user_id:
+            if not session.new:
+                self.store.delete(session.sid)  # no session fixation across a login
+            session.sid = secrets.token_urlsafe(24)
+        session.version = new_session_version()  # random, so concurrent saves never share a version
+        self.store.save(session.sid, session.version, dict(session))
+        response.set_cookie(
+            name, self.cookie_value(app, session.sid, session.version),
+            expires=self.get_expiration_time(app, session), httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path, secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+        )
+
+    def cookie_value(self, app, sid, version):
+        return self._signer(app).sign(f"{sid}.{version}").decode('ascii')
+
+    def issue(self, app, data):
+        """Stores a new session and returns its cookie value (for scripts and benchmarks)."""
+        sid, version = secrets.token_urlsafe(24), new_session_version()
+        self.store.save(sid, version, dict(data))
+        return self.cookie_value(app, sid, version)
+
+session_json = TaggedJSONSerializer()
+if SESSION_BACKEND in ('sqlite', 'memory'):
+    app.session_interface = ServerSessionInterface(SessionStore(SESSION_DB if SESSION_BACKEND == 'sqlite' else None))
+
+@app.route('/sessions/stats')
+@role_required(['admin'])
+def session_stats():
+    store = getattr(app.session_interface, 'store', None)
+    if store is None:
+        return jsonify({'backend': 'cookie'})
+    with store._lock:
+        data = dict(store.stats)
+        data['cached'] = len(store._cache)
+    data['backend'] = SESSION_BACKEND
+    return jsonify(data)
+
+# --- Password Hashing & Login Throttling ---
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))             # work factor for new hashes; older ones are rehashed on login
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', max(1, (os.cpu_count() or 2) // 2)))  # processes for bcrypt, 0 = inline
+BCRYPT_MAX_PENDING = int(os.environ.get('BCRYPT_MAX_PENDING', 4 * max(1, BCRYPT_WORKERS)))  # queued + running hashes per worker
+BCRYPT_WAIT = float(os.environ.get('BCRYPT_WAIT', 5))                # seconds a login waits for a free bcrypt slot
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', 300))        # seconds an AppUser row is trusted without re-reading
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', 10000))     # usernames (found or not) cached per worker
+LOGIN_MAX_FAILURES = int(os.environ.get('LOGIN_MAX_FAILURES', 5))    # failed logins per username per window
+LOGIN_MAX_IP_FAILURES = int(os.environ.get('LOGIN_MAX_IP_FAILURES', 20))  # failed logins per client address per window
+LOGIN_WINDOW = float(os.environ.get('LOGIN_WINDOW', 300))            # seconds failed logins are remembered
+
+class AuthBusyError(Exception):
+    """Raised when no bcrypt slot frees up within BCRYPT_WAIT."""
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small process pool, so login storms use at most BCRYPT_WORKERS
+    cores and never hold the GIL of the request threads. At most BCRYPT_MAX_PENDING
+    hashes are queued; beyond that callers wait up to BCRYPT_WAIT and then get AuthBusyError.
+    """
+    def __init__(self, workers=BCRYPT_WORKERS, max_pending=BCRYPT_MAX_PENDING):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():  # a pool does not survive a fork
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(timeout=BCRYPT_WAIT):
+            raise AuthBusyError("too many logins in progress")
+        try:
+            return self._executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password, rounds=BCRYPT_ROUNDS):
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+    def verify(self, password, hashed):
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+def hash_rounds(hashed):
+    """The work factor of a bcrypt hash ($2b$12$...), or None if it is not one."""
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+password_hasher = PasswordHasher()
+
+class AppUserCache:
+    """
+    AppUser rows by username (misses included), so a login costs no query. Entries live
+    for AUTH_CACHE_TTL, and only the AUTH_CACHE_SIZE most recently used are kept, so
+    logins with made-up usernames cannot grow it without bound; register_post and
+    password rehashes bump the AppUser stamp, which clears every worker's cache.
+    """
+    def __init__(self, ttl=AUTH_CACHE_TTL, capacity=AUTH_CACHE_SIZE):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.stamp = data_version('AppUser')
+        self._lock = threading.Lock()
+        self._users = collections.OrderedDict()  # username -> (row or None, loaded_at)
+        self._version = None
+
+    def get(self, username):
+        """(UserID, Username, Role, PasswordHash) or None. Raises mysql.connector.Error."""
+        version = self.stamp.current()
+        now = time.monotonic()
+        with self._lock:
+            if version != self._version:
+                self._users, self._version = collections.OrderedDict(), version
+            cached = self._users.get(username)
+            if cached is not None and now - cached[1] < self.ttl:
+                self._users.move_to_end(username)
+                return cached[0]
+        con = get_pool('admin').acquire()  # AppUser is only granted to the admin account
+        try:
+            cur = con.cursor()
+            cur.execute("SELECT UserID, Username, Role, PasswordHash FROM AppUser WHERE Username = %s", (username,))
+            row = cur.fetchone()
         finally:
             con.close()
-    return {}
+        with self._lock:
+            if version == self._version:
+                self._users[username] = (row, now)
+                self._users.move_to_end(username)
+                while len(self._users) > self.capacity:
+                    self._users.popitem(last=False)
+        return row
+
+    def invalidate(self):
+        self.stamp.bump()
+
+app_users = AppUserCache()
+
+class LoginThrottle:
+    """Sliding-window counts of failed logins per username and per client address."""
+    def __init__(self, window=LOGIN_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._failures = {}  # key -> deque of monotonic times
+
+    def _recent(self, key, now):
+        times = self._failures.get(key)
+        while times and now - times[0] > self.window:
+            times.popleft()
+        return times
 
-package_map = load_packages()
+    def retry_after(self, username, address):
+        """Seconds until another attempt is allowed, or 0."""
+        now = time.monotonic()
+        with self._lock:
+            wait = 0.0
+            for key, limit in ((('user', username), LOGIN_MAX_FAILURES), (('ip', address), LOGIN_MAX_IP_FAILURES)):
+                times = self._recent(key, now)
+                if times and len(times) >= limit:
+                    wait = max(wait, self.window - (now - times[-limit]))
+            return wait
 
-def update_package_menu():
-    """Refreshes the package map."""
-    global package_map
-    package_map = load_packages()
+    def failed(self, username, address):
+        now = time.monotonic()
+        with self._lock:
+            for key in (('user', username), ('ip', address)):
+                self._failures.setdefault(key, collections.deque(maxlen=max(LOGIN_MAX_FAILURES, LOGIN_MAX_IP_FAILURES))).append(now)
+            if len(self._failures) > 10000:
+                for key in [key for key in self._failures if not self._recent(key, now)]:
+                    del self._failures[key]
+
+    def succeeded(self, username):
+        with self._lock:
+            self._failures.pop(('user', username), None)
+
+login_throttle = LoginThrottle()
+
+def rehash_password(user_id, password):
+    """Re-hashes a password at BCRYPT_ROUNDS after a successful login with an older work factor."""
+    try:
+        hashed = password_hasher.hash(password)
+        con = get_pool('admin').acquire()
+        try:
+            cur = con.cursor()
+            cur.execute("UPDATE AppUser SET PasswordHash = %s WHERE UserID = %s", (hashed, user_id))
+            con.commit()
+        finally:
+            con.close()
+        app_users.invalidate()
+    except Exception:
+        app.logger.exception("Password rehash failed for user %s", user_id)
 
 # --- Authentication Routes ---
 
@@ -153,31 +1524,42 @@ def login_post():
         flash("Invalid username or password.", "error")
         return redirect(url_for('login'))
 
-    con = connect_db(role)
-    if con:
-        cur = con.cursor()
-        try:
-            cur.execute("SELECT UserID, Username, Role, PasswordHash FROM AppUser WHERE Username = %s", (username,))
-            user = cur.fetchone()
-            if user and bcrypt.checkpw(password.encode('utf-8'), user[3].encode('utf-8')):
-                session['user_id'] = user[0]
-                session['username'] = user[1]
-                session['role'] = user[2]
-                flash(f"Welcome back, {username}!", "success")
-                return redirect(url_for('index'))
-            else:
-                flash("Invalid username or password.", "error")
-        except mysql.connector.Error as err:
-            flash(f"Login error: {err}", "error")
-        finally:
-            con.close()
-    return redirect(url_for('login'))
+    address = request.remote_addr or '-'
+    wait = login_throttle.retry_after(username, address)
+    if wait:
+        flash(f"Too many failed login attempts. Try again in {int(wait) + 1} seconds.", "error")
+        return redirect(url_for('login'))
+
+    try:
+        user = app_users.get(username)
+        valid = bool(user) and password_hasher.verify(password, user[3])
+    except (mysql.connector.Error, PoolExhaustedError) as err:
+        flash(f"Login error: {err}", "error")
+        return redirect(url_for('login'))
+    except AuthBusyError:
+        flash("Login is busy right now. Please try again in a moment.", "error")
+        return redirect(url_for('login'))
+
+    if not valid:
+        login_throttle.failed(username, address)
+        flash("Invalid username or password.", "error")
+        return redirect(url_for('login'))
+
+    login_throttle.succeeded(username)
+    if hash_rounds(user[3]) != BCRYPT_ROUNDS:
+        threading.Thread(target=rehash_password, args=(user[0], password), daemon=True).start()
+    session['user_id'] = user[0]
+    session['username'] = user[1]
+    session['role'] = user[2]
+    flash(f"Welcome back, {username}!", "success")
+    return redirect(url_for('index'))
 
 @app.route('/register')
 def register():
     return render_template('register.html')
 
 @app.route('/register', methods=['POST'])
+@idempotent
 def register_post():
     username = request.form.get('username')
     password = request.form.get('password')
@@ -187,7 +1569,11 @@ def register_post():
         flash("All fields are required.", "error")
         return redirect(url_for('register'))
 
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    try:
+        hashed_password = password_hasher.hash(password)
+    except AuthBusyError:
+        flash("Registration is busy right now. Please try again in a moment.", "error")
+        return redirect(url_for('register'))
 
     con = connect_db()
     if con:
@@ -201,6 +1587,7 @@ def register_post():
 
             cur.execute("INSERT INTO AppUser (Username, PasswordHash, Role) VALUES (%s, %s, %s)", (username, hashed_password, role))
             con.commit()
+            app_users.invalidate()
             flash("Registration successful! Please login.", "success")
             return redirect(url_for('login'))
         except mysql.connector.Error as err:
@@ -220,74 +1607,77 @@ def logout():
 @app.route('/')
 def index():
     role = session.get('role', 'admin')
-    total_customers, total_bookings, total_payments = refresh_dashboard(role)
+    total_customers, total_bookings, total_payments = dashboard_stats.get(role)
     return render_template('index.html', total_customers=total_customers, total_bookings=total_bookings, total_payments=total_payments)
 
 # --- Protected Routes ---
 @app.route('/customers')
 @role_required(['admin', 'agent', 'accountant'])
+@cached_page('Customer', 'TravelDependent')
 def customers():
     role = session.get('role')
     con = connect_db(role)
     customer_list = []
     customers = []
     dependents = []
-    next_customer_id = 1
+    pager = None
     if con:
         cur = con.cursor()
         try:
-            cur.execute("SELECT CustomerID, Cname FROM Customer;")
-            customer_list = cur.fetchall()
-            cur.execute("""
-                SELECT c1.CustomerID, c1.Cname, c1.Email, c1.State, c1.City, c1.Country, c1.Refers
-                FROM Customer c1;
-            """)
-            customers = cur.fetchall()
-            cur.execute("SELECT DependentID, DependentName, Age, Relation, CustomerID FROM TravelDependent;")
-            dependents = cur.fetchall()
-            cur.execute("SELECT MAX(CustomerID) FROM Customer;")
-            max_id = cur.fetchone()[0]
-            next_customer_id = (max_id or 0) + 1
+            customers, pager = fetch_page(cur, CUSTOMER_SELECT, 'CustomerID')
+            if wants_json():
+                return page_json(cur, customers, pager)
+            customer_list = [(c[0], c[1]) for c in customers]
+            if customers:
+                # Only the dependents of the customers on this page.
+                placeholders = ", ".join(["%s"] * len(customers))
+                cur.execute(f"{DEPENDENT_SELECT} WHERE CustomerID IN ({placeholders}) ORDER BY DependentID", [c[0] for c in customers])
+                dependents = cur.fetchall()
         except Exception as e:
             flash(f"Error loading customers: {e}", "error")
         finally:
             con.close()
-    return render_template('customers.html', customer_list=customer_list, customers=customers, dependents=dependents, next_customer_id=next_customer_id)
+    return render_template('customers.html', customer_list=customer_list, customers=customers, dependents=dependents, pager=pager)
 
 @app.route('/customers/view')
 @role_required(['admin', 'agent', 'accountant'])
+@cached_page('Customer')
 def view_customers():
     con = connect_db()
     if con:
         cur = con.cursor()
-        cur.execute("""
-            SELECT c1.CustomerID, c1.Cname, c1.Email, c1.State, c1.City, c1.Country, c1.Refers
-            FROM Customer c1;
-        """)
-        rows = cur.fetchall()
+        rows, pager = fetch_page(cur, CUSTOMER_SELECT, 'CustomerID')
+        if wants_json():
+            response = page_json(cur, rows, pager)
+            con.close()
+            return response
         con.close()
-        return render_template('customers.html', customers=rows)
+        return render_template('customers.html', customers=rows, pager=pager)
     return render_template('customers.html', customers=[])
 
 @app.route('/customers/add', methods=['POST'])
 @role_required(['admin', 'agent'])
+@idempotent
 def add_customer():
-    c_id = request.form.get('customer_id')
     refers = request.form.get('refers')
-    if not validate_int_input(c_id, "Customer ID") or not refers or not validate_int_input(refers, "Refers"): return redirect(url_for('customers'))
+    if not refers or not validate_int_input(refers, "Refers"): return redirect(url_for('customers'))
 
     con = connect_db()
     if con:
         cur = con.cursor()
         try:
             cur.execute(
-                "INSERT INTO Customer (CustomerID, Cname, Email, State, City, Country, Refers) VALUES (%s,%s,%s,%s,%s,%s,%s)",
-                (int(c_id), request.form.get('name'), request.form.get('email'),
+                "INSERT INTO Customer (Cname, Email, State, City, Country, Refers) VALUES (%s,%s,%s,%s,%s,%s)",
+                (request.form.get('name'), request.form.get('email'),
                  request.form.get('state'), request.form.get('city'),
                  request.form.get('country'), int(refers))
             )
             con.commit()
-            flash("Customer added successfully!", "success")
+            seen = data_version('Customer').current()
+            bump_versions('Customer')
+            referral_graph.changed(con, cur.lastrowid, seen, added=True)
+            dashboard_stats.adjust(customers=1)
+            flash(f"Customer {cur.lastrowid} added successfully!", "success")
         except mysql.connector.Error as err:
             flash(f"Database error: {err}", "error")
         finally:
@@ -296,6 +1686,7 @@ def add_customer():
 
 @app.route('/customers/update', methods=['GET', 'POST'])
 @role_required(['admin', 'agent'])
+@idempotent
 def update_customer():
     if request.method == 'GET':
         return redirect(url_for('customers'))
@@ -316,6 +1707,10 @@ def update_customer():
             )
             if cur.rowcount > 0:
                 con.commit()
+                seen = data_version('Customer').current()
+                bump_versions('Customer')
+                referral_graph.changed(con, int(c_id), seen)
+                customer_metrics.invalidate(c_id)
                 flash(f"Customer {c_id} updated successfully!", "success")
             else:
                 flash(f"Customer ID {c_id} not found.", "warning")
@@ -327,6 +1722,7 @@ def update_customer():
 
 @app.route('/customers/delete', methods=['POST'])
 @role_required(['admin', 'agent'])
+@idempotent
 def delete_customer():
     c_id = request.form.get('customer_id')
     if not validate_int_input(c_id, "Customer ID"): return redirect(url_for('customers'))
@@ -335,9 +1731,22 @@ def delete_customer():
     if con:
         cur = con.cursor()
         try:
+            # Bookings and payments cascade with the customer; count them for the dashboard.
+            cur.execute("SELECT COUNT(*) FROM Booking WHERE CustomerID=%s", (c_id,))
+            booking_count = cur.fetchone()[0]
+            cur.execute("""
+                SELECT COUNT(*) FROM Payment p
+                JOIN Booking b ON p.BookingID = b.BookingID
+                WHERE b.CustomerID=%s
+            """, (c_id,))
+            payment_count = cur.fetchone()[0]
             cur.execute("DELETE FROM Customer WHERE CustomerID=%s", (c_id,))
             if cur.rowcount > 0:
                 con.commit()
+                bump_versions('Customer', 'TravelDependent', 'Booking', 'Payment', 'Itinerary')  # cascades
+                referral_graph.invalidate()
+                customer_metrics.invalidate(c_id)
+                dashboard_stats.adjust(customers=-1, bookings=-booking_count, payments=-payment_count)
                 flash(f"Customer {c_id} deleted successfully!", "success")
             else:
                 flash(f"Customer ID {c_id} not found.", "warning")
@@ -349,6 +1758,7 @@ def delete_customer():
 
 @app.route('/customers/add_dependent', methods=['POST'])
 @role_required(['admin', 'agent'])
+@idempotent
 def add_dependent():
     d_name = request.form.get('dependent_name')
     age = request.form.get('age')
@@ -373,6 +1783,8 @@ def add_dependent():
                 (d_name, int(age), relation, c_id)
             )
             con.commit()
+            bump_versions('TravelDependent')
+            customer_metrics.invalidate(c_id)
             flash(f"Travel Dependent '{d_name}' added successfully!", "success")
         except mysql.connector.Error as err:
             flash(f"Database error (Check Customer ID):\n{err}", "error")
@@ -382,6 +1794,7 @@ def add_dependent():
 
 @app.route('/customers/delete_dependent', methods=['POST'])
 @role_required(['admin', 'agent'])
+@idempotent
 def delete_dependent():
     d_id = request.form.get('dependent_id')
     if not validate_int_input(d_id, "Dependent ID"): return redirect(url_for('customers'))
@@ -393,6 +1806,8 @@ def delete_dependent():
             cur.execute("DELETE FROM TravelDependent WHERE DependentID=%s", (d_id,))
             if cur.rowcount > 0:
                 con.commit()
+                bump_versions('TravelDependent')
+                customer_metrics.invalidate()
                 flash(f"Travel Dependent {d_id} deleted successfully!", "success")
             else:
                 flash(f"Dependent ID {d_id} not found.", "warning")
@@ -404,6 +1819,7 @@ def delete_dependent():
 
 @app.route('/customers/update_dependent', methods=['GET', 'POST'])
 @role_required(['admin', 'agent'])
+@idempotent
 def update_dependent():
     if request.method == 'GET':
         return redirect(url_for('customers'))
@@ -433,6 +1849,8 @@ def update_dependent():
             )
             if cur.rowcount > 0:
                 con.commit()
+                bump_versions('TravelDependent')
+                customer_metrics.invalidate()
                 flash(f"Travel Dependent {d_id} updated successfully!", "success")
             else:
                 flash(f"Dependent ID {d_id} not found.", "warning")
@@ -442,77 +1860,657 @@ def update_dependent():
             con.close()
     return redirect(url_for('customers'))
 
+# --- Customer Metrics ---
+METRICS_TTL = float(os.environ.get('METRICS_TTL', 60))            # seconds a customer's metrics stay cached (0 disables)
+METRICS_MAX_IDS = int(os.environ.get('METRICS_MAX_IDS', 1000))    # customer IDs per grouped query / request
+METRICS_CACHE_SIZE = int(os.environ.get('METRICS_CACHE_SIZE', 100000))
+
+def customer_metrics_sql(count):
+    """One grouped query for `count` customer IDs; parameters are the IDs repeated three times."""
+    ids = ", ".join(["%s"] * count)
+    return f"""
+        SELECT c.CustomerID, c.Cname,
+               COALESCE(b.Bookings, 0), COALESCE(b.TotalSpent, 0), COALESCE(d.Dependents, 0)
+        FROM Customer c
+        LEFT JOIN (
+            SELECT bk.CustomerID, COUNT(DISTINCT bk.BookingID) AS Bookings, SUM(p.Amount) AS TotalSpent
+            FROM Booking bk
+            LEFT JOIN Payment p ON p.BookingID = bk.BookingID
+            WHERE bk.CustomerID IN ({ids})
+            GROUP BY bk.CustomerID
+        ) b ON b.CustomerID = c.CustomerID
+        LEFT JOIN (
+            SELECT CustomerID, COUNT(*) AS Dependents
+            FROM TravelDependent
+            WHERE CustomerID IN ({ids})
+            GROUP BY CustomerID
+        ) d ON d.CustomerID = c.CustomerID
+        WHERE c.CustomerID IN ({ids})
+    """
+
+class CustomerMetrics:
+    """
+    Lifetime spend, booking count and dependent count for any set of customers,
+    computed in one grouped query per METRICS_MAX_IDS customers instead of calling
+    TotalAmountSpent / fn_count_dependents once per customer. Results are cached per customer.
+    """
+    def __init__(self, ttl=METRICS_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache = {}  # CustomerID -> (expires_at, metrics)
+
+    def get_many(self, con, customer_ids):
+        """Returns {CustomerID: metrics} for the IDs that exist."""
+        now = time.monotonic()
+        result = {}
+        missing = []
+        with self._lock:
+            for customer_id in customer_ids:
+                hit = self._cache.get(customer_id)
+                if hit and hit[0] > now:
+                    result[customer_id] = hit[1]
+                else:
+                    missing.append(customer_id)
+
+        cur = con.cursor()
+        for i in range(0, len(missing), METRICS_MAX_IDS):
+            chunk = missing[i:i + METRICS_MAX_IDS]
+            cur.execute(customer_metrics_sql(len(chunk)), chunk * 3)
+            for customer_id, name, bookings, spent, dependents in cur.fetchall():
+                result[customer_id] = {
+                    'CustomerID': customer_id, 'Cname': name,
+                    'Bookings': bookings, 'TotalSpent': spent, 'Dependents': dependents,
+                }
+
+        if self.ttl > 0 and missing:
+            expires_at = time.monotonic() + self.ttl
+            with self._lock:
+                if len(self._cache) > METRICS_CACHE_SIZE:
+                    self._cache.clear()
+                for customer_id in missing:
+                    if customer_id in result:
+                        self._cache[customer_id] = (expires_at, result[customer_id])
+        return result
+
+    def invalidate(self, customer_id=None):
+        """Drops one customer's cached metrics, or all of them when the customer is unknown."""
+        with self._lock:
+            if customer_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(int(customer_id), None)
+
+customer_metrics = CustomerMetrics()
+
+def parse_id_list(raw):
+    """Parses '1, 2, 3' (or a list) into unique positive ints. Returns None if any entry is invalid."""
+    values = raw if isinstance(raw, list) else str(raw or '').split(',')
+    values = [str(v).strip() for v in values if str(v).strip()]
+    if not values or not all(is_positive_int(v) for v in values):
+        return None
+    return list(dict.fromkeys(int(v) for v in values))
+
+@app.route('/customers/metrics', methods=['GET', 'POST'])
+@role_required(['admin', 'agent', 'accountant'])
+def bulk_customer_metrics():
+    raw = (request.get_json(silent=True) or {}).get('ids') if request.method == 'POST' else request.args.get('ids')
+    ids = parse_id_list(raw)
+    if ids is None:
+        return jsonify({'error': "'ids' must be a list of positive integers."}), 400
+    if len(ids) > METRICS_MAX_IDS:
+        return jsonify({'error': f"At most {METRICS_MAX_IDS} customer IDs per request."}), 400
+
+    con = connect_db()
+    if not con:
+        return jsonify({'error': 'Database unavailable.'}), 503
+    try:
+        metrics = customer_metrics.get_many(con, ids)
+    except mysql.connector.Error as err:
+        return jsonify({'error': str(err)}), 500
+    finally:
+        con.close()
+    return jsonify({
+        'customers': [metrics[i] for i in ids if i in metrics],
+        'not_found': [i for i in ids if i not in metrics],
+    })
+
+# --- Customer History ---
+HISTORY_CUSTOMER_SQL = "SELECT CustomerID, Cname, Email, State, City, Country, Refers FROM Customer WHERE CustomerID = %s"
+# Same join as the get_bookings_by_customer procedure, served by idx_booking_customer_date.
+HISTORY_BOOKINGS_SQL = """
+    SELECT b.BookingID, b.BookingDate, b.Status, tp.PackageID, tp.PackageName, tp.PackagePrice
+    FROM Booking b
+    JOIN TourPackage tp ON b.PackageID = tp.PackageID
+    WHERE b.CustomerID = %s
+    ORDER BY b.BookingDate DESC, b.BookingID DESC
+"""
+HISTORY_PAYMENTS_SQL = """
+    SELECT p.PaymentID, p.BookingID, p.Amount, p.PaymentDate, p.PaymentMethod
+    FROM Booking b
+    JOIN Payment p ON p.BookingID = b.BookingID
+    WHERE b.CustomerID = %s
+    ORDER BY p.PaymentDate, p.PaymentID
+"""
+HISTORY_DEPENDENTS_SQL = "SELECT DependentName, Age, Relation FROM TravelDependent WHERE CustomerID = %s"
+
+def load_customer_history(con, customer_id):
+    """Loads a customer with their bookings (each with its payments) and dependents, or None."""
+    def rows(sql):
+        cur = con.prepared(sql)
+        cur.execute(sql, (customer_id,))
+        return [dict(zip(cur.column_names, row)) for row in cur.fetchall()]
+
+    customer = rows(HISTORY_CUSTOMER_SQL)
+    if not customer:
+        return None
+    history = customer[0]
+    bookings = rows(HISTORY_BOOKINGS_SQL)
+    by_booking = {b['BookingID']: b for b in bookings}
+    for b in bookings:
+        b['Payments'] = []
+    for payment in rows(HISTORY_PAYMENTS_SQL):
+        by_booking[payment['BookingID']]['Payments'].append(payment)
+    history['Bookings'] = bookings
+    history['Dependents'] = rows(HISTORY_DEPENDENTS_SQL)
+    history['TotalPaid'] = sum(p['Amount'] for b in bookings for p in b['Payments'])
+    return history
+
+@app.route('/customers/<int:customer_id>/history')
+@role_required(['admin', 'agent', 'accountant'])
+def customer_history(customer_id):
+    con = connect_db()
+    if not con:
+        return redirect(url_for('customers'))
+    try:
+        history = load_customer_history(con, customer_id)
+    except mysql.connector.Error as err:
+        flash(f"Error loading customer history: {err}", "error")
+        return redirect(url_for('customers'))
+    finally:
+        con.close()
+
+    if history is None:
+        if wants_json():
+            return jsonify({'error': f"Customer {customer_id} not found."}), 404
+        flash(f"Customer ID {customer_id} not found.", "warning")
+        return redirect(url_for('customers'))
+    if wants_json():
+        return jsonify(history)
+    return render_template('customer_history.html', history=history)
+
+# --- Referral Graph ---
+REFERRAL_REVENUE_TTL = float(os.environ.get('REFERRAL_REVENUE_TTL', 60))  # seconds downline revenue may lag new payments
+REFERRAL_TOP_MAX = int(os.environ.get('REFERRAL_TOP_MAX', 500))           # cap on ?limit= for top referrers
+REFERRAL_METRICS = ('downline_revenue', 'downline', 'height', 'direct')
+CUSTOMER_REVENUE_SQL = """
+    SELECT b.CustomerID, SUM(p.Amount)
+    FROM Booking b
+    JOIN Payment p ON p.BookingID = b.BookingID
+    GROUP BY b.CustomerID
+"""
+
+class ReferralTree:
+    """
+    The Customer.Refers forest as index arrays: parent, first child / next / previous
+    sibling links, and per customer depth (referrers above), height (levels of downline
+    below), downline size and downline revenue. build() computes everything level by
+    level with vectorised bincounts; add() and move() patch only the affected paths.
+    A Refers cycle is cut at one of its customers, which then counts as a root.
+    """
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.cuts = 0
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.first_child = np.full(capacity, -1, dtype=np.int32)
+        self.next_sibling = np.full(capacity, -1, dtype=np.int32)
+        self.prev_sibling = np.full(capacity, -1, dtype=np.int32)
+        self.direct = np.zeros(capacity, dtype=np.int32)
+        self.depth = np.zeros(capacity, dtype=np.int32)
+        self.height = np.zeros(capacity, dtype=np.int32)
+        self.downline = np.zeros(capacity, dtype=np.int64)
+        self.revenue = np.zeros(capacity)
+        self.downline_revenue = np.zeros(capacity)
+
+    def _grow(self):
+        for name in ('ids', 'parent', 'first_child', 'next_sibling', 'prev_sibling', 'direct',
+                     'depth', 'height', 'downline', 'revenue', 'downline_revenue'):
+            column = getattr(self, name)
+            fill = -1 if name in ('parent', 'first_child', 'next_sibling', 'prev_sibling') else 0
+            setattr(self, name, np.concatenate([column, np.full_like(column, fill)]))
+
+    def build(self, ids, refers, revenue):
+        """ids sorted ascending; refers holds the referrer's CustomerID (0 for none)."""
+        n = len(ids)
+        self._alloc(max(1024, 2 * n))
+        self.size = n
+        self.ids[:n] = ids
+        self.revenue[:n] = revenue
+        parent = lookup_positions(self.ids[:n], refers).astype(np.int32) if n else np.zeros(0, dtype=np.int32)
+
+        # Walk down from the roots a level at a time; whatever is never reached hangs off a cycle.
+        levels = []
+        visited = np.zeros(n, dtype=bool)
+        frontier = np.flatnonzero(parent < 0)
+        children, starts = self._csr(parent)
+        while True:
+            while len(frontier):
+                visited[frontier] = True
+                levels.append(frontier)
+                frontier = self._children_of(frontier, children, starts)
+                frontier = frontier[~visited[frontier]]
+            left = np.flatnonzero(~visited)
+            if not len(left):
+                break
+            node, seen = int(left[0]), set()
+            while node not in seen:
+                seen.add(node)
+                node = int(parent[node])
+            parent[node] = -1  # cut the cycle here
+            self.cuts += 1
+            frontier = np.array([node])
+            children, starts = self._csr(parent)
+
+        self.parent[:n] = parent
+        for level in levels:
+            linked = level[parent[level] >= 0]  # roots, cut cycle members included, stay at depth 0
+            self.depth[linked] = self.depth[parent[linked]] + 1
+        for level in reversed(levels):
+            linked = level[parent[level] >= 0]
+            up = parent[linked]
+            self.downline[:n] += np.bincount(up, weights=self.downline[linked] + 1, minlength=n).astype(np.int64)
+            self.downline_revenue[:n] += np.bincount(up, weights=self.downline_revenue[linked] + self.revenue[linked], minlength=n)
+            np.maximum.at(self.height, up, self.height[linked] + 1)
+
+        # Sibling links from the final parent array.
+        children, starts = self._csr(parent)
+        if len(children):
+            same = parent[children[1:]] == parent[children[:-1]]
+            self.next_sibling[children[:-1][same]] = children[1:][same]
+            self.prev_sibling[children[1:][same]] = children[:-1][same]
+            heads = children[np.concatenate([[True], ~same])]
+            self.first_child[parent[heads]] = heads
+            self.direct[:n] = np.bincount(parent[children], minlength=n)
+
+    @staticmethod
+    def _csr(parent):
+        linked = np.flatnonzero(parent >= 0)
+        children = linked[np.argsort(parent[linked], kind='stable')]
+        starts = np.searchsorted(parent[children], np.arange(len(parent) + 1))
+        return children, starts
+
+    @staticmethod
+    def _children_of(nodes, children, starts):
+        lo, hi = starts[nodes], starts[nodes + 1]
+        counts = hi - lo
+        if not counts.sum():
+            return np.zeros(0, dtype=np.int64)
+        offsets = np.repeat(lo - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+        return children[np.arange(counts.sum()) + offsets]
+
+    def position(self, customer_id):
+        pos = int(np.searchsorted(self.ids[:self.size], customer_id))
+        return pos if pos < self.size and self.ids[pos] == customer_id else -1
+
+    def _ancestors(self, node):
+        while node >= 0:
+            yield node
+            node = int(self.parent[node])
+
+    def _link(self, node, parent):
+        self.parent[node] = parent
+        if parent < 0:
+            return
+        head = int(self.first_child[parent])
+        self.next_sibling[node], self.prev_sibling[node] = head, -1
+        if head >= 0:
+            self.prev_sibling[head] = node
+        self.first_child[parent] = node
+        self.direct[parent] += 1
+
+    def _unlink(self, node):
+        parent = int(self.parent[node])
+        if parent < 0:
+            return
+        prev, nxt = int(self.prev_sibling[node]), int(self.next_sibling[node])
+        if prev >= 0:
+            self.next_sibling[prev] = nxt
+        else:
+            self.first_child[parent] = nxt
+        if nxt >= 0:
+            self.prev_sibling[nxt] = prev
+        self.next_sibling[node] = self.prev_sibling[node] = -1
+        self.direct[parent] -= 1
+        self.parent[node] = -1
+
+    def add(self, customer_id, refers):
+        """Appends a new customer as a leaf. False if the tree cannot take it and needs a rebuild."""
+        if self.size and customer_id <= self.ids[self.size - 1]:
+            return False  # IDs must stay sorted; a gap means another worker's insert is missing too
+        parent = self.position(refers) if refers else -1
+        if refers and parent < 0:
+            return False
+        if self.size == len(self.ids):
+            self._grow()
+        node = self.size
+        self.size += 1
+        self.ids[node] = customer_id
+        self._link(node, parent)
+        self.depth[node] = self.depth[parent] + 1 if parent >= 0 else 0
+        for steps, ancestor in enumerate(self._ancestors(parent), 1):
+            self.downline[ancestor] += 1
+            self.height[ancestor] = max(self.height[ancestor], steps)
+        return True
+
+    def move(self, customer_id, refers):
+        """Re-parents a customer and its downline. False if that needs a rebuild (unknown IDs, a new cycle)."""
+        node = self.position(customer_id)
+        parent = self.position(refers) if refers else -1
+        if node < 0 or (refers and parent < 0):
+            return False
+        if parent == self.parent[node]:
+            return True
+        if node in self._ancestors(parent):
+            return False
+        size, revenue = self.downline[node] + 1, self.downline_revenue[node] + self.revenue[node]
+        old = int(self.parent[node])
+        for ancestor in self._ancestors(old):
+            self.downline[ancestor] -= size
+            self.downline_revenue[ancestor] -= revenue
+        self._unlink(node)
+        for ancestor in self._ancestors(old):
+            height = max((self.height[child] + 1 for child in self._children(ancestor)), default=0)
+            if height == self.height[ancestor]:
+                break
+            self.height[ancestor] = height
+
+        self._link(node, parent)
+        for steps, ancestor in enumerate(self._ancestors(parent), 1):
+            self.downline[ancestor] += size
+            self.downline_revenue[ancestor] += revenue
+            self.height[ancestor] = max(self.height[ancestor], self.height[node] + steps)
+        shift = (self.depth[parent] + 1 if parent >= 0 else 0) - self.depth[node]
+        if shift:
+            self.depth[self._subtree(node)] += shift
+        return True
+
+    def _children(self, node):
+        child = int(self.first_child[node])
+        while child >= 0:
+            yield child
+            child = int(self.next_sibling[child])
+
+    def _subtree(self, node):
+        nodes, stack = [], [node]
+        while stack:
+            current = stack.pop()
+            nodes.append(current)
+            stack.extend(self._children(current))
+        return np.array(nodes, dtype=np.int64)
+
+    def record(self, node):
+        parent = int(self.parent[node])
+        return {
+            'CustomerID': int(self.ids[node]),
+            'ReferredBy': int(self.ids[parent]) if parent >= 0 else None,
+            'Depth': int(self.depth[node]),
+            'DirectReferrals': int(self.direct[node]),
+            'Downline': int(self.downline[node]),
+            'DownlineDepth': int(self.height[node]),
+            'Revenue': round(float(self.revenue[node]), 2),
+            'DownlineRevenue': round(float(self.downline_revenue[node]), 2),
+        }
+
+    def top(self, metric, limit):
+        """The `limit` customers with the largest metric, ties broken by CustomerID."""
+        n = self.size
+        if not n:
+            return []
+        key = -{'downline_revenue': self.downline_revenue, 'downline': self.downline,
+                'height': self.height, 'direct': self.direct}[metric][:n].astype(np.float64)
+        limit = min(limit, n)
+        cutoff = np.partition(key, limit - 1)[limit - 1]
+        candidates = np.flatnonzero(key <= cutoff)
+        order = candidates[np.lexsort((self.ids[candidates], key[candidates]))][:limit]
+        return [self.record(int(node)) for node in order]
+
+class ReferralGraph:
+    """
+    The shared ReferralTree. Rebuilt when another worker bumps the Customer stamp, and
+    when payments or bookings changed and the downline revenue is older than
+    REFERRAL_REVENUE_TTL. add_customer / update_customer patch it through changed();
+    delete_customer drops it.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tree = None
+        self._versions = None
+        self._built_at = 0.0
+
+    def ensure(self, con):
+        """The current tree and when it was built, rebuilt first if stale. Use the returned tree:
+        self.tree can be dropped by changed() as soon as the lock is released."""
+        versions = {name: data_version(name).current() for name in ('Customer', 'Booking', 'Payment')}
+        with self._lock:
+            tree = self.tree
+            if tree is not None:
+                if versions['Customer'] == self._versions['Customer'] and (
+                        versions == self._versions or time.monotonic() - self._built_at < REFERRAL_REVENUE_TTL):
+                    return tree, self._built_at
+        tree = self._load(con.cursor())
+        built_at = time.monotonic()
+        with self._lock:
+            self.tree, self._versions, self._built_at = tree, versions, built_at
+        return tree, built_at
+
+    def _load(self, cur):
+        cur.execute("SELECT CustomerID, COALESCE(Refers, 0) FROM Customer ORDER BY CustomerID")
+        rows = np.array(cur.fetchall(), dtype=np.int64).reshape(-1, 2)
+        cur.execute(CUSTOMER_REVENUE_SQL)
+        spent = cur.fetchall()
+        revenue = np.zeros(len(rows))
+        if spent:
+            keys = np.array([customer for customer, _ in spent], dtype=np.int64)
+            positions = lookup_positions(rows[:, 0], keys)
+            found = positions >= 0
+            revenue[positions[found]] = np.array([float(total or 0) for _, total in spent])[found]
+        tree = ReferralTree()
+        tree.build(rows[:, 0], rows[:, 1], revenue)
+        return tree
+
+    def top(self, con, metric, limit):
+        tree, built_at = self.ensure(con)
+        with self._lock:  # changed() patches trees in place
+            return tree.top(metric, limit), built_at
+
+    def customer(self, con, customer_id):
+        tree, _ = self.ensure(con)
+        with self._lock:
+            node = tree.position(customer_id)
+            return tree.record(node) if node >= 0 else None
+
+    def changed(self, con, customer_id, seen, added=False):
+        """
+        Patches the tree after add_customer / update_customer. Call after the write is
+        committed and the Customer stamp bumped; `seen` is the stamp read just before that
+        bump. If the tree was not built at `seen`, it has missed another Customer write
+        (a delete, or another worker's edit) and is dropped instead of patched.
+        """
+        with self._lock:
+            if self.tree is not None and self._versions['Customer'] != seen:
+                self.tree = None
+            if self.tree is None:
+                return
+        try:
+            cur = con.cursor()
+            cur.execute("SELECT COALESCE(Refers, 0) FROM Customer WHERE CustomerID = %s", (customer_id,))
+            row = cur.fetchone()
+        except mysql.connector.Error:
+            row = None
+        with self._lock:
+            if self.tree is None:
+                return
+            if row is None or self._versions['Customer'] != seen:
+                self.tree = None
+                return
+            patched = self.tree.add(int(customer_id), row[0]) if added else self.tree.move(int(customer_id), row[0])
+            if not patched:
+                self.tree = None  # rebuilt on the next read
+                return
+            self._versions['Customer'] = data_version('Customer').current()
+
+    def invalidate(self):
+        """Drops the tree after a Customer write changed() cannot patch; rebuilt on the next read."""
+        with self._lock:
+            self.tree = None
+
+referral_graph = ReferralGraph()
+
+@app.route('/customers/referrals/top')
+@role_required(['admin', 'agent', 'accountant'])
+def top_referrers():
+    metric = request.args.get('by', 'downline_revenue')
+    if metric not in REFERRAL_METRICS:
+        return jsonify({'error': f"by must be one of: {', '.join(REFERRAL_METRICS)}"}), 400
+    limit = request.args.get('limit', 20, type=int)
+    limit = max(1, min(limit or 20, REFERRAL_TOP_MAX))
+    con = connect_db()
+    if con is None:
+        return jsonify({'error': "Database unavailable"}), 503
+    try:
+        rows, built_at = referral_graph.top(con, metric, limit)
+    except mysql.connector.Error as err:
+        return jsonify({'error': str(err)}), 500
+    finally:
+        con.close()
+    return jsonify({'by': metric, 'items': rows, 'revenue_age_seconds': round(time.monotonic() - built_at, 1)})
+
+@app.route('/customers/<int:customer_id>/referrals')
+@role_required(['admin', 'agent', 'accountant'])
+def customer_referrals(customer_id):
+    con = connect_db()
+    if con is None:
+        return jsonify({'error': "Database unavailable"}), 503
+    try:
+        record = referral_graph.customer(con, customer_id)
+    except mysql.connector.Error as err:
+        return jsonify({'error': str(err)}), 500
+    finally:
+        con.close()
+    if record is None:
+        return jsonify({'error': f"Customer {customer_id} not found"}), 404
+    return jsonify(record)
+
 @app.route('/customers/view_dependents')
+@cached_page('TravelDependent')
 def view_dependents():
     con = connect_db()
     dependents = []
+    pager = None
     if con:
         cur = con.cursor()
         try:
-            cur.execute("SELECT DependentID, DependentName, Age, Relation, CustomerID FROM TravelDependent;")
-            dependents = cur.fetchall()
+            dependents, pager = fetch_page(cur, DEPENDENT_SELECT, 'DependentID')
+            if wants_json():
+                return page_json(cur, dependents, pager)
         except Exception as e:
             flash(f"Error loading dependents: {e}", "error")
         finally:
             con.close()
-    return render_template('customers.html', dependents=dependents)
+    return render_template('customers.html', dependents=dependents, pager=pager)
 
 @app.route('/bookings')
 @role_required(['admin', 'agent', 'accountant'])
+@cached_page('Booking', 'TourPackage')
 def bookings():
-    update_package_menu()
     con = connect_db()
     bookings = []
-    next_booking_id = 1
+    pager = None
     if con:
         cur = con.cursor()
         try:
-            cur.execute("SELECT BookingID, BookingDate, Status, CustomerID, PackageID FROM Booking;")
-            bookings = cur.fetchall()
-            cur.execute("SELECT MAX(BookingID) FROM Booking;")
-            max_id = cur.fetchone()[0]
-            next_booking_id = (max_id or 0) + 1
+            bookings, pager = fetch_page(cur, BOOKING_SELECT, 'BookingID')
+            if wants_json():
+                return page_json(cur, bookings, pager)
         except Exception as e:
             flash(f"Error loading bookings: {e}", "error")
         finally:
             con.close()
-    return render_template('bookings.html', packages=list(package_map.keys()), bookings=bookings, next_booking_id=next_booking_id)
+    return render_template('bookings.html', packages=package_catalog.names(), bookings=bookings, pager=pager)
 
 @app.route('/bookings/view')
+@cached_page('Booking')
 def view_bookings():
     con = connect_db()
     if con:
         cur = con.cursor()
-        cur.execute("SELECT BookingID, BookingDate, Status, CustomerID, PackageID FROM Booking;")
-        rows = cur.fetchall()
+        rows, pager = fetch_page(cur, BOOKING_SELECT, 'BookingID')
+        if wants_json():
+            response = page_json(cur, rows, pager)
+            con.close()
+            return response
         con.close()
-        return render_template('bookings.html', bookings=rows, packages=list(package_map.keys()))
-    return render_template('bookings.html', bookings=[], packages=list(package_map.keys()))
+        return render_template('bookings.html', bookings=rows, pager=pager, packages=package_catalog.names())
+    return render_template('bookings.html', bookings=[], packages=package_catalog.names())
 
 @app.route('/bookings/add', methods=['POST'])
 @role_required(['admin', 'agent'])
+@idempotent
 def add_booking():
-    b_id = request.form.get('booking_id')
     c_id = request.form.get('customer_id')
     p_id = request.form.get('package_id')
-    if not validate_int_input(b_id, "Booking ID") or not validate_int_input(c_id, "Customer ID") or not validate_int_input(p_id, "Package ID"): return redirect(url_for('bookings'))
+    if not validate_int_input(c_id, "Customer ID") or not validate_int_input(p_id, "Package ID"): return redirect(url_for('bookings'))
+
+    # Optional hotel stay, added as the booking's Itinerary row
+    h_id = request.form.get('hotel_id')
+    t_id = request.form.get('transport_id')
+    stay = None
+    if h_id:
+        if not validate_int_input(h_id, "Hotel ID") or not validate_int_input(t_id, "Transport ID"): return redirect(url_for('bookings'))
+        try:
+            stay = parse_stay(request.form.get('check_in'), request.form.get('check_out'))
+        except ValueError as err:
+            flash(str(err), "error")
+            return redirect(url_for('bookings'))
 
     con = connect_db()
     if con:
         cur = con.cursor()
         try:
-            # 1. Insert into Booking table
+            # 1. Lock the hotel and check capacity before anything is written
+            if stay:
+                reserve_room(cur, int(h_id), *stay)
+
+            # 2. Insert into Booking table
             cur.execute(
-                "INSERT INTO Booking (BookingID, BookingDate, Status, CustomerID, PackageID) VALUES (%s,%s,%s,%s,%s)",
-                (b_id, request.form.get('booking_date'), request.form.get('status'), c_id, p_id)
+                "INSERT INTO Booking (BookingDate, Status, CustomerID, PackageID) VALUES (%s,%s,%s,%s)",
+                (request.form.get('booking_date'), request.form.get('status'), c_id, p_id)
             )
+            b_id = cur.lastrowid
+
+            # 3. Insert the stay
+            if stay:
+                cur.execute(
+                    "INSERT INTO Itinerary (BookingID, HotelID, TransportID, RoomType, CheckInDate, CheckOutDate, SeatClass) VALUES (%s,%s,%s,%s,%s,%s,%s)",
+                    (b_id, h_id, t_id, request.form.get('room_type'), stay[0], stay[1], request.form.get('seat_class'))
+                )
 
             con.commit()
+            bump_versions('Booking', *(['Itinerary'] if stay else []))
+            if stay:
+                hotel_inventory.booked(int(h_id), *stay)
+            customer_metrics.invalidate(c_id)
+            dashboard_stats.adjust(bookings=1)
             flash(f"Booking {b_id} added successfully!", "success")
 
         except mysql.connector.Error as err:
+            con.rollback()
             flash(f"Database error (Check Customer ID and Package ID):\n{err}", "error")
         except ValueError as err:
+            con.rollback()
             flash(str(err), "error")
         finally:
             con.close()
@@ -520,6 +2518,7 @@ def add_booking():
 
 @app.route('/bookings/delete', methods=['POST'])
 @role_required(['admin', 'agent'])
+@idempotent
 def delete_booking():
     b_id = request.form.get('booking_id')
     if not validate_int_input(b_id, "Booking ID"): return redirect(url_for('bookings'))
@@ -528,9 +2527,15 @@ def delete_booking():
     if con:
         cur = con.cursor()
         try:
+            # Payments cascade with the booking; count them for the dashboard.
+            cur.execute("SELECT COUNT(*) FROM Payment WHERE BookingID=%s", (b_id,))
+            payment_count = cur.fetchone()[0]
             cur.execute("DELETE FROM Booking WHERE BookingID=%s", (b_id,))
             if cur.rowcount > 0:
                 con.commit()
+                bump_versions('Booking', 'Payment', 'Itinerary')  # payments and stays cascade with it
+                customer_metrics.invalidate()
+                dashboard_stats.adjust(bookings=-1, payments=-payment_count)
                 flash(f"Booking {b_id} deleted successfully!", "success")
             else:
                 flash(f"Booking ID {b_id} not found.", "warning")
@@ -541,6 +2546,7 @@ def delete_booking():
     return redirect(url_for('bookings'))
 
 @app.route('/bookings/update', methods=['GET', 'POST'])
+@idempotent
 def update_booking():
     if request.method == 'GET':
         return redirect(url_for('bookings'))
@@ -559,6 +2565,8 @@ def update_booking():
             )
             if cur.rowcount > 0:
                 con.commit()
+                bump_versions('Booking')
+                customer_metrics.invalidate()
                 flash(f"Booking {b_id} updated successfully!", "success")
             else:
                 flash(f"Booking ID {b_id} not found.", "warning")
@@ -569,42 +2577,47 @@ def update_booking():
     return redirect(url_for('bookings'))
 
 @app.route('/payments')
+@cached_page('Payment')
 def payments():
     con = connect_db()
     payments = []
-    next_payment_id = 1
+    pager = None
     if con:
         cur = con.cursor()
         try:
-            cur.execute("SELECT PaymentID, Amount, PaymentDate, PaymentMethod, BookingID FROM Payment;")
-            payments = cur.fetchall()
-            cur.execute("SELECT MAX(PaymentID) FROM Payment;")
-            max_id = cur.fetchone()[0]
-            next_payment_id = (max_id or 0) + 1
+            payments, pager = fetch_page(cur, PAYMENT_SELECT, 'PaymentID')
+            if wants_json():
+                return page_json(cur, payments, pager)
         except Exception as e:
             flash(f"Error loading payments: {e}", "error")
         finally:
             con.close()
-    return render_template('payments.html', payments=payments, next_payment_id=next_payment_id)
+    return render_template('payments.html', payments=payments, pager=pager)
 
 @app.route('/payments/view')
+@cached_page('Payment')
 def view_payments():
     con = connect_db()
     if con:
         cur = con.cursor()
-        cur.execute("SELECT PaymentID, Amount, PaymentDate, PaymentMethod, BookingID FROM Payment;")
-        rows = cur.fetchall()
+        rows, pager = fetch_page(cur, PAYMENT_SELECT, 'PaymentID')
+        if wants_json():
+            response = page_json(cur, rows, pager)
+            con.close()
+            return response
         con.close()
-        return render_template('payments.html', payments=rows)
+        return render_template('payments.html', payments=rows, pager=pager)
     return render_template('payments.html', payments=[])
 
 @app.route('/payments/add', methods=['POST'])
 @role_required(['admin', 'accountant'])
+@idempotent
 def add_payment():
-    p_id = request.form.get('payment_id')
     b_id = request.form.get('booking_id')
     amount = request.form.get('amount')
-    if not validate_int_input(p_id, "Payment ID") or not validate_int_input(b_id, "Booking ID") or not validate_float_input(amount, "Amount"): return redirect(url_for('payments'))
+    if not validate_int_input(b_id, "Booking ID") or not validate_float_input(amount, "Amount"): return redirect(url_for('payments'))
+    if PAYMENT_QUEUE:
+        return queue_payment(b_id, amount)
 
     con = connect_db()
     if con:
@@ -612,10 +2625,14 @@ def add_payment():
         try:
             # Insert payment with provided amount
             cur.execute(
-                "INSERT INTO Payment (PaymentID, Amount, PaymentDate, PaymentMethod, BookingID) VALUES (%s,%s,%s,%s,%s)",
-                (p_id, float(amount), request.form.get('payment_date'), request.form.get('method'), b_id)
+                "INSERT INTO Payment (Amount, PaymentDate, PaymentMethod, BookingID) VALUES (%s,%s,%s,%s)",
+                (float(amount), request.form.get('payment_date'), request.form.get('method'), b_id)
             )
+            p_id = cur.lastrowid
             con.commit()
+            bump_versions('Payment', 'Booking')  # the payment trigger updates Booking.Status
+            customer_metrics.invalidate()
+            dashboard_stats.adjust(payments=1)
             flash(f"Payment {p_id} added successfully! Amount: ₹{float(amount):.2f}", "success")
         except mysql.connector.Error as err:
             flash(f"Database error (Check Booking ID):\n{err}", "error")
@@ -625,6 +2642,7 @@ def add_payment():
 
 @app.route('/payments/delete', methods=['POST'])
 @role_required(['admin', 'accountant'])
+@idempotent
 def delete_payment():
     p_id = request.form.get('payment_id')
     if not validate_int_input(p_id, "Payment ID"): return redirect(url_for('payments'))
@@ -636,6 +2654,9 @@ def delete_payment():
             cur.execute("DELETE FROM Payment WHERE PaymentID = %s", (p_id,))
             if cur.rowcount > 0:
                 con.commit()
+                bump_versions('Payment')
+                customer_metrics.invalidate()
+                dashboard_stats.adjust(payments=-1)
                 flash(f"Payment {p_id} deleted successfully!", "success")
             else:
                 flash(f"Payment ID {p_id} not found.", "warning")
@@ -647,6 +2668,7 @@ def delete_payment():
 
 @app.route('/payments/update', methods=['GET', 'POST'])
 @role_required(['admin', 'accountant'])
+@idempotent
 def update_payment():
     if request.method == 'GET':
         return redirect(url_for('payments'))
@@ -665,6 +2687,8 @@ def update_payment():
             )
             if cur.rowcount > 0:
                 con.commit()
+                bump_versions('Payment')
+                customer_metrics.invalidate()
                 flash(f"Payment {p_id} updated successfully!", "success")
             else:
                 flash(f"Payment ID {p_id} not found.", "warning")
@@ -674,54 +2698,323 @@ def update_payment():
             con.close()
     return redirect(url_for('payments'))
 
+# --- Payment Queue ---
+PAYMENT_QUEUE = os.environ.get('PAYMENT_QUEUE', '0') == '1'                 # queue payments instead of inserting inline
+PAYMENT_QUEUE_DB = os.environ.get('PAYMENT_QUEUE_DB', os.path.join(app.instance_path, 'payment_queue.sqlite3'))
+PAYMENT_QUEUE_MAX = int(os.environ.get('PAYMENT_QUEUE_MAX', 10000))         # pending payments before new ones are refused
+PAYMENT_WORKERS = int(os.environ.get('PAYMENT_WORKERS', 2))                 # worker threads per process
+PAYMENT_BATCH = int(os.environ.get('PAYMENT_BATCH', 200))                   # payments applied per transaction
+PAYMENT_POLL = float(os.environ.get('PAYMENT_POLL', 1))                     # seconds between checks for work from other workers
+PAYMENT_CLAIM_TIMEOUT = float(os.environ.get('PAYMENT_CLAIM_TIMEOUT', 60))  # seconds before a crashed worker's batch is retried
+PAYMENT_MAX_ATTEMPTS = int(os.environ.get('PAYMENT_MAX_ATTEMPTS', 5))       # failed batches before a payment is marked failed
+PAYMENT_RETENTION = float(os.environ.get('PAYMENT_RETENTION', 7 * 86400))   # seconds applied/failed entries stay pollable
+
+class PaymentQueueFull(Exception):
+    """Raised when PAYMENT_QUEUE_MAX payments are already waiting to be applied."""
+
+class PaymentQueue:
+    """
+    Durable local queue for add_payment. Payments are appended to a SQLite file (WAL mode)
+    shared by every worker on the host and acknowledged straight away; worker threads claim
+    them in batches and insert each batch in one MySQL transaction, in BookingID order so
+    the Booking row locks taken by trg_after_payment_insert are acquired in a fixed order.
+
+    Every entry carries a random Ref that is written to Payment.QueueRef (unique), so a
+    batch retried after a crash or a lost commit never inserts a payment twice.
+    """
+    def __init__(self, path=PAYMENT_QUEUE_DB, workers=PAYMENT_WORKERS, batch=PAYMENT_BATCH):
+        self.path = path
+        self.workers = workers
+        self.batch = batch
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self.stats = {
+            'enqueued': 0, 'rejected': 0, 'applied': 0, 'failed': 0, 'batches': 0,
+            'batch_errors': 0, 'last_batch_size': 0, 'last_batch_seconds': 0.0, 'max_batch_seconds': 0.0,
+        }
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS payment_queue (
+                    QueueID INTEGER PRIMARY KEY AUTOINCREMENT,
+                    Ref TEXT NOT NULL UNIQUE,
+                    Amount TEXT NOT NULL,
+                    PaymentDate TEXT NOT NULL,
+                    PaymentMethod TEXT,
+                    BookingID INTEGER NOT NULL,
+                    State TEXT NOT NULL DEFAULT 'queued',
+                    Attempts INTEGER NOT NULL DEFAULT 0,
+                    PaymentID INTEGER,
+                    Error TEXT,
+                    EnqueuedAt REAL NOT NULL,
+                    ClaimedAt REAL,
+                    DoneAt REAL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS idx_payment_queue_state ON payment_queue (State, QueueID)")
+            self._local.db = db
+        return db
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def start(self):
+        """
+        Starts the worker threads in this process (once). With PAYMENT_QUEUE they are started
+        by warm_worker or on the process's first request, so entries left by a restart or
+        crash (queued, or applying past PAYMENT_CLAIM_TIMEOUT) are applied without waiting
+        for a new payment.
+        """
+        with self._lock:
+            if self._threads:
+                return
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"payment-queue-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def enqueue(self, amount, payment_date, method, booking_id):
+        """Appends a payment and returns its reference. Raises PaymentQueueFull under back-pressure."""
+        self.start()
+        db = self._db()
+        pending = db.execute("SELECT COUNT(*) FROM payment_queue WHERE State IN ('queued', 'applying')").fetchone()[0]
+        if pending >= PAYMENT_QUEUE_MAX:
+            self._count('rejected')
+            raise PaymentQueueFull(f"{pending} payments are waiting to be applied")
+        ref = uuid.uuid4().hex
+        db.execute(
+            "INSERT INTO payment_queue (Ref, Amount, PaymentDate, PaymentMethod, BookingID, EnqueuedAt) VALUES (?, ?, ?, ?, ?, ?)",
+            (ref, str(amount), payment_date, method, int(booking_id), time.time()),
+        )
+        self._count('enqueued')
+        self._wakeup.set()
+        return ref
+
+    def status(self, ref):
+        """The queue entry for a reference as a dict, or None."""
+        row = self._db().execute(
+            "SELECT Ref, State, Amount, PaymentDate, PaymentMethod, BookingID, PaymentID, Attempts, Error, EnqueuedAt, DoneAt "
+            "FROM payment_queue WHERE Ref = ?", (ref,)
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ('ref', 'state', 'amount', 'payment_date', 'method', 'booking_id', 'payment_id', 'attempts', 'error', 'enqueued_at', 'done_at')
+        return dict(zip(keys, row))
+
+    def snapshot(self):
+        """Queue depth and throughput counters for /payments/queue/stats."""
+        db = self._db()
+        states = dict(db.execute("SELECT State, COUNT(*) FROM payment_queue GROUP BY State").fetchall())
+        oldest = db.execute("SELECT MIN(EnqueuedAt) FROM payment_queue WHERE State = 'queued'").fetchone()[0]
+        with self._lock:
+            data = dict(self.stats)
+            data['workers'] = len(self._threads)
+        pending = states.get('queued', 0) + states.get('applying', 0)
+        data.update({
+            'enabled': PAYMENT_QUEUE,
+            'queued': states.get('queued', 0),
+            'applying': states.get('applying', 0),
+            'applied_retained': states.get('applied', 0),
+            'failed_retained': states.get('failed', 0),
+            'capacity': PAYMENT_QUEUE_MAX,
+            'utilisation': round(pending / PAYMENT_QUEUE_MAX, 4) if PAYMENT_QUEUE_MAX else None,
+            'oldest_queued_seconds': round(time.time() - oldest, 3) if oldest else 0.0,
+        })
+        return data
+
+    def _run(self):
+        while True:
+            try:
+                self._wakeup.clear()
+                batch = self._claim()
+                if batch:
+                    self._apply(batch)
+                else:
+                    self._wakeup.wait(PAYMENT_POLL)
+            except Exception:
+                app.logger.exception("Payment queue worker error")
+                time.sleep(PAYMENT_POLL)
+
+    def _claim(self):
+        """Marks up to `batch` queued entries as applying and returns them."""
+        db = self._db()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("UPDATE payment_queue SET State = 'queued' WHERE State = 'applying' AND ClaimedAt < ?",
+                       (now - PAYMENT_CLAIM_TIMEOUT,))
+            rows = db.execute(
+                "SELECT QueueID, Ref, Amount, PaymentDate, PaymentMethod, BookingID, Attempts FROM payment_queue "
+                "WHERE State = 'queued' ORDER BY QueueID LIMIT ?", (self.batch,)
+            ).fetchall()
+            db.executemany("UPDATE payment_queue SET State = 'applying', ClaimedAt = ?, Attempts = Attempts + 1 WHERE QueueID = ?",
+                           [(now, row[0]) for row in rows])
+            if not rows:
+                db.execute("DELETE FROM payment_queue WHERE State IN ('applied', 'failed') AND DoneAt < ?",
+                           (now - PAYMENT_RETENTION,))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return rows
+
+    def _apply(self, batch):
+        """Inserts a claimed batch in one transaction; rows MySQL rejects are marked failed on their own."""
+        start = time.monotonic()
+        results = []
+        inserted = 0
+        try:
+            con = get_pool('admin').acquire()
+            try:
+                cur = con.cursor()
+                for queue_id, ref, amount, payment_date, method, booking_id, _ in sorted(batch, key=lambda row: (row[5], row[0])):
+                    cur.execute("SAVEPOINT queued_payment")
+                    try:
+                        cur.execute(
+                            "INSERT INTO Payment (Amount, PaymentDate, PaymentMethod, BookingID, QueueRef) VALUES (%s,%s,%s,%s,%s)",
+                            (amount, payment_date, method, booking_id, ref)
+                        )
+                        results.append(('applied', cur.lastrowid, None, queue_id))
+                        inserted += 1
+                    except (mysql.connector.IntegrityError, mysql.connector.DataError) as err:
+                        cur.execute("ROLLBACK TO SAVEPOINT queued_payment")
+                        if err.errno == 1062:
+                            # Applied by an earlier attempt whose outcome was lost.
+                            cur.execute("SELECT PaymentID FROM Payment WHERE QueueRef = %s", (ref,))
+                            results.append(('applied', cur.fetchone()[0], None, queue_id))
+                        else:
+                            results.append(('failed', None, str(err), queue_id))
+                con.commit()
+            finally:
+                con.close()
+        except Exception as err:
+            # Connection loss, deadlock, pool timeout: the whole batch goes back for another attempt.
+            self._count('batch_errors')
+            app.logger.warning("Payment batch of %d failed: %s", len(batch), err)
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            db.executemany(
+                "UPDATE payment_queue SET State = CASE WHEN Attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                "Error = ?, DoneAt = CASE WHEN Attempts >= ? THEN ? END WHERE QueueID = ?",
+                [(PAYMENT_MAX_ATTEMPTS, str(err), PAYMENT_MAX_ATTEMPTS, time.time(), row[0]) for row in batch],
+            )
+            db.execute("COMMIT")
+            time.sleep(min(PAYMENT_POLL, 1))
+            return
+
+        now = time.time()
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        db.executemany("UPDATE payment_queue SET State = ?, PaymentID = ?, Error = ?, DoneAt = ? WHERE QueueID = ?",
+                       [(state, payment_id, error, now, queue_id) for state, payment_id, error, queue_id in results])
+        db.execute("COMMIT")
+
+        if inserted:
+            bump_versions('Payment', 'Booking')
+            customer_metrics.invalidate()
+            dashboard_stats.adjust(payments=inserted)
+        elapsed = time.monotonic() - start
+        failed = sum(1 for result in results if result[0] == 'failed')
+        with self._lock:
+            self.stats['applied'] += len(results) - failed
+            self.stats['failed'] += failed
+            self.stats['batches'] += 1
+            self.stats['last_batch_size'] = len(batch)
+            self.stats['last_batch_seconds'] = round(elapsed, 4)
+            self.stats['max_batch_seconds'] = max(self.stats['max_batch_seconds'], round(elapsed, 4))
+
+payment_queue = PaymentQueue()
+
+@app.before_request
+def start_payment_queue():
+    # Per process and after any fork, so a pre-forking server's workers each run their own threads.
+    if PAYMENT_QUEUE and not payment_queue._threads:
+        payment_queue.start()
+
+def queue_payment(b_id, amount):
+    """add_payment in queued mode: appends the payment and acknowledges it without touching MySQL."""
+    payment_date = request.form.get('payment_date')
+    try:
+        datetime.strptime(payment_date or '', '%Y-%m-%d')
+    except ValueError:
+        flash("'Payment Date' must be a date (YYYY-MM-DD).", "error")
+        return redirect(url_for('payments'))
+    try:
+        ref = payment_queue.enqueue(amount, payment_date, request.form.get('method'), b_id)
+    except PaymentQueueFull as e:
+        if wants_json():
+            return jsonify({'error': f"Payment queue is full: {e}"}), 503, {'Retry-After': '5'}
+        flash(f"Payments are backing up ({e}). Please try again shortly.", "error")
+        return redirect(url_for('payments'))
+    status_url = url_for('payment_queue_status', ref=ref)
+    if wants_json():
+        return jsonify({'ref': ref, 'state': 'queued', 'status_url': status_url}), 202, {'Location': status_url}
+    flash(f"Payment of ₹{float(amount):.2f} for Booking {b_id} queued (reference {ref}). Track it at {status_url}", "success")
+    return redirect(url_for('payments'))
+
+@app.route('/payments/queue/<ref>')
+@role_required(['admin', 'accountant'])
+def payment_queue_status(ref):
+    status = payment_queue.status(ref)
+    if status is None:
+        return jsonify({'error': f"No queued payment {ref}"}), 404
+    return jsonify(status)
+
+@app.route('/payments/queue/stats')
+@role_required(['admin', 'accountant'])
+def payment_queue_stats():
+    return jsonify(payment_queue.snapshot())
+
 @app.route('/packages')
+@cached_page('TourPackage')
 def packages():
-    update_package_menu()
-    # Fetch package list for display
     con = connect_db()
     package_list = []
-    next_package_id = 1
+    pager = None
     if con:
         cur = con.cursor()
         try:
-            cur.execute("""
-                SELECT tp.PackageID, tp.PackageName, tp.PackagePrice, tp.Duration, tp.No_of_Travelers
-                FROM TourPackage tp;
-            """)
-            package_list = cur.fetchall()
-            cur.execute("SELECT MAX(PackageID) FROM TourPackage;")
-            max_id = cur.fetchone()[0]
-            next_package_id = (max_id or 0) + 1
+            package_list, pager = fetch_page(cur, PACKAGE_SELECT, 'PackageID')
+            if wants_json():
+                return page_json(cur, package_list, pager)
         except Exception as e:
             flash(f"Error loading packages: {e}", "error")
         finally:
             con.close()
-    return render_template('packages.html', packages=list(package_map.keys()), package_list=package_list, next_package_id=next_package_id)
+    return render_template('packages.html', packages=package_catalog.names(), package_list=package_list, pager=pager)
 
 @app.route('/packages/view')
+@cached_page('TourPackage')
 def view_packages():
     con = connect_db()
     if con:
         cur = con.cursor()
-        cur.execute("""
-            SELECT tp.PackageID, tp.PackageName, tp.PackagePrice, tp.Duration, tp.No_of_Travelers
-            FROM TourPackage tp;
-        """)
-        rows = cur.fetchall()
+        rows, pager = fetch_page(cur, PACKAGE_SELECT, 'PackageID')
+        if wants_json():
+            response = page_json(cur, rows, pager)
+            con.close()
+            return response
         con.close()
-        return render_template('packages.html', package_list=rows, packages=list(package_map.keys()))
-    return render_template('packages.html', package_list=[], packages=list(package_map.keys()))
+        return render_template('packages.html', package_list=rows, pager=pager, packages=package_catalog.names())
+    return render_template('packages.html', package_list=[], packages=package_catalog.names())
 
 @app.route('/packages/add', methods=['POST'])
 @role_required(['admin', 'agent'])
+@idempotent
 def add_package():
-    p_id = request.form.get('package_id')
     p_name = request.form.get('package_name')
     p_price = request.form.get('price')
     p_duration = request.form.get('duration')
     p_travelers = request.form.get('travelers')
 
-    if not validate_int_input(p_id, "Package ID"): return redirect(url_for('packages'))
     if not p_name:
         flash("Package Name cannot be empty.", "error")
         return redirect(url_for('packages'))
@@ -734,12 +3027,14 @@ def add_package():
         cur = con.cursor()
         try:
             cur.execute(
-                "INSERT INTO TourPackage (PackageID, PackageName, PackagePrice, Duration, No_of_Travelers) VALUES (%s, %s, %s, %s, %s)",
-                (int(p_id), p_name, float(p_price), int(p_duration), int(p_travelers))
+                "INSERT INTO TourPackage (PackageName, PackagePrice, Duration, No_of_Travelers) VALUES (%s, %s, %s, %s)",
+                (p_name, float(p_price), int(p_duration), int(p_travelers))
             )
+            p_id = cur.lastrowid
             con.commit()
             flash(f"New Package '{p_name}' (ID: {p_id}) added successfully!", "success")
-            update_package_menu()
+            package_catalog.invalidate()
+            package_search.changed(con, 'package', p_id)
         except mysql.connector.Error as err:
             flash(f"Database error:\n{err}", "error")
         finally:
@@ -750,6 +3045,7 @@ def add_package():
 
 @app.route('/packages/delete', methods=['POST'])
 @role_required(['admin', 'agent'])
+@idempotent
 def delete_package():
     p_id = request.form.get('package_id')
     if not validate_int_input(p_id, "Package ID"): return redirect(url_for('packages'))
@@ -762,7 +3058,8 @@ def delete_package():
             if cur.rowcount > 0:
                 con.commit()
                 flash(f"Package {p_id} deleted successfully!", "success")
-                update_package_menu()
+                package_catalog.invalidate()
+                package_search.changed(con, 'package', p_id)
             else:
                 flash(f"Package ID {p_id} not found.", "warning")
         except mysql.connector.Error as err:
@@ -772,6 +3069,7 @@ def delete_package():
     return redirect(url_for('packages'))
 
 @app.route('/packages/update', methods=['GET', 'POST'])
+@idempotent
 def update_package():
     if request.method == 'GET':
         return redirect(url_for('packages'))
@@ -783,24 +3081,565 @@ def update_package():
     if not validate_int_input(p_id, "Package ID") or not p_name or not validate_float_input(p_price, "Price") or not validate_int_input(p_duration, "Duration") or not validate_int_input(p_travelers, "Number of Travelers"): return redirect(url_for('packages'))
 
     con = connect_db()
-    if con:
-        cur = con.cursor()
-        try:
-            cur.execute(
-                "UPDATE TourPackage SET PackageName=%s, PackagePrice=%s, Duration=%s, No_of_Travelers=%s WHERE PackageID=%s",
-                (p_name, float(p_price), int(p_duration), int(p_travelers), p_id)
-            )
-            if cur.rowcount > 0:
-                con.commit()
-                flash(f"Package {p_id} updated successfully!", "success")
-                update_package_menu()
-            else:
-                flash(f"Package ID {p_id} not found.", "warning")
-        except mysql.connector.Error as err:
-            flash(f"Database error: {err}", "error")
-        finally:
-            con.close()
-    return redirect(url_for('packages'))
+    if con:
+        cur = con.cursor()
+        try:
+            cur.execute(
+                "UPDATE TourPackage SET PackageName=%s, PackagePrice=%s, Duration=%s, No_of_Travelers=%s WHERE PackageID=%s",
+                (p_name, float(p_price), int(p_duration), int(p_travelers), p_id)
+            )
+            if cur.rowcount > 0:
+                con.commit()
+                flash(f"Package {p_id} updated successfully!", "success")
+                package_catalog.invalidate()
+                package_search.changed(con, 'package', p_id)
+            else:
+                flash(f"Package ID {p_id} not found.", "warning")
+        except mysql.connector.Error as err:
+            flash(f"Database error: {err}", "error")
+        finally:
+            con.close()
+    return redirect(url_for('packages'))
+
+# --- Package Search ---
+SEARCH_REBUILD_INTERVAL = float(os.environ.get('SEARCH_REBUILD_INTERVAL', 300))  # seconds between full index rebuilds (0 disables)
+SEARCH_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS', 100))              # largest ?limit= for /packages/search
+SEARCH_FACET_SIZE = int(os.environ.get('SEARCH_FACET_SIZE', 50))                 # values returned per facet
+
+# Range filters (?min_<name>= / ?max_<name>=) and sort keys. rating is the package's best
+# hotel rating and hotel_price its cheapest hotel; both are None for packages without hotels.
+SEARCH_RANGES = ('price', 'duration', 'travelers', 'rating', 'hotel_price')
+# Stamp bumped by writes to each table the index reads
+SEARCH_STAMPS = {'package': 'TourPackage', 'hotel': 'Hotel', 'transport': 'Transport', 'destination': 'Destination'}
+
+class _Links:
+    """Package-to-value links (one M:N facet) as parallel row / code arrays, for masking and bincount."""
+    def __init__(self, capacity=1024):
+        self.codes = {}   # value -> code
+        self.values = []  # code -> value
+        self.row = np.zeros(capacity, dtype=np.int64)
+        self.code = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.size = 0
+
+    def add(self, row, value):
+        """Appends one link and returns its position."""
+        if self.size == len(self.row):
+            for name in ('row', 'code', 'alive'):
+                old = getattr(self, name)
+                setattr(self, name, np.concatenate([old, np.zeros_like(old)]))
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        self.row[self.size], self.code[self.size], self.alive[self.size] = row, code, True
+        self.size += 1
+        return self.size - 1
+
+    def rows_with(self, values, n):
+        """Boolean mask over the first n package rows: linked to any of `values`."""
+        wanted = np.zeros(len(self.values) + 1, dtype=bool)
+        wanted[[self.codes[v] for v in values if v in self.codes]] = True
+        size = self.size
+        hit = self.alive[:size] & wanted[self.code[:size]]
+        mask = np.zeros(n, dtype=bool)
+        mask[self.row[:size][hit]] = True
+        return mask
+
+    def counts(self, mask, limit):
+        """The `limit` values linked to the most masked packages, as [(value, count)]."""
+        size = self.size
+        hit = self.alive[:size] & mask[self.row[:size]]
+        counts = np.bincount(self.code[:size][hit], minlength=len(self.values))
+        codes = np.flatnonzero(counts)
+        codes = codes[np.lexsort((codes, -counts[codes]))][:limit]
+        return [(self.values[code], int(counts[code])) for code in codes]
+
+class PackageIndex:
+    """
+    Column arrays over packages (one row each) for the range filters, and _Links
+    arrays for destinations and transport types (the Covers / IncludesTravelBy side of
+    the index). A search is a handful of vectorised mask operations, and facets are
+    bincounts over the masked links, so it stays in the low milliseconds at 100k packages.
+    Removed packages leave a dead row behind until compact().
+    """
+    def __init__(self, hotels, transports, destinations, capacity=1024):
+        self.hotels = hotels              # HotelID -> (Rating, HotelPrice)
+        self.transports = transports      # TransportID -> TransportType
+        self.destinations = destinations  # DestinationID -> DestinationName
+        self.packages = {}                # PackageID -> record, see package_record()
+        self.rows = {}                    # PackageID -> row
+        self.hotel_packages = {}          # HotelID -> PackageIDs
+        self.transport_packages = {}      # TransportID -> PackageIDs
+        self.by_destination = _Links()
+        self.by_transport_type = _Links() # lower-cased TransportType
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.columns = {name: np.full(capacity, np.nan) for name in SEARCH_RANGES}
+        self.size = 0
+
+    def build(self, records):
+        for package_id, record in records.items():
+            self.add(package_id, record)
+
+    def add(self, package_id, record):
+        hotels = [self.hotels[h] for h in record['hotels'] if h in self.hotels]
+        record['rating'] = max((rating for rating, _ in hotels if rating is not None), default=None)
+        record['hotel_price'] = min((price for _, price in hotels if price is not None), default=None)
+        record['types'] = {self.transports[t].lower() for t in record['transports'] if self.transports.get(t)}
+
+        if self.size == len(self.ids):
+            self.ids = np.concatenate([self.ids, np.zeros_like(self.ids)])
+            self.active = np.concatenate([self.active, np.zeros_like(self.active)])
+            for name, column in self.columns.items():
+                self.columns[name] = np.concatenate([column, np.full_like(column, np.nan)])
+        row = self.size
+        self.size += 1
+        self.ids[row], self.active[row] = package_id, True
+        for name in SEARCH_RANGES:
+            self.columns[name][row] = np.nan if record[name] is None else record[name]
+        record['links'] = ([self.by_destination.add(row, d) for d in record['destinations']],
+                           [self.by_transport_type.add(row, t) for t in record['types']])
+        for hotel_id in record['hotels']:
+            self.hotel_packages.setdefault(hotel_id, set()).add(package_id)
+        for transport_id in record['transports']:
+            self.transport_packages.setdefault(transport_id, set()).add(package_id)
+        self.packages[package_id] = record
+        self.rows[package_id] = row
+
+    def remove(self, package_id):
+        """Unindexes a package and returns its record (or None)."""
+        record = self.packages.pop(package_id, None)
+        if record is None:
+            return None
+        self.active[self.rows.pop(package_id)] = False
+        destination_links, type_links = record.pop('links')
+        self.by_destination.alive[destination_links] = False
+        self.by_transport_type.alive[type_links] = False
+        for key, index in ((record['hotels'], self.hotel_packages), (record['transports'], self.transport_packages)):
+            for value in key:
+                index.get(value, set()).discard(package_id)
+        return record
+
+    def compact(self):
+        """A fresh index over the live packages, without the dead rows and links."""
+        index = PackageIndex(self.hotels, self.transports, self.destinations, capacity=max(1024, len(self.packages)))
+        for package_id, record in self.packages.items():
+            record = dict(record)
+            record.pop('links')
+            index.add(package_id, record)
+        return index
+
+    @property
+    def dead_rows(self):
+        return self.size - len(self.packages)
+
+    def update_hotel(self, hotel_id, attrs):
+        """Applies an edited hotel (attrs=None when deleted) to every package that stays there."""
+        package_ids = list(self.hotel_packages.get(hotel_id, ()))
+        records = [self.remove(package_id) for package_id in package_ids]
+        if attrs is None:
+            self.hotels.pop(hotel_id, None)
+            for record in records:
+                record['hotels'].discard(hotel_id)  # GuestStayIn rows cascade with the hotel
+        else:
+            self.hotels[hotel_id] = attrs
+        for package_id, record in zip(package_ids, records):
+            self.add(package_id, record)
+
+    def update_transport(self, transport_id, transport_type):
+        """Applies an edited transport (type None when deleted) to every package that uses it."""
+        package_ids = list(self.transport_packages.get(transport_id, ()))
+        records = [self.remove(package_id) for package_id in package_ids]
+        if transport_type is None:
+            self.transports.pop(transport_id, None)
+            for record in records:
+                record['transports'].discard(transport_id)
+        else:
+            self.transports[transport_id] = transport_type
+        for package_id, record in zip(package_ids, records):
+            self.add(package_id, record)
+
+    def update_destination(self, destination_id, name):
+        """Renames a destination, or drops it from every package when deleted (name None)."""
+        if name is not None:
+            self.destinations[destination_id] = name
+            return
+        self.destinations.pop(destination_id, None)
+        rows = self.by_destination.rows_with([destination_id], self.size) & self.active[:self.size]
+        for package_id in self.ids[:self.size][rows].tolist():
+            record = self.remove(package_id)
+            record['destinations'].discard(destination_id)  # Covers rows cascade with the destination
+            self.add(package_id, record)
+
+    def search(self, destinations=(), transport_types=(), ranges=None, sort='price', offset=0, limit=20):
+        """
+        destinations / transport_types match any of the given values; ranges is
+        {name: (low, high)} with either bound optional. sort is a SEARCH_RANGES name,
+        prefixed with '-' for descending. Returns (total, page of PackageIDs, facets).
+        """
+        n = self.size
+        mask = self.active[:n].copy()
+        for name, (low, high) in (ranges or {}).items():
+            column = self.columns[name][:n]  # NaN (no value) fails both comparisons
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        if destinations:
+            mask &= self.by_destination.rows_with(destinations, n)
+        if transport_types:
+            mask &= self.by_transport_type.rows_with([t.lower() for t in transport_types], n)
+
+        rows = np.flatnonzero(mask)
+        return len(rows), self._page(rows, sort, offset, limit), self._facets(mask, rows)
+
+    def _page(self, rows, sort, offset, limit):
+        """PackageIDs offset..offset+limit of the matches in sort order; missing values sort last."""
+        name = sort.lstrip('-')
+        keys = self.columns[name][rows]
+        if sort.startswith('-'):
+            keys = -keys
+        wanted = offset + limit
+        if len(rows) > wanted:
+            # Only the first `wanted` need ordering (plus ties at the cut-off); NaN partitions to the end.
+            cutoff = np.partition(keys, wanted - 1)[wanted - 1]
+            if not np.isnan(cutoff):
+                keep = keys <= cutoff
+                rows, keys = rows[keep], keys[keep]
+        order = np.lexsort((self.ids[rows], keys))
+        return self.ids[rows[order]][offset:wanted].tolist()
+
+    def _facets(self, mask, rows):
+        ratings = self.columns['rating'][rows]
+        stars = np.bincount(ratings[~np.isnan(ratings)].astype(np.int64), minlength=6)
+        return {
+            'destination': [{'DestinationID': d, 'DestinationName': self.destinations.get(d), 'count': n}
+                            for d, n in self.by_destination.counts(mask, SEARCH_FACET_SIZE)],
+            'transport_type': [{'TransportType': t, 'count': n}
+                               for t, n in self.by_transport_type.counts(mask, SEARCH_FACET_SIZE)],
+            'rating': [{'stars': s, 'count': int(stars[s])} for s in range(len(stars) - 1, -1, -1) if stars[s]],
+        }
+
+def package_record(row):
+    """A PackageIndex record from a (PackageID, PackageName, PackagePrice, Duration, No_of_Travelers) row."""
+    _, name, price, duration, travelers = row
+    return {'name': name, 'price': float(price), 'duration': duration, 'travelers': travelers,
+            'destinations': set(), 'hotels': set(), 'transports': set()}
+
+def package_json(package_id, record):
+    return {
+        'PackageID': package_id, 'PackageName': record['name'], 'PackagePrice': record['price'],
+        'Duration': record['duration'], 'No_of_Travelers': record['travelers'],
+        'BestHotelRating': record['rating'], 'CheapestHotelPrice': record['hotel_price'],
+        'DestinationIDs': sorted(record['destinations']), 'TransportTypes': sorted(record['types']),
+    }
+
+def to_float(value):
+    return None if value is None else float(value)
+
+PACKAGE_LINKS = (('Covers', 'DestinationID', 'destinations'),
+                 ('GuestStayIn', 'HotelID', 'hotels'),
+                 ('IncludesTravelBy', 'TransportID', 'transports'))
+
+class PackageSearch:
+    """
+    The shared PackageIndex. It is rebuilt when another worker bumps one of the
+    SEARCH_STAMPS (or every SEARCH_REBUILD_INTERVAL seconds); edits made by this
+    worker are patched in place through changed().
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.index = None
+        self._versions = None
+        self._built_at = 0.0
+
+    def ensure(self, con):
+        """The current index, rebuilt first if stale. Use the returned index: self.index can
+        be dropped by changed() as soon as the lock is released."""
+        versions = {kind: data_version(name).current() for kind, name in SEARCH_STAMPS.items()}
+        expired = SEARCH_REBUILD_INTERVAL > 0 and time.monotonic() - self._built_at > SEARCH_REBUILD_INTERVAL
+        with self._lock:
+            index = self.index
+            if index is not None and versions == self._versions and not expired:
+                return index
+        # Build outside the lock so searches keep using the old index meanwhile.
+        index = self._load(con.cursor())
+        with self._lock:
+            self.index, self._versions, self._built_at = index, versions, time.monotonic()
+        return index
+
+    def search(self, con, **filters):
+        index = self.ensure(con)
+        with self._lock:  # changed() patches indexes in place
+            total, page, facets = index.search(**filters)
+            return total, [package_json(package_id, index.packages[package_id]) for package_id in page], facets
+
+    def changed(self, con, kind, key):
+        """
+        Re-reads one edited package / hotel / transport / destination and patches the index.
+        Call after the write is committed and its stamp bumped.
+        """
+        key = int(key)
+        if self.index is None:
+            return
+        # Query before locking: only the in-memory patch holds the lock, so searches never wait on MySQL.
+        try:
+            value = self._read(con.cursor(), kind, key)
+        except mysql.connector.Error:
+            with self._lock:
+                self.index = None  # rebuilt on the next search
+            return
+        with self._lock:
+            if self.index is None:
+                return
+            if kind == 'package':
+                self.index.remove(key)
+                if value is not None:
+                    self.index.add(key, value)
+            elif kind == 'hotel':
+                self.index.update_hotel(key, value)
+            elif kind == 'transport':
+                self.index.update_transport(key, value)
+            else:
+                self.index.update_destination(key, value)
+            if self.index.dead_rows > max(1024, len(self.index.packages)):
+                self.index = self.index.compact()
+            # Adopt the bumped stamp. A concurrent bump from another worker can be missed
+            # here; the periodic rebuild picks it up.
+            self._versions[kind] = data_version(SEARCH_STAMPS[kind]).current()
+
+    def _read(self, cur, kind, key):
+        """The current row changed() patches in, or None if it was deleted."""
+        if kind == 'package':
+            return self._load_package(cur, key)
+        if kind == 'hotel':
+            cur.execute("SELECT Rating, HotelPrice FROM Hotel WHERE HotelID = %s", (key,))
+            row = cur.fetchone()
+            return (to_float(row[0]), to_float(row[1])) if row else None
+        if kind == 'transport':
+            cur.execute("SELECT TransportType FROM Transport WHERE TransportID = %s", (key,))
+        else:
+            cur.execute("SELECT DestinationName FROM Destination WHERE DestinationID = %s", (key,))
+        row = cur.fetchone()
+        return row[0] if row else None
+
+    def _load(self, cur):
+        cur.execute("SELECT HotelID, Rating, HotelPrice FROM Hotel")
+        hotels = {h: (to_float(rating), to_float(price)) for h, rating, price in cur.fetchall()}
+        cur.execute("SELECT TransportID, TransportType FROM Transport")
+        transports = dict(cur.fetchall())
+        cur.execute("SELECT DestinationID, DestinationName FROM Destination")
+        destinations = dict(cur.fetchall())
+        cur.execute("SELECT PackageID, PackageName, PackagePrice, Duration, No_of_Travelers FROM TourPackage")
+        records = {row[0]: package_record(row) for row in cur.fetchall()}
+        for table, column, field in PACKAGE_LINKS:
+            cur.execute(f"SELECT PackageID, {column} FROM {table}")
+            for package_id, value in cur.fetchall():
+                if package_id in records:
+                    records[package_id][field].add(value)
+        index = PackageIndex(hotels, transports, destinations)
+        index.build(records)
+        return index
+
+    def _load_package(self, cur, package_id):
+        cur.execute("SELECT PackageID, PackageName, PackagePrice, Duration, No_of_Travelers FROM TourPackage WHERE PackageID = %s",
+                    (package_id,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        record = package_record(row)
+        for table, column, field in PACKAGE_LINKS:
+            cur.execute(f"SELECT {column} FROM {table} WHERE PackageID = %s", (package_id,))
+            record[field].update(value for (value,) in cur.fetchall())
+        return record
+
+package_search = PackageSearch()
+
+def parse_search_args(args):
+    """Turns /packages/search query parameters into PackageIndex.search() keyword arguments."""
+    filters = {'ranges': {}}
+    if args.get('destination'):
+        filters['destinations'] = parse_id_list(args.get('destination'))
+        if filters['destinations'] is None:
+            raise ValueError("'destination' must be a list of positive integers.")
+    if args.get('transport'):
+        filters['transport_types'] = [t.strip() for t in args.get('transport').split(',') if t.strip()]
+    for name in SEARCH_RANGES:
+        low, high = args.get(f'min_{name}'), args.get(f'max_{name}')
+        for value in (low, high):
+            if value not in (None, '') and not is_non_negative_float(value):
+                raise ValueError(f"min_{name} / max_{name} must be non-negative numbers.")
+        if low or high:
+            filters['ranges'][name] = (float(low) if low else None, float(high) if high else None)
+    sort = args.get('sort', 'price')
+    if sort.lstrip('-') not in SEARCH_RANGES:
+        raise ValueError(f"'sort' must be one of {', '.join(SEARCH_RANGES)} (prefix '-' for descending).")
+    filters['sort'] = sort
+    limit, offset = args.get('limit', '20'), args.get('offset', '0')
+    if not is_positive_int(limit) or not (offset == '0' or is_positive_int(offset)):
+        raise ValueError("'limit' must be a positive integer and 'offset' a non-negative one.")
+    filters['limit'] = min(int(limit), SEARCH_MAX_RESULTS)
+    filters['offset'] = int(offset)
+    return filters
+
+@app.route('/packages/search')
+def search_packages():
+    try:
+        filters = parse_search_args(request.args)
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
+
+    con = connect_db()
+    if not con:
+        return jsonify({'error': 'Database unavailable.'}), 503
+    try:
+        started = time.perf_counter()
+        total, packages, facets = package_search.search(con, **filters)
+        took_ms = (time.perf_counter() - started) * 1000
+    except mysql.connector.Error as err:
+        return jsonify({'error': str(err)}), 500
+    finally:
+        con.close()
+    return jsonify({
+        'total': total,
+        'took_ms': round(took_ms, 3),
+        'packages': packages,
+        'facets': facets,
+    })
+
+# --- Package Pricing ---
+PRICING_STAMPS = ('TourPackage', 'Hotel', 'Transport')
+
+def to_paise(value):
+    """A DECIMAL(12,2) amount as an exact integer number of paise."""
+    return int(Decimal(str(value or 0)) * 100)
+
+def from_paise(value):
+    return Decimal(int(value)).scaleb(-2)
+
+def lookup_positions(sorted_keys, keys):
+    """Index of each key in a sorted key array, or -1 where it is missing."""
+    if len(sorted_keys) == 0:
+        return np.full(len(keys), -1, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return np.where(sorted_keys[pos] == keys, pos, -1)
+
+class PackagePricing:
+    """
+    Exact totals for every package, computed in one vectorised pass:
+
+        per traveller = PackagePrice + every transport leg + Duration x every hotel's nightly price
+        total         = per traveller x No_of_Travelers
+
+    Unlike calculate_package_total_cost (one arbitrary hotel + transport via LIMIT 1), all
+    of a package's GuestStayIn hotels and IncludesTravelBy legs are included. Amounts are
+    int64 paise throughout, so the cents are exact. Results are kept until the
+    TourPackage, Hotel or Transport version stamp changes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._costs = None
+        self._versions = None
+
+    def get(self, con):
+        versions = tuple(data_version(name).current() for name in PRICING_STAMPS)
+        with self._lock:
+            if self._costs is not None and versions == self._versions:
+                return self._costs
+        costs = self._compute(con.cursor())
+        with self._lock:
+            # Keep the versions read before loading so a concurrent price change triggers another pass.
+            self._costs, self._versions = costs, versions
+        return costs
+
+    def cost(self, con, package_id):
+        """One package's breakdown, or None if it does not exist."""
+        costs = self.get(con)
+        row = costs['rows'].get(package_id)
+        return None if row is None else self._breakdown(costs, row)
+
+    def all(self, con):
+        costs = self.get(con)
+        return [self._breakdown(costs, row) for row in range(len(costs['ids']))]
+
+    def _compute(self, cur):
+        cur.execute("SELECT PackageID, PackageName, PackagePrice, Duration, No_of_Travelers FROM TourPackage ORDER BY PackageID")
+        packages = cur.fetchall()
+        ids = np.array([p[0] for p in packages], dtype=np.int64)
+        price = np.array([to_paise(p[2]) for p in packages], dtype=np.int64)
+        duration = np.array([p[3] for p in packages], dtype=np.int64)
+        travelers = np.array([p[4] for p in packages], dtype=np.int64)
+
+        hotels, hotel_count = self._linked_sum(cur, ids, "SELECT HotelID, HotelPrice FROM Hotel ORDER BY HotelID",
+                                               "SELECT PackageID, HotelID FROM GuestStayIn")
+        legs, leg_count = self._linked_sum(cur, ids, "SELECT TransportID, TransportPrice FROM Transport ORDER BY TransportID",
+                                           "SELECT PackageID, TransportID FROM IncludesTravelBy")
+        per_traveller = price + legs + duration * hotels
+        return {
+            'ids': ids, 'names': [p[1] for p in packages], 'rows': {int(pid): i for i, pid in enumerate(ids)},
+            'price': price, 'duration': duration, 'travelers': travelers,
+            'hotels': hotels, 'hotel_count': hotel_count, 'legs': legs, 'leg_count': leg_count,
+            'per_traveller': per_traveller, 'total': per_traveller * travelers,
+        }
+
+    @staticmethod
+    def _linked_sum(cur, ids, price_sql, link_sql):
+        """Per-package sum (in paise) and count of the linked prices, in one pass over the link table."""
+        cur.execute(price_sql)
+        priced = cur.fetchall()
+        keys = np.array([row[0] for row in priced], dtype=np.int64)
+        prices = np.array([to_paise(row[1]) for row in priced], dtype=np.int64)
+        cur.execute(link_sql)
+        links = cur.fetchall()
+        package_pos = lookup_positions(ids, np.array([row[0] for row in links], dtype=np.int64))
+        price_pos = lookup_positions(keys, np.array([row[1] for row in links], dtype=np.int64))
+        known = (package_pos >= 0) & (price_pos >= 0)
+        sums = np.zeros(len(ids), dtype=np.int64)
+        np.add.at(sums, package_pos[known], prices[price_pos[known]])  # bincount weights would be float64
+        return sums, np.bincount(package_pos[known], minlength=len(ids))
+
+    @staticmethod
+    def _breakdown(costs, row):
+        return {
+            'PackageID': int(costs['ids'][row]), 'PackageName': costs['names'][row],
+            'PackagePrice': from_paise(costs['price'][row]),
+            'Duration': int(costs['duration'][row]), 'No_of_Travelers': int(costs['travelers'][row]),
+            'Hotels': int(costs['hotel_count'][row]), 'HotelPricePerNight': from_paise(costs['hotels'][row]),
+            'Legs': int(costs['leg_count'][row]), 'TransportPrice': from_paise(costs['legs'][row]),
+            'PerTraveller': from_paise(costs['per_traveller'][row]),
+            'Total': from_paise(costs['total'][row]),
+        }
+
+package_pricing = PackagePricing()
+
+@app.route('/packages/<int:package_id>/cost')
+def package_cost(package_id):
+    con = connect_db()
+    if not con:
+        return jsonify({'error': 'Database unavailable.'}), 503
+    try:
+        cost = package_pricing.cost(con, package_id)
+    except mysql.connector.Error as err:
+        return jsonify({'error': str(err)}), 500
+    finally:
+        con.close()
+    if cost is None:
+        return jsonify({'error': f"Package ID {package_id} not found."}), 404
+    return jsonify(cost)
+
+@app.route('/packages/costs')
+def package_costs():
+    con = connect_db()
+    if not con:
+        return jsonify({'error': 'Database unavailable.'}), 503
+    try:
+        costs = package_pricing.all(con)
+    except mysql.connector.Error as err:
+        return jsonify({'error': str(err)}), 500
+    finally:
+        con.close()
+    return jsonify({'packages': costs})
 
 @app.route('/procedures')
 def procedures():
@@ -813,44 +3652,40 @@ def run_procedure():
 
     con = connect_db()
     if con:
-        cur = con.cursor()
         try:
-            # Check if package exists
-            cur.execute("SELECT PackageID FROM TourPackage WHERE PackageID = %s", (int(p_id),))
-            if not cur.fetchone():
+            cost = package_pricing.cost(con, int(p_id))
+            if cost is None:
                 flash(f"Package ID {p_id} does not exist.", "error")
                 return redirect(url_for('procedures'))
-
-            cur.callproc('calculate_package_total_cost', (int(p_id),))
-            results = []
-            for result in cur.stored_results():
-                rows = result.fetchall()
-                results.extend(rows)
-
-            return render_template('procedures.html', procedure_results=results, package_id=p_id)
-
+            return render_template('procedures.html', procedure_results=[cost], package_id=p_id)
         except mysql.connector.Error as err:
-            flash(f"Procedure Error: Failed to execute procedure: {err}", "error")
+            flash(f"Pricing Error: Failed to calculate package cost: {err}", "error")
         finally:
             con.close()
     return redirect(url_for('procedures'))
 
 @app.route('/procedures/run_function', methods=['POST'])
 def run_function():
-    c_id = request.form.get('customer_id')
-    if not validate_int_input(c_id, "Customer ID"): return redirect(url_for('procedures'))
+    ids = parse_id_list(request.form.get('customer_id'))
+    if ids is None:
+        flash("'Customer ID' must be a positive integer (or a comma-separated list of them).", "error")
+        return redirect(url_for('procedures'))
+    if len(ids) > METRICS_MAX_IDS:
+        flash(f"At most {METRICS_MAX_IDS} customer IDs at a time.", "error")
+        return redirect(url_for('procedures'))
 
     con = connect_db()
     if con:
-        cur = con.cursor()
         try:
-            cur.execute(f"SELECT TotalAmountSpent({c_id});")
-            result = cur.fetchone()
-            if result and result[0] is not None:
-                total_spent = f"Total Amount Spent: ₹{result[0]:,.2f}"
-            else:
+            metrics = customer_metrics.get_many(con, ids)
+            rows = [metrics[i] for i in ids if i in metrics]
+            if len(ids) == 1 and rows:
+                total_spent = f"Total Amount Spent: ₹{rows[0]['TotalSpent']:,.2f}"
+            elif len(ids) == 1:
                 total_spent = "Total Amount Spent: ₹0.00 (Customer not found or no payments)"
-            return render_template('procedures.html', function_result=total_spent)
+            else:
+                total_spent = f"Total Amount Spent by {len(rows)} customers: ₹{sum(r['TotalSpent'] for r in rows):,.2f}"
+            return render_template('procedures.html', function_result=total_spent, customer_metrics=rows)
 
         except mysql.connector.Error as err:
             flash(f"Function Error: Failed to execute function: {err}", "error")
@@ -858,114 +3693,243 @@ def run_function():
             con.close()
     return redirect(url_for('procedures'))
 
-@app.route('/queries')
-def queries():
-    return render_template('queries.html')
+# --- Query Summaries ---
+MV_MAX_STALENESS = float(os.environ.get('MV_MAX_STALENESS', 30))  # seconds before the queries page applies pending changes
+MV_BATCH = int(os.environ.get('MV_BATCH', 1000))                  # changelog entries / keys per refresh statement
 
-@app.route('/queries/run_a')
-def run_query_a():
-    con = connect_db()
-    if con:
+MV_DEPENDENTS_SQL = """
+    SELECT c.CustomerID, c.Cname, COUNT(td.DependentName)
+    FROM Customer c
+    LEFT JOIN TravelDependent td ON c.CustomerID = td.CustomerID
+    {where}
+    GROUP BY c.CustomerID, c.Cname
+"""
+MV_STAYS_SQL = """
+    SELECT b.BookingID, i.HotelID, i.TransportID, c.CustomerID, c.Cname, h.HotelName, h.Rating
+    FROM Booking b
+    JOIN Customer c ON b.CustomerID = c.CustomerID
+    JOIN Itinerary i ON b.BookingID = i.BookingID
+    JOIN Hotel h ON i.HotelID = h.HotelID
+    WHERE b.Status IN ('Confirmed', 'Paid') {where}
+"""
+MV_TOP_PACKAGES_SQL = """
+    SELECT PackageID, PackageName, PackagePrice FROM TourPackage
+    ORDER BY PackagePrice DESC LIMIT 3
+"""
+
+class SummaryRefresher:
+    """
+    Keeps the mv_* summary tables behind /queries/run_a, run_b and run_c current.
+    Triggers (migrations/002_query_summaries.sql) queue the key of every changed row in
+    mv_changelog; refresh() recomputes only the summary rows for those keys. The mv_state
+    row is locked while refreshing, so only one worker applies a given batch.
+    """
+    NAME = 'queries'
+
+    def __init__(self, max_staleness=MV_MAX_STALENESS):
+        self.max_staleness = max_staleness
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+
+    def ensure_fresh(self, con, force=None):
+        """Refreshes when stale or forced ('changes' or 'full'); returns the freshness info."""
+        stale = time.monotonic() - self._checked_at >= self.max_staleness
+        # Readers don't queue behind another thread's refresh; they read the current tables.
+        if (force or stale) and self._lock.acquire(blocking=bool(force)):
+            try:
+                self.refresh(con, full=(force == 'full'))
+                self._checked_at = time.monotonic()
+            finally:
+                self._lock.release()
+        return self.freshness(con)
+
+    def refresh(self, con, full=False):
+        """Applies queued changes (or rebuilds everything) in one transaction."""
         cur = con.cursor()
         try:
-            cur.execute("""
-                SELECT c.Cname, COUNT(td.DependentName) AS Total_Dependents
-                FROM Customer c
-                LEFT JOIN TravelDependent td ON c.CustomerID = td.CustomerID
-                GROUP BY c.CustomerID;
-            """)
+            cur.execute("INSERT IGNORE INTO mv_state (Name) VALUES (%s)", (self.NAME,))
+            cur.execute("SELECT Watermark, RefreshedAt FROM mv_state WHERE Name = %s FOR UPDATE", (self.NAME,))
+            watermark, refreshed_at = cur.fetchone()
+            if full or refreshed_at is None:
+                watermark = max(watermark, self._rebuild(cur))
+            else:
+                watermark = max(watermark, self._apply_changes(cur))
+            cur.execute("UPDATE mv_state SET Watermark = %s, RefreshedAt = NOW() WHERE Name = %s",
+                        (watermark, self.NAME))
+            con.commit()
+        except mysql.connector.Error:
+            con.rollback()
+            raise
+
+    def freshness(self, con):
+        cur = con.cursor()
+        cur.execute("SELECT RefreshedAt FROM mv_state WHERE Name = %s", (self.NAME,))
+        row = cur.fetchone()
+        cur.execute("SELECT COUNT(*) FROM mv_changelog")
+        pending = cur.fetchone()[0]
+        return {'refreshed_at': row[0] if row else None, 'pending': pending}
+
+    def _rebuild(self, cur):
+        # Entries committed after this read stay queued and are applied on the next refresh.
+        cur.execute("SELECT ChangeID FROM mv_changelog")
+        change_ids = [row[0] for row in cur.fetchall()]
+        cur.execute("DELETE FROM mv_customer_dependents")
+        cur.execute("INSERT INTO mv_customer_dependents (CustomerID, Cname, Total_Dependents) "
+                    + MV_DEPENDENTS_SQL.format(where=""))
+        cur.execute("DELETE FROM mv_confirmed_stays")
+        cur.execute("INSERT INTO mv_confirmed_stays (BookingID, HotelID, TransportID, CustomerID, Cname, HotelName, Rating) "
+                    + MV_STAYS_SQL.format(where=""))
+        self._rebuild_top_packages(cur)
+        self._delete_changes(cur, change_ids)
+        return max(change_ids, default=0)
+
+    def _apply_changes(self, cur):
+        # Delete by ChangeID rather than by watermark: an entry from a transaction that
+        # commits late can carry a lower ID than ones already applied.
+        watermark = 0
+        while True:
+            cur.execute("SELECT ChangeID, KeyType, RowKey FROM mv_changelog ORDER BY ChangeID LIMIT %s", (MV_BATCH,))
             rows = cur.fetchall()
-            con.close()
-            return render_template('queries.html', query_a_results=rows)
-        except mysql.connector.Error as err:
-            flash(f"Query Error (a): Failed to run query:\n{err}", "error")
-    return redirect(url_for('queries'))
+            if not rows:
+                break
+            keys = {'customer': set(), 'booking': set(), 'hotel': set(), 'package': set()}
+            for _, key_type, row_key in rows:
+                keys[key_type].add(row_key)
 
-@app.route('/queries/run_b')
-def run_query_b():
+            self._resync(cur, 'mv_customer_dependents', 'CustomerID', keys['customer'],
+                         "INSERT INTO mv_customer_dependents (CustomerID, Cname, Total_Dependents) "
+                         + MV_DEPENDENTS_SQL.format(where="WHERE c.CustomerID IN ({ids})"))
+            for column, source, changed in (('CustomerID', 'c.CustomerID', keys['customer']),
+                                            ('BookingID', 'b.BookingID', keys['booking']),
+                                            ('HotelID', 'i.HotelID', keys['hotel'])):
+                # REPLACE: a booking can be re-derived by both its customer and its own key.
+                self._resync(cur, 'mv_confirmed_stays', column, changed,
+                             "REPLACE INTO mv_confirmed_stays (BookingID, HotelID, TransportID, CustomerID, Cname, HotelName, Rating) "
+                             + MV_STAYS_SQL.format(where=f"AND {source} IN ({{ids}})"))
+            if keys['package']:
+                self._rebuild_top_packages(cur)
+
+            self._delete_changes(cur, [row[0] for row in rows])
+            watermark = max(watermark, rows[-1][0])
+        return watermark
+
+    def _resync(self, cur, table, column, keys, insert_sql):
+        keys = sorted(keys)
+        for i in range(0, len(keys), MV_BATCH):
+            chunk = keys[i:i + MV_BATCH]
+            ids = ", ".join(["%s"] * len(chunk))
+            cur.execute(f"DELETE FROM {table} WHERE {column} IN ({ids})", chunk)
+            cur.execute(insert_sql.format(ids=ids), chunk)
+
+    def _rebuild_top_packages(self, cur):
+        cur.execute("DELETE FROM mv_top_packages")
+        cur.execute("INSERT INTO mv_top_packages (PackageID, PackageName, PackagePrice) " + MV_TOP_PACKAGES_SQL)
+
+    def _delete_changes(self, cur, change_ids):
+        for i in range(0, len(change_ids), MV_BATCH):
+            chunk = change_ids[i:i + MV_BATCH]
+            cur.execute(f"DELETE FROM mv_changelog WHERE ChangeID IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+summary_refresher = SummaryRefresher()
+
+def run_summary_query(sql, label):
+    """Reads one summary table after refreshing it as needed. Returns (rows, freshness) or None on error."""
+    force = {'1': 'changes', 'full': 'full'}.get(request.args.get('refresh'))
     con = connect_db()
     if con:
-        cur = con.cursor()
         try:
-            cur.execute("""
-                SELECT PackageName, PackagePrice FROM TourPackage
-                ORDER BY PackagePrice DESC LIMIT 3;
-            """)
-            rows = cur.fetchall()
-            con.close()
-            return render_template('queries.html', query_b_results=rows)
+            freshness = summary_refresher.ensure_fresh(con, force)
+            cur = con.cursor()
+            cur.execute(sql)
+            return cur.fetchall(), freshness
         except mysql.connector.Error as err:
-            flash(f"Query Error (b): Failed to run query:\n{err}", "error")
-    return redirect(url_for('queries'))
+            flash(f"Query Error ({label}): Failed to run query:\n{err}", "error")
+        finally:
+            con.close()
+    return None
+
+@app.route('/queries')
+def queries():
+    return render_template('queries.html')
+
+@app.route('/queries/run_a')
+def run_query_a():
+    result = run_summary_query(
+        "SELECT Cname, Total_Dependents FROM mv_customer_dependents ORDER BY CustomerID", 'a')
+    if result is None:
+        return redirect(url_for('queries'))
+    rows, freshness = result
+    return render_template('queries.html', query_a_results=rows, summary_freshness=freshness)
+
+@app.route('/queries/run_b')
+def run_query_b():
+    result = run_summary_query(
+        "SELECT PackageName, PackagePrice FROM mv_top_packages ORDER BY PackagePrice DESC", 'b')
+    if result is None:
+        return redirect(url_for('queries'))
+    rows, freshness = result
+    return render_template('queries.html', query_b_results=rows, summary_freshness=freshness)
 
 @app.route('/queries/run_c')
 def run_query_c():
-    con = connect_db()
-    if con:
-        cur = con.cursor()
-        try:
-            cur.execute("""
-                SELECT b.BookingID, c.Cname, h.HotelName, h.Rating
-                FROM Booking b
-                JOIN Customer c ON b.CustomerID = c.CustomerID
-                JOIN Itinerary i ON b.BookingID = i.BookingID
-                JOIN Hotel h ON i.HotelID = h.HotelID
-                WHERE b.Status = 'Confirmed' OR b.Status = 'Paid';
-            """)
-            rows = cur.fetchall()
-            con.close()
-            return render_template('queries.html', query_c_results=rows)
-        except mysql.connector.Error as err:
-            flash(f"Query Error (c): Failed to run query:\n{err}", "error")
-    return redirect(url_for('queries'))
+    result = run_summary_query(
+        "SELECT BookingID, Cname, HotelName, Rating FROM mv_confirmed_stays ORDER BY BookingID", 'c')
+    if result is None:
+        return redirect(url_for('queries'))
+    rows, freshness = result
+    return render_template('queries.html', query_c_results=rows, summary_freshness=freshness)
 
 # --- Destinations Routes ---
 @app.route('/destinations')
+@cached_page('Destination')
 def destinations():
     con = connect_db()
     destinations = []
-    next_destination_id = 1
+    pager = None
     if con:
         cur = con.cursor()
         try:
-            cur.execute("SELECT DestinationID, DestinationName, Dlocation FROM Destination;")
-            destinations = cur.fetchall()
-            cur.execute("SELECT MAX(DestinationID) FROM Destination;")
-            max_id = cur.fetchone()[0]
-            next_destination_id = (max_id or 0) + 1
+            destinations, pager = fetch_page(cur, DESTINATION_SELECT, 'DestinationID')
+            if wants_json():
+                return page_json(cur, destinations, pager)
         except Exception as e:
             flash(f"Error loading destinations: {e}", "error")
         finally:
             con.close()
-    return render_template('destinations.html', destinations=destinations, next_destination_id=next_destination_id)
+    return render_template('destinations.html', destinations=destinations, pager=pager)
 
 @app.route('/destinations/view')
+@cached_page('Destination')
 def view_destinations():
     con = connect_db()
     if con:
         cur = con.cursor()
-        cur.execute("SELECT DestinationID, DestinationName, Dlocation FROM Destination;")
-        rows = cur.fetchall()
+        rows, pager = fetch_page(cur, DESTINATION_SELECT, 'DestinationID')
+        if wants_json():
+            response = page_json(cur, rows, pager)
+            con.close()
+            return response
         con.close()
-        return render_template('destinations.html', destinations=rows)
+        return render_template('destinations.html', destinations=rows, pager=pager)
     return render_template('destinations.html', destinations=[])
 
 @app.route('/destinations/add', methods=['POST'])
 @role_required(['admin'])
+@idempotent
 def add_destination():
-    d_id = request.form.get('destination_id')
-    if not validate_int_input(d_id, "Destination ID"): return redirect(url_for('destinations'))
-
     con = connect_db()
     if con:
         cur = con.cursor()
         try:
             cur.execute(
-                "INSERT INTO Destination (DestinationID, DestinationName, Dlocation) VALUES (%s,%s,%s)",
-                (d_id, request.form.get('destination_name'), request.form.get('dlocation'))
+                "INSERT INTO Destination (DestinationName, Dlocation) VALUES (%s,%s)",
+                (request.form.get('destination_name'), request.form.get('dlocation'))
             )
+            d_id = cur.lastrowid
             con.commit()
             flash(f"Destination {d_id} added successfully!", "success")
+            bump_versions('Destination')
+            package_search.changed(con, 'destination', d_id)
         except mysql.connector.Error as err:
             flash(f"Database error: {err}", "error")
         finally:
@@ -974,6 +3938,7 @@ def add_destination():
 
 @app.route('/destinations/delete', methods=['POST'])
 @role_required(['admin'])
+@idempotent
 def delete_destination():
     d_id = request.form.get('destination_id')
     if not validate_int_input(d_id, "Destination ID"): return redirect(url_for('destinations'))
@@ -986,6 +3951,8 @@ def delete_destination():
             if cur.rowcount > 0:
                 con.commit()
                 flash(f"Destination {d_id} deleted successfully!", "success")
+                bump_versions('Destination')
+                package_search.changed(con, 'destination', d_id)
             else:
                 flash(f"Destination ID {d_id} not found.", "warning")
         except mysql.connector.Error as err:
@@ -995,6 +3962,7 @@ def delete_destination():
     return redirect(url_for('destinations'))
 
 @app.route('/destinations/update', methods=['POST'])
+@idempotent
 def update_destination():
     d_id = request.form.get('destination_id')
     if not validate_int_input(d_id, "Destination ID"): return redirect(url_for('destinations'))
@@ -1010,6 +3978,8 @@ def update_destination():
             if cur.rowcount > 0:
                 con.commit()
                 flash(f"Destination {d_id} updated successfully!", "success")
+                bump_versions('Destination')
+                package_search.changed(con, 'destination', d_id)
             else:
                 flash(f"Destination ID {d_id} not found.", "warning")
         except mysql.connector.Error as err:
@@ -1020,53 +3990,60 @@ def update_destination():
 
 # --- Hotels Routes ---
 @app.route('/hotels')
+@cached_page('Hotel')
 def hotels():
     con = connect_db()
     hotels = []
-    next_hotel_id = 1
+    pager = None
     if con:
         cur = con.cursor()
         try:
-            cur.execute("SELECT HotelID, HotelName, Address, Rating, HotelPrice FROM Hotel;")
-            hotels = cur.fetchall()
-            cur.execute("SELECT MAX(HotelID) FROM Hotel;")
-            max_id = cur.fetchone()[0]
-            next_hotel_id = (max_id or 0) + 1
+            hotels, pager = fetch_page(cur, HOTEL_SELECT, 'HotelID')
+            if wants_json():
+                return page_json(cur, hotels, pager)
         except Exception as e:
             flash(f"Error loading hotels: {e}", "error")
         finally:
             con.close()
-    return render_template('hotels.html', hotels=hotels, next_hotel_id=next_hotel_id)
+    return render_template('hotels.html', hotels=hotels, pager=pager)
 
 @app.route('/hotels/view')
+@cached_page('Hotel')
 def view_hotels():
     con = connect_db()
     if con:
         cur = con.cursor()
-        cur.execute("SELECT HotelID, HotelName, Address, Rating, HotelPrice FROM Hotel;")
-        rows = cur.fetchall()
+        rows, pager = fetch_page(cur, HOTEL_SELECT, 'HotelID')
+        if wants_json():
+            response = page_json(cur, rows, pager)
+            con.close()
+            return response
         con.close()
-        return render_template('hotels.html', hotels=rows)
+        return render_template('hotels.html', hotels=rows, pager=pager)
     return render_template('hotels.html', hotels=[])
 
 @app.route('/hotels/add', methods=['POST'])
 @role_required(['admin'])
+@idempotent
 def add_hotel():
-    h_id = request.form.get('hotel_id')
     rating = request.form.get('rating')
     price = request.form.get('hotel_price')
-    if not validate_int_input(h_id, "Hotel ID") or not validate_float_input(rating, "Rating") or not validate_float_input(price, "Hotel Price"): return redirect(url_for('hotels'))
+    rooms = request.form.get('rooms') or str(HOTEL_DEFAULT_ROOMS)
+    if not validate_float_input(rating, "Rating") or not validate_float_input(price, "Hotel Price") or not validate_int_input(rooms, "Rooms"): return redirect(url_for('hotels'))
 
     con = connect_db()
     if con:
         cur = con.cursor()
         try:
             cur.execute(
-                "INSERT INTO Hotel (HotelID, HotelName, Address, Rating, HotelPrice) VALUES (%s,%s,%s,%s,%s)",
-                (h_id, request.form.get('hotel_name'), request.form.get('address'), float(rating), float(price))
+                "INSERT INTO Hotel (HotelName, Address, Rating, HotelPrice, Rooms) VALUES (%s,%s,%s,%s,%s)",
+                (request.form.get('hotel_name'), request.form.get('address'), float(rating), float(price), int(rooms))
             )
+            h_id = cur.lastrowid
             con.commit()
             flash(f"Hotel {h_id} added successfully!", "success")
+            bump_versions('Hotel')
+            package_search.changed(con, 'hotel', h_id)
         except mysql.connector.Error as err:
             flash(f"Database error: {err}", "error")
         finally:
@@ -1075,6 +4052,7 @@ def add_hotel():
 
 @app.route('/hotels/delete', methods=['POST'])
 @role_required(['admin'])
+@idempotent
 def delete_hotel():
     h_id = request.form.get('hotel_id')
     if not validate_int_input(h_id, "Hotel ID"): return redirect(url_for('hotels'))
@@ -1087,6 +4065,8 @@ def delete_hotel():
             if cur.rowcount > 0:
                 con.commit()
                 flash(f"Hotel {h_id} deleted successfully!", "success")
+                bump_versions('Hotel')
+                package_search.changed(con, 'hotel', h_id)
             else:
                 flash(f"Hotel ID {h_id} not found.", "warning")
         except mysql.connector.Error as err:
@@ -1096,80 +4076,277 @@ def delete_hotel():
     return redirect(url_for('hotels'))
 
 @app.route('/hotels/update', methods=['GET', 'POST'])
+@idempotent
 def update_hotel():
     if request.method == 'GET':
         return redirect(url_for('hotels'))
     h_id = request.form.get('hotel_id')
     rating = request.form.get('rating')
     price = request.form.get('hotel_price')
+    rooms = request.form.get('rooms') or None  # left blank: keep the current capacity
     if not validate_int_input(h_id, "Hotel ID") or not validate_float_input(rating, "Rating") or not validate_float_input(price, "Hotel Price"): return redirect(url_for('hotels'))
+    if rooms is not None and not validate_int_input(rooms, "Rooms"): return redirect(url_for('hotels'))
 
     con = connect_db()
     if con:
         cur = con.cursor()
         try:
+            if rooms is not None:
+                check_capacity(cur, int(h_id), int(rooms))
             cur.execute(
-                "UPDATE Hotel SET HotelName=%s, Address=%s, Rating=%s, HotelPrice=%s WHERE HotelID=%s",
-                (request.form.get('hotel_name'), request.form.get('address'), float(rating), float(price), h_id)
+                "UPDATE Hotel SET HotelName=%s, Address=%s, Rating=%s, HotelPrice=%s, Rooms=COALESCE(%s, Rooms) WHERE HotelID=%s",
+                (request.form.get('hotel_name'), request.form.get('address'), float(rating), float(price), int(rooms) if rooms else None, h_id)
             )
             if cur.rowcount > 0:
                 con.commit()
                 flash(f"Hotel {h_id} updated successfully!", "success")
+                bump_versions('Hotel')
+                package_search.changed(con, 'hotel', h_id)
             else:
+                con.rollback()
                 flash(f"Hotel ID {h_id} not found.", "warning")
         except mysql.connector.Error as err:
+            con.rollback()
             flash(f"Database error: {err}", "error")
+        except ValueError as err:
+            con.rollback()
+            flash(str(err), "error")
         finally:
             con.close()
     return redirect(url_for('hotels'))
 
+# --- Hotel Inventory ---
+HOTEL_DEFAULT_ROOMS = int(os.environ.get('HOTEL_DEFAULT_ROOMS', 10))  # rooms for hotels added without a count
+INVENTORY_DAYS = int(os.environ.get('INVENTORY_DAYS', 400))           # nights indexed, starting INVENTORY_PAST_DAYS ago
+INVENTORY_PAST_DAYS = int(os.environ.get('INVENTORY_PAST_DAYS', 30))
+INVENTORY_STAMPS = ('Itinerary', 'Hotel')
+
+class RoomInventory:
+    """
+    Rooms taken per hotel per night as a hotels x nights matrix starting at `start`.
+    Each stay occupies one room on every night from check-in up to (not including)
+    check-out. Built with one difference array and a cumulative sum.
+    """
+    def __init__(self, hotel_ids, rooms, stays, start, days):
+        self.hotel_ids = np.asarray(hotel_ids, dtype=np.int64)  # sorted
+        self.rooms = np.asarray(rooms, dtype=np.int32)
+        self.start, self.days = start, days
+        hotels, first, last = self._positions(stays)
+        diff = np.zeros((len(self.hotel_ids), days + 1), dtype=np.int32)
+        np.add.at(diff, (hotels, first), 1)
+        np.add.at(diff, (hotels, last), -1)
+        self.taken = np.cumsum(diff[:, :days], axis=1, dtype=np.int32)
+
+    def _positions(self, stays):
+        """Matrix rows and clipped night columns for (HotelID, CheckInDate, CheckOutDate) stays."""
+        hotels = lookup_positions(self.hotel_ids, np.array([s[0] for s in stays], dtype=np.int64))
+        first = np.array([(s[1] - self.start).days for s in stays], dtype=np.int64)
+        last = np.array([(s[2] - self.start).days for s in stays], dtype=np.int64)
+        first, last = np.clip(first, 0, self.days), np.clip(last, 0, self.days)
+        keep = (hotels >= 0) & (first < last)
+        return hotels[keep], first[keep], last[keep]
+
+    def nights(self, check_in, check_out):
+        """Column range for [check_in, check_out); ValueError when outside the indexed nights."""
+        first, last = (check_in - self.start).days, (check_out - self.start).days
+        if first < 0 or last > self.days or first >= last:
+            end = self.start + timedelta(days=self.days)
+            raise ValueError(f"Dates must fall between {self.start.isoformat()} and {end.isoformat()}.")
+        return first, last
+
+    def available(self, check_in, check_out, rooms=1):
+        """(HotelIDs, free rooms) for every hotel with `rooms` free on each night of the stay."""
+        first, last = self.nights(check_in, check_out)
+        free = self.rooms - self.taken[:, first:last].max(axis=1)
+        fits = np.flatnonzero(free >= rooms)
+        return self.hotel_ids[fits], free[fits]
+
+    def book(self, hotel_id, check_in, check_out, rooms=1):
+        hotels, first, last = self._positions([(hotel_id, check_in, check_out)])
+        for row, a, b in zip(hotels, first, last):
+            self.taken[row, a:b] += rooms
+
+def peak_occupancy(stays, check_in, check_out):
+    """Most rooms taken on any night of [check_in, check_out) by (CheckInDate, CheckOutDate) stays."""
+    events = []
+    for first, last in stays:
+        events.append((max(first, check_in), 1))
+        events.append((min(last, check_out), -1))
+    peak = taken = 0
+    for _, change in sorted(events):  # on the same day a check-out (-1) frees the room first
+        taken += change
+        peak = max(peak, taken)
+    return peak
+
+class HotelInventory:
+    """
+    The shared RoomInventory, rebuilt when the Itinerary or Hotel stamp changes or the
+    indexed window moves to a new day. Bookings made by this worker are applied in place.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.inventory = None
+        self._versions = None
+
+    def get(self, con):
+        versions = tuple(data_version(name).current() for name in INVENTORY_STAMPS)
+        start = datetime.now().date() - timedelta(days=INVENTORY_PAST_DAYS)
+        with self._lock:
+            inventory = self.inventory
+            if inventory is not None and versions == self._versions and inventory.start == start:
+                return inventory
+        inventory = self._load(con.cursor(), start)
+        with self._lock:
+            self.inventory, self._versions = inventory, versions
+        return inventory
+
+    def booked(self, hotel_id, check_in, check_out):
+        """Records a committed stay; call after bumping the Itinerary stamp."""
+        with self._lock:
+            if self.inventory is None:
+                return
+            self.inventory.book(hotel_id, check_in, check_out)
+            # As with the search index, adopt the bumped stamp; a concurrent bump from
+            # another worker is picked up on the next day's rebuild at the latest.
+            self._versions = tuple(data_version(name).current() for name in INVENTORY_STAMPS)
+
+    def _load(self, cur, start):
+        end = start + timedelta(days=INVENTORY_DAYS)
+        cur.execute("SELECT HotelID, Rooms FROM Hotel ORDER BY HotelID")
+        hotels = cur.fetchall()
+        cur.execute(
+            "SELECT HotelID, CheckInDate, CheckOutDate FROM Itinerary "
+            "WHERE CheckInDate < %s AND CheckOutDate > %s AND CheckOutDate > CheckInDate",
+            (end, start)
+        )
+        return RoomInventory([h[0] for h in hotels], [h[1] for h in hotels], cur.fetchall(), start, INVENTORY_DAYS)
+
+hotel_inventory = HotelInventory()
+
+def reserve_room(cur, hotel_id, check_in, check_out):
+    """
+    Locks the hotel row and checks every night of the stay against Rooms, inside the
+    caller's transaction. Concurrent reservations for the same hotel queue on the lock,
+    so two agents cannot both take the last room. Raises ValueError when full.
+    """
+    cur.execute("SELECT Rooms FROM Hotel WHERE HotelID = %s FOR UPDATE", (hotel_id,))
+    row = cur.fetchone()
+    if row is None:
+        raise ValueError(f"Hotel ID {hotel_id} does not exist.")
+    cur.execute(
+        "SELECT CheckInDate, CheckOutDate FROM Itinerary "
+        "WHERE HotelID = %s AND CheckInDate < %s AND CheckOutDate > %s",
+        (hotel_id, check_out, check_in)
+    )
+    if peak_occupancy(cur.fetchall(), check_in, check_out) >= row[0]:
+        raise ValueError(f"Hotel {hotel_id} has no rooms free for {check_in.isoformat()} to {check_out.isoformat()}.")
+
+def check_capacity(cur, hotel_id, rooms):
+    """
+    Locks the hotel row, as reserve_room does, and raises ValueError if its stays from
+    today on already need more than `rooms` rooms on some night.
+    """
+    cur.execute("SELECT Rooms FROM Hotel WHERE HotelID = %s FOR UPDATE", (hotel_id,))
+    if cur.fetchone() is None:
+        return  # the UPDATE reports the missing hotel
+    today = datetime.now().date()
+    cur.execute("SELECT CheckInDate, CheckOutDate FROM Itinerary WHERE HotelID = %s AND CheckOutDate > %s", (hotel_id, today))
+    stays = cur.fetchall()
+    if stays:
+        peak = peak_occupancy(stays, today, max(last for _, last in stays))
+        if peak > rooms:
+            raise ValueError(f"Hotel {hotel_id} already has {peak} rooms booked on one night; Rooms cannot go below that.")
+
+def parse_stay(check_in, check_out):
+    """Parses ISO check-in/check-out dates; ValueError unless check-out is after check-in."""
+    try:
+        first, last = datetime.strptime(check_in or '', '%Y-%m-%d').date(), datetime.strptime(check_out or '', '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError("Check-in and check-out must be dates (YYYY-MM-DD).")
+    if last <= first:
+        raise ValueError("Check-out must be after check-in.")
+    return first, last
+
+@app.route('/hotels/availability')
+def hotel_availability():
+    rooms = request.args.get('rooms', '1')
+    if not is_positive_int(rooms):
+        return jsonify({'error': "'rooms' must be a positive integer."}), 400
+    try:
+        check_in, check_out = parse_stay(request.args.get('check_in'), request.args.get('check_out'))
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
+
+    con = connect_db()
+    if not con:
+        return jsonify({'error': 'Database unavailable.'}), 503
+    try:
+        inventory = hotel_inventory.get(con)
+    except mysql.connector.Error as err:
+        return jsonify({'error': str(err)}), 500
+    finally:
+        con.close()
+    try:
+        hotel_ids, free = inventory.available(check_in, check_out, int(rooms))
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
+    return jsonify({
+        'check_in': check_in.isoformat(), 'check_out': check_out.isoformat(), 'rooms': int(rooms),
+        'hotels': [{'HotelID': h, 'FreeRooms': f} for h, f in zip(hotel_ids.tolist(), free.tolist())],
+    })
+
 # --- Transport Routes ---
 @app.route('/transports')
+@cached_page('Transport')
 def transports():
     con = connect_db()
     transports = []
-    next_transport_id = 1
+    pager = None
     if con:
         cur = con.cursor()
         try:
-            cur.execute("SELECT TransportID, TransportType, DepartLocation, ArrivalLocation, DepartDateTime, ArrivalDateTime, TransportPrice FROM Transport;")
-            transports = cur.fetchall()
-            cur.execute("SELECT MAX(TransportID) FROM Transport;")
-            max_id = cur.fetchone()[0]
-            next_transport_id = (max_id or 0) + 1
+            transports, pager = fetch_page(cur, TRANSPORT_SELECT, 'TransportID')
+            if wants_json():
+                return page_json(cur, transports, pager)
         except Exception as e:
             flash(f"Error loading transports: {e}", "error")
         finally:
             con.close()
-    return render_template('transports.html', transports=transports, next_transport_id=next_transport_id)
+    return render_template('transports.html', transports=transports, pager=pager)
 
 @app.route('/transports/view')
+@cached_page('Transport')
 def view_transports():
     con = connect_db()
     if con:
         cur = con.cursor()
-        cur.execute("SELECT TransportID, TransportType, DepartLocation, ArrivalLocation, DepartDateTime, ArrivalDateTime, TransportPrice FROM Transport;")
-        rows = cur.fetchall()
+        rows, pager = fetch_page(cur, TRANSPORT_SELECT, 'TransportID')
+        if wants_json():
+            response = page_json(cur, rows, pager)
+            con.close()
+            return response
         con.close()
-        return render_template('transports.html', transports=rows)
+        return render_template('transports.html', transports=rows, pager=pager)
     return render_template('transports.html', transports=[])
 
 @app.route('/transports/add', methods=['POST'])
 @role_required(['admin'])
+@idempotent
 def add_transport():
-    t_id = request.form.get('transport_id')
-    if not validate_int_input(t_id, "Transport ID"): return redirect(url_for('transports'))
-
     con = connect_db()
     if con:
         cur = con.cursor()
         try:
             cur.execute(
-                "INSERT INTO Transport (TransportID, TransportType, DepartLocation, ArrivalLocation, DepartDateTime, ArrivalDateTime, TransportPrice) VALUES (%s,%s,%s,%s,%s,%s,%s)",
-                (t_id, request.form.get('transport_type'), request.form.get('depart_location'), request.form.get('arrival_location'), request.form.get('depart_datetime'), request.form.get('arrival_datetime'), request.form.get('transport_price'))
+                "INSERT INTO Transport (TransportType, DepartLocation, ArrivalLocation, DepartDateTime, ArrivalDateTime, TransportPrice) VALUES (%s,%s,%s,%s,%s,%s)",
+                (request.form.get('transport_type'), request.form.get('depart_location'), request.form.get('arrival_location'), request.form.get('depart_datetime'), request.form.get('arrival_datetime'), request.form.get('transport_price'))
             )
+            t_id = cur.lastrowid
             con.commit()
             flash(f"Transport {t_id} added successfully!", "success")
+            bump_versions('Transport')
+            package_search.changed(con, 'transport', t_id)
+            journey_planner.refresh()
         except mysql.connector.Error as err:
             flash(f"Database error: {err}", "error")
         finally:
@@ -1178,6 +4355,7 @@ def add_transport():
 
 @app.route('/transports/delete', methods=['POST'])
 @role_required(['admin'])
+@idempotent
 def delete_transport():
     t_id = request.form.get('transport_id')
     if not validate_int_input(t_id, "Transport ID"): return redirect(url_for('transports'))
@@ -1190,6 +4368,9 @@ def delete_transport():
             if cur.rowcount > 0:
                 con.commit()
                 flash(f"Transport {t_id} deleted successfully!", "success")
+                bump_versions('Transport')
+                package_search.changed(con, 'transport', t_id)
+                journey_planner.refresh()
             else:
                 flash(f"Transport ID {t_id} not found.", "warning")
         except mysql.connector.Error as err:
@@ -1199,6 +4380,7 @@ def delete_transport():
     return redirect(url_for('transports'))
 
 @app.route('/transports/update', methods=['GET', 'POST'])
+@idempotent
 def update_transport():
     if request.method == 'GET':
         return redirect(url_for('transports'))
@@ -1217,6 +4399,9 @@ def update_transport():
             if cur.rowcount > 0:
                 con.commit()
                 flash(f"Transport {t_id} updated successfully!", "success")
+                bump_versions('Transport')
+                package_search.changed(con, 'transport', t_id)
+                journey_planner.refresh()
             else:
                 flash(f"Transport ID {t_id} not found.", "warning")
         except mysql.connector.Error as err:
@@ -1225,5 +4410,736 @@ def update_transport():
             con.close()
     return redirect(url_for('transports'))
 
+# --- Journey Planner ---
+PLANNER_MIN_LAYOVER = int(os.environ.get('PLANNER_MIN_LAYOVER', 30))  # minutes between connecting legs
+PLANNER_WINDOW = int(os.environ.get('PLANNER_WINDOW', 48))            # hours searched when arrive_by is not given
+EPOCH = datetime(1970, 1, 1)
+
+# Times as naive seconds since 1970-01-01, so no time zone conversion happens on either side.
+TRANSPORT_CONNECTIONS_SQL = """
+    SELECT TransportID, TransportType, DepartLocation, ArrivalLocation,
+           TIMESTAMPDIFF(SECOND, '1970-01-01', DepartDateTime),
+           TIMESTAMPDIFF(SECOND, '1970-01-01', ArrivalDateTime), TransportPrice
+    FROM Transport
+    WHERE DepartLocation IS NOT NULL AND ArrivalLocation IS NOT NULL
+      AND DepartDateTime IS NOT NULL AND ArrivalDateTime >= DepartDateTime
+"""
+
+def to_seconds(value):
+    return int((value - EPOCH).total_seconds())
+
+class TransportGraph:
+    """
+    Time-dependent graph over the Transport rows. Connections are sorted by
+    (from, to, departure), so each stop pair is a slice of the arrays; a per-slice
+    suffix minimum of arrival times answers "earliest arrival when leaving at or
+    after t" with one binary search, whatever the number of rows.
+    """
+    def __init__(self, rows):
+        self.stops = {}  # lower-cased location -> stop number
+        self.names = []
+        frm = np.array([self._stop(r[2]) for r in rows], dtype=np.int64)
+        to = np.array([self._stop(r[3]) for r in rows], dtype=np.int64)
+        dep = np.array([r[4] for r in rows], dtype=np.int64)
+        arr = np.array([r[5] for r in rows], dtype=np.int64)
+        order = np.lexsort((dep, to, frm))
+        frm, to, dep, arr = frm[order], to[order], dep[order], arr[order]
+        self.frm, self.to = frm, to
+        self.transport_ids = np.array([r[0] for r in rows], dtype=np.int64)[order]
+        self.types = [rows[i][1] for i in order.tolist()]
+        self.prices = array('d', (float(rows[i][6] or 0) for i in order.tolist()))
+        self.dep = array('q', dep.tolist())
+        self.arr = array('q', arr.tolist())
+
+        n = len(rows)
+        starts = np.flatnonzero(np.r_[True, (frm[1:] != frm[:-1]) | (to[1:] != to[:-1])]) if n else np.array([], dtype=np.int64)
+        ends = np.r_[starts[1:], n]
+        self.out = [[] for _ in self.names]  # stop -> [(next stop, first, end)]
+        for s, e in zip(starts.tolist(), ends.tolist()):
+            self.out[int(frm[s])].append((int(to[s]), s, e))
+
+        # Suffix minimum of arrival (and where it occurs) within each slice, in one pass:
+        # offsetting every slice by segment * span keeps the running minimum from crossing slices.
+        segment = np.repeat(np.arange(len(starts), dtype=np.int64), ends - starts)
+        span = int(arr.max() - arr.min()) + 1 if n else 1
+        key = (segment * span + (arr - (arr.min() if n else 0)))[::-1]
+        running = np.minimum.accumulate(key)
+        where = np.maximum.accumulate(np.where(key == running, np.arange(n), 0))
+        self.best_arr = array('q', (running - segment[::-1] * span + (arr.min() if n else 0))[::-1].tolist())
+        self.best_at = array('q', (n - 1 - where)[::-1].tolist())
+
+    def _stop(self, name):
+        key = name.strip().lower()
+        stop = self.stops.get(key)
+        if stop is None:
+            stop = self.stops[key] = len(self.names)
+            self.names.append(name.strip())
+        return stop
+
+    def __len__(self):
+        return len(self.dep)
+
+    def earliest(self, origin, target, start, end, layover):
+        """Earliest-arrival journey as a list of connection positions, or None."""
+        src, dst = self.stops.get(origin.strip().lower()), self.stops.get(target.strip().lower())
+        if src is None or dst is None:
+            return None
+        dep, best_arr, best_at = self.dep, self.best_arr, self.best_at
+        arrival = {src: start}
+        came_by = {}
+        heap = [(start, src)]
+        while heap:
+            t, u = heapq.heappop(heap)
+            if t > arrival[u]:
+                continue
+            if u == dst:
+                break
+            ready = t if u == src else t + layover
+            for v, s, e in self.out[u]:
+                i = bisect.bisect_left(dep, ready, s, e)
+                if i == e:
+                    continue
+                a = best_arr[i]
+                if a <= end and a < arrival.get(v, a + 1):
+                    arrival[v] = a
+                    came_by[v] = (u, best_at[i])
+                    heapq.heappush(heap, (a, v))
+        if dst not in came_by:
+            return None
+        legs, stop = [], dst
+        while stop != src:
+            stop, leg = came_by[stop]
+            legs.append(leg)
+        return legs[::-1]
+
+    def cheapest(self, origin, target, start, end, layover):
+        """
+        Cheapest journey departing at or after start and arriving by end, as a list of
+        connection positions, or None. Labels are expanded in price order; a label is
+        dropped once its stop has been reached as cheaply and no later.
+        """
+        src, dst = self.stops.get(origin.strip().lower()), self.stops.get(target.strip().lower())
+        if src is None or dst is None:
+            return None
+        dep, arr, prices, best_arr = self.dep, self.arr, self.prices, self.best_arr
+        settled = {}  # stop -> earliest arrival among the cheaper labels already expanded
+        heap = [(0.0, start, src, None)]
+        while heap:
+            cost, t, u, trail = heapq.heappop(heap)
+            if t >= settled.get(u, end + 1):
+                continue
+            settled[u] = t
+            if u == dst:
+                legs = []
+                while trail:
+                    leg, trail = trail
+                    legs.append(leg)
+                return legs[::-1]
+            ready = t if u == src else t + layover
+            for v, s, e in self.out[u]:
+                i = bisect.bisect_left(dep, ready, s, e)
+                if i == e or best_arr[i] > end:
+                    continue
+                limit = settled.get(v, end + 1)
+                front = []  # (price, arrival) already pushed for this stop pair
+                for j in range(i, e):
+                    if dep[j] > end:
+                        break
+                    a = arr[j]
+                    if a >= limit or a > end:
+                        continue
+                    p = cost + prices[j]
+                    if any(fp <= p and fa <= a for fp, fa in front):
+                        continue
+                    front.append((p, a))
+                    heapq.heappush(heap, (p, a, v, (j, trail)))
+        return None
+
+    def journey(self, legs):
+        if legs is None:
+            return None
+        rows = [{
+            'TransportID': int(self.transport_ids[j]), 'TransportType': self.types[j],
+            'DepartLocation': self.names[int(self.frm[j])], 'ArrivalLocation': self.names[int(self.to[j])],
+            'DepartDateTime': (EPOCH + timedelta(seconds=self.dep[j])).isoformat(),
+            'ArrivalDateTime': (EPOCH + timedelta(seconds=self.arr[j])).isoformat(),
+            'TransportPrice': round(self.prices[j], 2),
+        } for j in legs]
+        return {
+            'legs': rows,
+            'depart': rows[0]['DepartDateTime'], 'arrive': rows[-1]['ArrivalDateTime'],
+            'duration_minutes': (self.arr[legs[-1]] - self.dep[legs[0]]) // 60,
+            'total_price': round(sum(self.prices[j] for j in legs), 2),
+        }
+
+class JourneyPlanner:
+    """
+    The shared TransportGraph. add/update/delete_transport call refresh(); other
+    workers notice the Transport stamp change. Rebuilds run in the background while
+    the previous graph keeps answering.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.graph = None
+        self._version = None
+        self._building = False
+
+    def get(self):
+        version = data_version('Transport').current()
+        with self._lock:
+            graph, current = self.graph, self._version
+        if graph is None:
+            return self._build(version)
+        if version != current:
+            self.refresh()
+        return graph
+
+    def refresh(self):
+        """Starts a background rebuild unless one is already running."""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._build, args=(data_version('Transport').current(), True), daemon=True).start()
+
+    def _build(self, version, background=False):
+        try:
+            con = get_pool('admin').acquire()
+            try:
+                cur = con.cursor()
+                cur.execute(TRANSPORT_CONNECTIONS_SQL)
+                graph = TransportGraph(cur.fetchall())
+            finally:
+                con.close()
+            with self._lock:
+                self.graph, self._version = graph, version
+            return graph
+        finally:
+            if background:
+                with self._lock:
+                    self._building = False
+
+journey_planner = JourneyPlanner()
+
+def parse_plan_args(args):
+    """Validates /transports/plan parameters. Returns (origin, target, start, end, layover seconds)."""
+    origin, target = (args.get('from') or '').strip(), (args.get('to') or '').strip()
+    if not origin or not target:
+        raise ValueError("'from' and 'to' are required.")
+    try:
+        start = datetime.fromisoformat(args['depart_after']) if args.get('depart_after') else datetime.now()
+        end = datetime.fromisoformat(args['arrive_by']) if args.get('arrive_by') else start + timedelta(hours=PLANNER_WINDOW)
+    except ValueError:
+        raise ValueError("'depart_after' and 'arrive_by' must be ISO dates, e.g. 2025-03-20T08:00.")
+    # Transport times are naive local DATETIMEs: convert offsets (e.g. 2025-03-20T08:00+05:30) to local time
+    start, end = (t.astimezone().replace(tzinfo=None) if t.tzinfo else t for t in (start, end))
+    if end <= start:
+        raise ValueError("'arrive_by' must be after 'depart_after'.")
+    layover = args.get('min_layover', str(PLANNER_MIN_LAYOVER))
+    if not (layover == '0' or is_positive_int(layover)):
+        raise ValueError("'min_layover' must be a whole number of minutes.")
+    return origin, target, to_seconds(start), to_seconds(end), int(layover) * 60
+
+@app.route('/transports/plan')
+def plan_journey():
+    try:
+        origin, target, start, end, layover = parse_plan_args(request.args)
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
+    try:
+        graph = journey_planner.get()
+    except (mysql.connector.Error, PoolExhaustedError) as err:
+        return jsonify({'error': str(err)}), 503
+    started = time.perf_counter()
+    earliest = graph.journey(graph.earliest(origin, target, start, end, layover))
+    cheapest = graph.journey(graph.cheapest(origin, target, start, end, layover))
+    return jsonify({
+        'from': origin, 'to': target,
+        'earliest': earliest, 'cheapest': cheapest,
+        'took_ms': round((time.perf_counter() - started) * 1000, 3),
+    })
+
+# --- JSON API ---
+API_PREFIX = '/api/v1'
+
+# resource: (table, key columns, SELECT, roles allowed to read it)
+API_RESOURCES = {
+    'customers': ('Customer', ('CustomerID',), CUSTOMER_SELECT, ['admin', 'agent', 'accountant']),
+    'bookings': ('Booking', ('BookingID',), BOOKING_SELECT, ['admin', 'agent', 'accountant']),
+    'payments': ('Payment', ('PaymentID',), PAYMENT_SELECT, ['admin', 'accountant']),
+    'packages': ('TourPackage', ('PackageID',), PACKAGE_SELECT, ['admin', 'agent', 'accountant']),
+    'hotels': ('Hotel', ('HotelID',), HOTEL_SELECT, ['admin', 'agent', 'accountant']),
+    'transports': ('Transport', ('TransportID',), TRANSPORT_SELECT, ['admin', 'agent', 'accountant']),
+    'destinations': ('Destination', ('DestinationID',), DESTINATION_SELECT, ['admin', 'agent', 'accountant']),
+    'itineraries': ('Itinerary', ('BookingID', 'HotelID', 'TransportID'), ITINERARY_SELECT, ['admin', 'agent']),
+}
+
+def select_columns(select):
+    return select[len('SELECT '):select.index(' FROM ')].split(', ')
+
+def api_error(message, status=400):
+    return jsonify({'error': message}), status
+
+def api_fields(columns, key, args):
+    """Columns named by ?fields= (the key columns always included), or all of them. None if any is unknown."""
+    raw = args.get('fields')
+    if not raw:
+        return list(columns)
+    wanted = [f.strip() for f in raw.split(',') if f.strip()]
+    if any(f not in columns for f in wanted):
+        return None
+    return list(dict.fromkeys(list(key) + wanted))
+
+def api_cursor(raw, key):
+    """Parses an ?after=/?before= cursor: the key values joined by '-'. Returns () when absent, None when invalid."""
+    if raw is None:
+        return ()
+    parts = raw.split('-')
+    if len(parts) != len(key) or not all(is_positive_int(p) for p in parts):
+        return None
+    return tuple(int(p) for p in parts)
+
+def api_item(columns, row):
+    return {c: v.isoformat() if isinstance(v, date) else v for c, v in zip(columns, row)}
+
+def api_key(key, row):
+    return row[0] if len(key) == 1 else '-'.join(str(v) for v in row[:len(key)])
+
+def api_plan(key, select, args, item_id=None):
+    """
+    Turns ?fields=, ?ids=, the cursors and ?limit= (or a single item_id) into the query
+    to run. Returns (plan, error message). Shared by the WSGI views and asgi.py.
+    """
+    columns = select_columns(select)
+    fields = api_fields(columns, key, args)
+    if fields is None:
+        return None, f"Unknown field in fields=. Available: {', '.join(columns)}"
+    query = f"SELECT {', '.join(fields)}{select[select.index(' FROM '):]}"
+    order = ', '.join(key)
+    plan = {'fields': fields, 'item': item_id is not None, 'ids': None, 'after': (), 'before': ()}
+
+    if item_id is not None:
+        plan.update(sql=f"{query} WHERE {key[0]} = %s", params=(item_id,))
+        return plan, None
+    if args.get('ids'):
+        ids = parse_id_list(args['ids'])
+        if ids is None:
+            return None, "ids= must be a comma-separated list of positive integers."
+        if len(ids) > MAX_PAGE_SIZE:
+            return None, f"At most {MAX_PAGE_SIZE} ids per request."
+        placeholders = ", ".join(["%s"] * len(ids))
+        plan.update(ids=ids, sql=f"{query} WHERE {key[0]} IN ({placeholders}) ORDER BY {order}", params=tuple(ids))
+        return plan, None
+
+    after = api_cursor(args.get('after'), key)
+    before = api_cursor(args.get('before'), key)
+    if after is None or before is None:
+        return None, f"Cursors are {'-'.join(key)} values."
+    limit = max(1, min(args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    row_key = f"({order})"
+    marks = f"({', '.join(['%s'] * len(key))})"
+    if before:
+        sql = f"{query} WHERE {row_key} < {marks} ORDER BY {', '.join(k + ' DESC' for k in key)} LIMIT %s"
+        params = (*before, limit + 1)
+    elif after:
+        sql, params = f"{query} WHERE {row_key} > {marks} ORDER BY {order} LIMIT %s", (*after, limit + 1)
+    else:
+        sql, params = f"{query} ORDER BY {order} LIMIT %s", (limit + 1,)
+    plan.update(sql=sql, params=params, after=after, before=before, limit=limit)
+    return plan, None
+
+def api_result(key, plan, rows):
+    """The JSON body for the rows a plan fetched; None when a single item was not found."""
+    fields = plan['fields']
+    if plan['item']:
+        return api_item(fields, rows[0]) if rows else None
+    if plan['ids'] is not None:
+        found = {row[0] for row in rows}
+        return {'items': [api_item(fields, row) for row in rows], 'missing': [i for i in plan['ids'] if i not in found]}
+    limit = plan['limit']
+    if plan['before']:
+        has_prev, has_next = len(rows) > limit, True
+        rows = rows[:limit][::-1]
+    else:
+        has_prev, has_next = bool(plan['after']), len(rows) > limit
+        rows = rows[:limit]
+    return {
+        'items': [api_item(fields, row) for row in rows],
+        'next_cursor': api_key(key, rows[-1]) if rows and has_next else None,
+        'prev_cursor': api_key(key, rows[0]) if rows and has_prev else None,
+        'limit': limit,
+    }
+
+def api_connection():
+    """A pooled connection for the caller's role, or an error response."""
+    try:
+        return get_pool(session['role']).acquire(), None
+    except PoolExhaustedError as e:
+        return None, api_error(f"Database busy: {e}", 503)
+    except Exception as e:
+        return None, api_error(f"Database unavailable: {e}", 503)
+
+def api_view(table, key, select):
+    """The view function for one resource's list (and, given item_id, single-item) endpoint."""
+    def view(item_id=None):
+        plan, message = api_plan(key, select, request.args, item_id)
+        if message:
+            return api_error(message)
+        con, error = api_connection()
+        if error:
+            return error
+        cur = con.cursor()
+        try:
+            cur.execute(plan['sql'], plan['params'])
+            rows = cur.fetchall()
+        except mysql.connector.Error as err:
+            return api_error(f"Database error: {err}", 500)
+        finally:
+            con.close()
+        body = api_result(key, plan, rows)
+        if body is None:
+            return api_error(f"{table} {item_id} not found.", 404)
+        return jsonify(body)
+    return view
+
+for _name, (_table, _key, _select, _roles) in API_RESOURCES.items():
+    _view = role_required(_roles)(cached_page(_table)(api_view(_table, _key, _select)))
+    app.add_url_rule(f'{API_PREFIX}/{_name}', f'api_{_name}', _view)
+    if len(_key) == 1:
+        app.add_url_rule(f'{API_PREFIX}/{_name}/<int:item_id>', f'api_{_name}_item', _view)
+
+# --- Export Routes ---
+EXPORT_BATCH = int(os.environ.get('EXPORT_BATCH', 1000))  # rows pulled from the server per fetchmany()
+
+# dataset: (query, roles allowed to export it)
+EXPORTS = {
+    'bookings': (f"{BOOKING_SELECT} ORDER BY BookingID", ['admin', 'agent', 'accountant']),
+    'payments': (f"{PAYMENT_SELECT} ORDER BY PaymentID", ['admin', 'accountant']),
+    'booking_details': (
+        "SELECT BookingID, BookingDate, Status, CustomerID, Cname, PackageID, PackageName, PackagePrice FROM vw_booking_details",
+        ['admin', 'agent', 'accountant'],
+    ),
+}
+
+def stream_rows(cur, columns, fmt):
+    """Yields the rows of an unbuffered cursor as CSV or NDJSON text, one batch at a time."""
+    if fmt == 'csv':
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(columns)
+        while True:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+            rows = cur.fetchmany(EXPORT_BATCH)
+            if not rows:
+                return
+            writer.writerows(rows)
+    else:
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH)
+            if not rows:
+                return
+            yield "".join(json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in rows)
+
+@app.route('/export/<dataset>.<fmt>')
+@role_required(['admin', 'agent', 'accountant'])
+def export_data(dataset, fmt):
+    if dataset not in EXPORTS or fmt not in ('csv', 'ndjson'):
+        abort(404)
+    query, roles = EXPORTS[dataset]
+    if session['role'] not in roles:
+        flash("You do not have permission to export this data.", "error")
+        return redirect(url_for('index'))
+
+    con = connect_db()
+    if not con:
+        return redirect(url_for('index'))
+    # The default cursor is unbuffered: rows stay on the server until fetched.
+    cur = con.cursor()
+    try:
+        cur.execute(query)
+    except mysql.connector.Error as err:
+        con.close()
+        flash(f"Export Error: {err}", "error")
+        return redirect(url_for('index'))
+    columns = list(cur.column_names)
+
+    def generate():
+        try:
+            yield from stream_rows(cur, columns, fmt)
+        finally:
+            con.close()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={dataset}.{fmt}'})
+
+# --- Bulk Import ---
+IMPORT_BATCH = int(os.environ.get('IMPORT_BATCH', 500))           # rows per executemany() and transaction
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', 1000))  # rejected rows listed in a report
+
+BOOKING_STATUSES = ('Pending', 'Confirmed', 'Cancelled', 'Paid')
+
+# entity: (INSERT statement, [(column, label, kind)], roles allowed to import it)
+IMPORT_SPECS = {
+    'bookings': (
+        "INSERT INTO Booking (BookingDate, Status, CustomerID, PackageID) VALUES (%s, %s, %s, %s)",
+        [('booking_date', 'Booking Date', 'date'), ('status', 'Status', 'status'),
+         ('customer_id', 'Customer ID', 'int'), ('package_id', 'Package ID', 'int')],
+        ['admin', 'agent'],
+    ),
+    'payments': (
+        "INSERT INTO Payment (Amount, PaymentDate, PaymentMethod, BookingID) VALUES (%s, %s, %s, %s)",
+        [('amount', 'Amount', 'float'), ('payment_date', 'Payment Date', 'date'),
+         ('method', 'Payment Method', 'text'), ('booking_id', 'Booking ID', 'int')],
+        ['admin', 'accountant'],
+    ),
+}
+
+def parse_import_row(spec, row):
+    """Validates one row with the same rules as the form handlers. Returns (values, error)."""
+    if not isinstance(row, dict):
+        return None, "Row is not a valid JSON object."
+    values = []
+    for column, label, kind in spec:
+        value = row.get(column)
+        value = '' if value is None else str(value).strip()
+        if kind == 'int':
+            if not is_positive_int(value):
+                return None, f"'{label}' must be a positive integer."
+            values.append(int(value))
+        elif kind == 'float':
+            if not is_non_negative_float(value):
+                return None, f"'{label}' must be a non-negative number."
+            values.append(float(value))
+        elif kind == 'date':
+            try:
+                values.append(datetime.strptime(value, '%Y-%m-%d').date())
+            except ValueError:
+                return None, f"'{label}' must be a date (YYYY-MM-DD)."
+        elif kind == 'status':
+            value = value or 'Pending'
+            if value not in BOOKING_STATUSES:
+                return None, f"'{label}' must be one of {', '.join(BOOKING_STATUSES)}."
+            values.append(value)
+        else:
+            values.append(value or None)
+    return values, None
+
+def read_import_rows(stream, fmt):
+    """Yields (line number, row dict) from a CSV or NDJSON text stream."""
+    if fmt == 'csv':
+        yield from enumerate(csv.DictReader(stream), start=2)
+        return
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError:
+            yield line_no, None
+
+def _record_import_error(report, line, message):
+    report['rejected'] += 1
+    if len(report['errors']) < IMPORT_MAX_ERRORS:
+        report['errors'].append((line, message))
+
+def _insert_import_batch(con, cur, sql, batch, report):
+    """
+    Inserts a batch with one executemany() in one transaction. If MySQL rejects
+    the batch, it is replayed row by row so only the offending rows are reported.
+    Row-level triggers (trg_after_payment_insert) fire for every row either way.
+    """
+    try:
+        cur.executemany(sql, [values for _, values in batch])
+        con.commit()
+        report['inserted'] += len(batch)
+        return
+    except mysql.connector.Error:
+        con.rollback()
+    for line, values in batch:
+        try:
+            cur.execute(sql, values)
+            con.commit()
+            report['inserted'] += 1
+        except mysql.connector.Error as err:
+            con.rollback()
+            _record_import_error(report, line, str(err))
+
+def import_rows(entity, rows, role='admin', batch_size=IMPORT_BATCH):
+    """
+    Bulk-inserts (line, row) pairs for an IMPORT_SPECS entity.
+    Returns {'inserted': n, 'rejected': n, 'errors': [(line, message), ...]}.
+    """
+    sql, spec, _ = IMPORT_SPECS[entity]
+    report = {'inserted': 0, 'rejected': 0, 'errors': []}
+    con = get_pool(role).acquire()
+    try:
+        cur = con.cursor()
+        batch = []
+        for line, row in rows:
+            values, error = parse_import_row(spec, row)
+            if error:
+                _record_import_error(report, line, error)
+                continue
+            batch.append((line, values))
+            if len(batch) >= batch_size:
+                _insert_import_batch(con, cur, sql, batch, report)
+                batch = []
+        if batch:
+            _insert_import_batch(con, cur, sql, batch, report)
+    finally:
+        con.close()
+        if entity == 'bookings':
+            dashboard_stats.adjust(bookings=report['inserted'])
+            bump_versions('Booking')
+        else:
+            dashboard_stats.adjust(payments=report['inserted'])
+            bump_versions('Payment', 'Booking')
+        customer_metrics.invalidate()
+    return report
+
+@app.route('/import/<entity>', methods=['POST'])
+@role_required(['admin', 'agent', 'accountant'])
+@idempotent
+def import_data(entity):
+    if entity not in IMPORT_SPECS:
+        abort(404)
+    if session['role'] not in IMPORT_SPECS[entity][2]:
+        flash("You do not have permission to import this data.", "error")
+        return redirect(url_for('index'))
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash("Please choose a .csv or .ndjson file to import.", "error")
+        return redirect(url_for(entity))
+
+    fmt = 'csv' if upload.filename.lower().endswith('.csv') else 'ndjson'
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    try:
+        report = import_rows(entity, read_import_rows(stream, fmt))
+    except Exception as e:
+        flash(f"Import Error: {e}", "error")
+        return redirect(url_for(entity))
+
+    if wants_json():
+        return jsonify(report)
+    flash(f"Imported {report['inserted']} {entity}; {report['rejected']} rows rejected.",
+          "success" if not report['rejected'] else "warning")
+    for line, error in report['errors'][:10]:
+        flash(f"Line {line}: {error}", "error")
+    return redirect(url_for(entity))
+
+@app.cli.command('import-data')
+@click.argument('entity', type=click.Choice(list(IMPORT_SPECS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=IMPORT_BATCH, show_default=True, help='Rows per executemany() and transaction.')
+def import_data_command(entity, path, batch_size):
+    """Bulk-imports bookings or payments from a .csv or .ndjson file."""
+    fmt = 'csv' if path.lower().endswith('.csv') else 'ndjson'
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        report = import_rows(entity, read_import_rows(f, fmt), batch_size=batch_size)
+    click.echo(f"Inserted {report['inserted']} {entity}; {report['rejected']} rows rejected.")
+    for line, error in report['errors']:
+        click.echo(f"  line {line}: {error}", err=True)
+
+# --- Production Server ---
+WARM_CONNECTIONS = int(os.environ.get('WARM_CONNECTIONS', POOL_SIZE))  # connections per role a worker opens before serving
+
+worker_state = {'pid': os.getpid(), 'ready': None, 'warm_seconds': None, 'steps': {}}  # ready stays None unless warmed
+_forked_pools = []
+
+def reset_after_fork():
+    """Drops what a forked worker must not share with its parent: pooled sockets, SQLite handles, thread bookkeeping."""
+    _forked_pools.extend(_pools.values())  # kept referenced so collecting them cannot close the parent's sockets
+    _pools.clear()
+    for store in (idempotency_store, payment_queue, getattr(app.session_interface, 'store', None)):
+        if store is not None:
+            store._local = threading.local()
+    payment_queue._threads = []
+    instrumentation._explainer = None
+    worker_state.update(pid=os.getpid(), ready=None, warm_seconds=None, steps={})
+
+os.register_at_fork(after_in_child=reset_after_fork)
+
+def warm_worker(notify=None):
+    """
+    Opens WARM_CONNECTIONS per role, builds this worker's in-process caches and starts
+    its payment queue threads, so its first requests do not pay for them. Each step is
+    timed; a failed step is recorded and skipped. `notify` is called between steps
+    (gunicorn's heartbeat).
+    """
+    started = time.monotonic()
+    worker_state.update(pid=os.getpid(), ready=False, steps={})
+
+    def step(name, fn):
+        t0 = time.monotonic()
+        try:
+            fn()
+            worker_state['steps'][name] = round(time.monotonic() - t0, 3)
+        except Exception as e:
+            worker_state['steps'][name] = f"failed: {e}"
+        if notify:
+            notify()
+
+    def open_connections(role):
+        cons = [get_pool(role).acquire() for _ in range(min(WARM_CONNECTIONS, POOL_SIZE))]
+        for con in cons:
+            con.close()
+
+    def with_connection(fn):
+        con = get_pool('admin').acquire()
+        try:
+            fn(con)
+        finally:
+            con.close()
+
+    for role in DB_CONFIGS:
+        step(f'pool:{role}', lambda role=role: open_connections(role))
+    step('package_catalog', package_catalog.get)
+    step('package_search', lambda: with_connection(package_search.ensure))
+    step('package_pricing', lambda: with_connection(package_pricing.get))
+    step('hotel_inventory', lambda: with_connection(hotel_inventory.get))
+    step('journey_planner', journey_planner.get)
+    step('referral_graph', lambda: with_connection(referral_graph.ensure))
+    if PAYMENT_QUEUE:
+        step('payment_queue', payment_queue.start)  # drains entries left by a restart before traffic arrives
+    worker_state.update(ready=True, warm_seconds=round(time.monotonic() - started, 3))
+    return worker_state
+
+@app.route('/ready')
+def ready():
+    """Readiness probe for this worker: 200 once it has warmed up (under flask serve) and can reach MySQL."""
+    try:
+        get_pool('admin').acquire().close()
+    except Exception as e:
+        return jsonify(dict(worker_state, error=str(e))), 503
+    if worker_state['ready'] is False:
+        return jsonify(worker_state), 503
+    return jsonify(worker_state)
+
+@app.cli.command('serve')
+@click.option('--bind', default=os.environ.get('SERVE_BIND', '127.0.0.1:8000'), show_default=True)
+@click.option('--workers', default=int(os.environ.get('SERVE_WORKERS', 2 * (os.cpu_count() or 1) + 1)), show_default=True)
+@click.option('--threads', default=int(os.environ.get('SERVE_THREADS', 4)), show_default=True, help='Request threads per worker.')
+@click.option('--timeout', default=int(os.environ.get('SERVE_TIMEOUT', 60)), show_default=True,
+              help='Seconds a silent worker is given before it is restarted.')
+@click.option('--preload/--no-preload', default=False,
+              help='Import the app once in the master and fork it (less memory; SIGHUP then restarts workers but cannot load new code).')
+@click.option('--warm/--no-warm', default=True, show_default=True, help='Warm pools and caches in each worker before it serves.')
+def serve_command(bind, workers, threads, timeout, preload, warm):
+    """Runs the app under gunicorn with pre-forked workers (settings and hooks in serve.py). kill -HUP reloads gracefully."""
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        raise click.ClickException("flask serve needs gunicorn: pip install -r requirements-prod.txt")
+    os.environ.update(
+        SERVE_BIND=bind, SERVE_WORKERS=str(workers), SERVE_THREADS=str(threads), SERVE_TIMEOUT=str(timeout),
+        SERVE_PRELOAD='1' if preload else '0', SERVE_WARM='1' if warm else '0', SERVE_STARTED_AT=str(time.time()),
+    )
+    # A fresh master that has not imported this module, so workers load it themselves and SIGHUP picks up new code.
+    os.execv(sys.executable, [sys.executable, '-m', 'gunicorn', '--chdir', app.root_path,
+                              '--config', os.path.join(app.root_path, 'serve.py'), 'app:app'])
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,163 @@
+"""
+ASGI entry point: serves the app from an event loop.
+
+    pip install -r requirements-async.txt
+    uvicorn asgi:application --workers 4
+
+The read-only /api/v1 endpoints run as coroutines on an aiomysql pool per role, so one
+process keeps hundreds of slow queries in flight without a thread per request. They
+share query planning, roles, sessions, ETags and the response cache with the Flask views.
+Every other route goes through the unchanged Flask app (asgiref's WsgiToAsgi, on a thread
+pool), so pages, forms and templates behave exactly as under a WSGI server. Without
+aiomysql installed, the API takes that path too.
+"""
+import asyncio
+import os
+import re
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.wrappers import Request
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+from app import (app, API_PREFIX, API_RESOURCES, DB_CONFIGS, POOL_RECYCLE, RESPONSE_CACHE_BYTES,
+                 api_plan, api_result, page_etag, response_cache)
+
+ASYNC_POOL_SIZE = int(os.environ.get('ASYNC_POOL_SIZE', 50))            # aiomysql connections per role and process
+ASYNC_POOL_TIMEOUT = float(os.environ.get('ASYNC_POOL_TIMEOUT', 5))     # seconds to wait for a connection before a 503
+
+API_PATH = re.compile(rf'^{re.escape(API_PREFIX)}/(?P<name>[a-z]+)(?:/(?P<item_id>\d+))?$')
+
+wsgi = WsgiToAsgi(app)
+_pools = {}
+_pools_lock = asyncio.Lock()
+
+async def get_async_pool(role):
+    """The aiomysql pool for a role, created on first use inside the running loop."""
+    async with _pools_lock:
+        pool = _pools.get(role)
+        if pool is None:
+            config = dict(DB_CONFIGS[role])
+            config['db'] = config.pop('database')
+            # autocommit: each read sees the latest committed rows, not a snapshot held by the pool
+            pool = _pools[role] = await aiomysql.create_pool(minsize=1, maxsize=ASYNC_POOL_SIZE, autocommit=True,
+                                                             pool_recycle=int(POOL_RECYCLE), **config)
+        return pool
+
+async def close_async_pools():
+    for pool in _pools.values():
+        pool.close()
+        await pool.wait_closed()
+    _pools.clear()
+
+def scope_environ(scope):
+    """The WSGI environ werkzeug needs to parse an ASGI request's query string, cookies and headers."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        # scope['path'] is already percent-decoded; WSGI carries it as latin-1 code points, as asgiref does
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+async def respond(send, status, body=b'', headers=()):
+    headers = [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+    if body:
+        headers.append((b'content-type', b'application/json'))
+    headers.append((b'content-length', str(len(body)).encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+def json_body(data):
+    return app.json.response(data).get_data()  # byte-for-byte what jsonify sends
+
+async def api_request(scope, send, name, item_id):
+    """Async twin of the /api/v1 views: role check, plan, ETag / cache, then one aiomysql query."""
+    table, key, select, roles = API_RESOURCES[name]
+    request = Request(scope_environ(scope))
+    # Session lookups (SQLite on an LRU miss) and version stamps (files) block, so they run off the loop
+    session = await asyncio.to_thread(app.session_interface.open_session, app, request)
+    role = session.get('role') if session is not None else None
+    vary = [('Vary', 'Cookie')]
+    if role is None:
+        return await respond(send, 401, json_body({'error': "Authentication required."}), vary)
+    if role not in roles:
+        return await respond(send, 403, json_body({'error': "You do not have permission to access this resource."}), vary)
+
+    plan, message = api_plan(key, select, request.args, item_id)
+    if message:
+        return await respond(send, 400, json_body({'error': message}), vary)
+
+    # Same key as cached_page builds for the Flask view, so both serving modes share ETags and entries
+    endpoint = f'api_{name}_item' if item_id is not None else f'api_{name}'
+    json_wanted = request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json'
+    cache_key = (endpoint, request.full_path, json_wanted, role, session.get('user_id'))
+    etag = await asyncio.to_thread(page_etag, cache_key, (table,))
+    headers = vary + [('ETag', f'"{etag}"'), ('Cache-Control', 'private, no-cache')]
+    if etag in request.if_none_match:
+        response_cache._count('not_modified')
+        return await respond(send, 304, headers=headers)
+    if RESPONSE_CACHE_BYTES:
+        entry = response_cache.get(cache_key, etag)
+        if entry is not None:
+            return await respond(send, 200, entry[1], headers)
+
+    try:
+        pool = await get_async_pool(role)
+        con = await asyncio.wait_for(pool.acquire(), ASYNC_POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        return await respond(send, 503, json_body({'error': "Database busy: no connection available."}), vary)
+    except Exception as e:
+        return await respond(send, 503, json_body({'error': f"Database unavailable: {e}"}), vary)
+    try:
+        async with con.cursor() as cur:
+            await cur.execute(plan['sql'], plan['params'])
+            rows = await cur.fetchall()
+    except aiomysql.Error as err:
+        return await respond(send, 500, json_body({'error': f"Database error: {err}"}), vary)
+    finally:
+        pool.release(con)
+
+    data = api_result(key, plan, rows)
+    if data is None:
+        return await respond(send, 404, json_body({'error': f"{table} {item_id} not found."}), vary)
+    body = json_body(data)
+    if RESPONSE_CACHE_BYTES:
+        response_cache.put(cache_key, etag, body, 'application/json')
+    await respond(send, 200, body, headers)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_async_pools()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http' and aiomysql is not None and scope['method'] == 'GET':
+        match = API_PATH.match(scope['path'])
+        if match and match['name'] in API_RESOURCES:
+            item_id = match['item_id']
+            if item_id is None or len(API_RESOURCES[match['name']][1]) == 1:
+                return await api_request(scope, send, match['name'], int(item_id) if item_id else None)
+    return await wsgi(scope, receive, send)
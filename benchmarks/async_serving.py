@@ -0,0 +1,134 @@
+"""
+Sync vs async serving: /api/v1 throughput with many concurrent clients.
+
+Starts the app twice against the local MySQL, once under the threaded WSGI server
+(flask run --with-threads) and once under uvicorn with asgi.py. It then opens
+--clients keep-alive connections to each and has every connection issue API reads
+(batched ids= lookups and keyset pages) for --duration seconds. Reports req/s,
+p50/p99 latency and error responses (e.g. 503 when the sync pool is exhausted).
+
+Run benchmarks/seed.py first. Needs requirements-async.txt installed.
+
+    python benchmarks/async_serving.py --clients 1000 --duration 30
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SESSION_DB', os.path.join(tempfile.mkdtemp(), 'sessions.sqlite3'))  # shared with the servers
+os.environ['RESPONSE_CACHE_BYTES'] = '0'  # measure the database path, not cache hits
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from seed import seeded_ids
+from common import percentile, session_cookie
+
+def api_path(rng, ids):
+    if rng.random() < 0.5:
+        batch = ','.join(str(i) for i in rng.sample(ids['customers'], 20))
+        return f"/api/v1/customers?ids={batch}&fields=Cname,Email"
+    return f"/api/v1/bookings?limit=50&after={rng.choice(ids['bookings'])}"
+
+def start_server(mode, port):
+    if mode == 'sync':
+        command = [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port), '--with-threads']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(port),
+                   '--log-level', 'warning', '--no-access-log', '--backlog', '4096']
+    return subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+async def wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+async def read_response(reader):
+    """Reads one HTTP/1.1 response; returns (status, keep-alive)."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() != 'close'
+
+async def client(port, cookie, ids, seed, deadline, latencies, errors):
+    rng = random.Random(seed)
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            path = api_path(rng, ids)
+            start = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\n\r\n".encode())
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                errors[status] = errors.get(status, 0) + 1
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            errors['connection'] = errors.get('connection', 0) + 1
+            writer = None
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+async def measure(mode, port, clients, duration, cookie, ids):
+    server = start_server(mode, port)
+    try:
+        await wait_ready(port)
+        latencies, errors = [], {}
+        started = time.monotonic()
+        deadline = started + duration
+        await asyncio.gather(*(client(port, cookie, ids, n, deadline, latencies, errors) for n in range(clients)))
+        elapsed = time.monotonic() - started
+    finally:
+        server.terminate()
+        server.wait()
+    ok = len(latencies) - sum(v for k, v in errors.items() if k != 'connection')
+    print(f"{mode:<6} {len(latencies) / elapsed:>8.1f} req/s  ok={ok}  "
+          f"p50={percentile(latencies, 50) if latencies else 0:.1f}ms  p99={percentile(latencies, 99) if latencies else 0:.1f}ms  "
+          f"errors={errors or 'none'}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=1000, help='concurrent keep-alive connections')
+    parser.add_argument('--duration', type=float, default=30, help='seconds per server')
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--mode', action='append', choices=['sync', 'async'], help='repeatable; default: both')
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, 4 * args.clients + 256)), hard))
+
+    ids = seeded_ids(limit=50000)
+    if not ids['customers'] or not ids['bookings']:
+        sys.exit("No seeded rows found; run benchmarks/seed.py first.")
+    cookie = session_cookie(app)
+    print(f"{args.clients} clients, {args.duration:.0f}s per server")
+    for n, mode in enumerate(args.mode or ['sync', 'async']):
+        asyncio.run(measure(mode, args.port + n, args.clients, args.duration, cookie, ids))
+
+if __name__ == '__main__':
+    main()
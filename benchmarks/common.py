@@ -0,0 +1,19 @@
+"""
+Helpers shared by the benchmark scripts: latency percentiles and the admin
+session the HTTP benchmarks send.
+"""
+
+BENCH_SESSION = {'user_id': 0, 'username': 'bench', 'role': 'admin'}
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def session_cookie(app, data=BENCH_SESSION):
+    """A Cookie header value ("name=value") that logs a client in as `data`."""
+    if hasattr(app.session_interface, 'issue'):
+        # server-side sessions: store one (a remote server must share SESSION_DB)
+        value = app.session_interface.issue(app, data)
+    else:
+        value = app.session_interface.get_signing_serializer(app).dumps(data)
+    return f"{app.config['SESSION_COOKIE_NAME']}={value}"
@@ -0,0 +1,63 @@
+"""
+Benchmark for /customers/<id>/history.
+
+Seeds a synthetic data set into the configured database with seed.py
+(1M bookings by default) and reports p50/p99 latency of the history
+endpoint through the Flask test client.
+
+    python benchmarks/customer_history.py --seed --bookings 1000000
+    python benchmarks/customer_history.py --requests 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mysql.connector
+from app import app, DB_CONFIGS
+from seed import EMAIL_DOMAIN, scaled_counts, seed
+from common import BENCH_SESSION, percentile
+
+def run(requests):
+    con = mysql.connector.connect(**DB_CONFIGS['admin'])
+    cur = con.cursor()
+    cur.execute("SELECT CustomerID FROM Customer WHERE Email LIKE %s", (f"%{EMAIL_DOMAIN}",))
+    ids = [row[0] for row in cur.fetchall()]
+    con.close()
+    if not ids:
+        sys.exit("No benchmark customers found; run with --seed first.")
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess.update(BENCH_SESSION)
+
+    rng = random.Random(7)
+    for customer_id in rng.sample(ids, min(50, len(ids))):  # warm the pool and prepared statements
+        client.get(f"/customers/{customer_id}/history?format=json")
+
+    timings = []
+    for _ in range(requests):
+        customer_id = rng.choice(ids)
+        t0 = time.perf_counter()
+        response = client.get(f"/customers/{customer_id}/history?format=json")
+        timings.append((time.perf_counter() - t0) * 1000)
+        assert response.status_code == 200, response.status_code
+
+    print(f"{requests} requests over {len(ids):,} customers")
+    print(f"p50 {percentile(timings, 50):.2f} ms   p99 {percentile(timings, 99):.2f} ms   max {max(timings):.2f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', action='store_true', help='insert synthetic data before measuring')
+    parser.add_argument('--bookings', type=int, default=1_000_000)
+    parser.add_argument('--customers', type=int, default=100_000)
+    parser.add_argument('--packages', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+    if args.seed:
+        seed(scaled_counts(1, bookings=args.bookings, customers=args.customers, packages=args.packages))
+    run(args.requests)
@@ -0,0 +1,325 @@
+"""
+Load-test harness: repeatable request scenarios against the app, per-route
+throughput and p50/p95/p99, and stored baselines to flag regressions.
+
+Run benchmarks/seed.py first; scenarios pick IDs from the seeded rows.
+
+    python benchmarks/harness.py                                  # all scenarios, Flask test client
+    python benchmarks/harness.py --target server --threads 8      # same, over HTTP to a local threaded WSGI server
+    python benchmarks/harness.py --target http://127.0.0.1:8000   # an already running server (same SECRET_KEY)
+    python benchmarks/harness.py --scenario crud --save-baseline  # record benchmarks/baselines.json
+    python benchmarks/harness.py --compare                        # exit 1 if a route regressed
+
+A route regresses when its p95 grows, or its throughput drops, by more than
+--tolerance (default 20%) against the stored baseline for the same target
+kind and scenario.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from werkzeug.serving import make_server
+from app import app
+from seed import CITIES, PREFIX, seeded_ids
+from common import BENCH_SESSION, percentile, session_cookie
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+# --- Scenarios ---
+# Each request factory takes (rng, ids) and returns (route label, method, path, form data or None).
+
+def dashboard(rng, ids):
+    return '/', 'GET', '/', None
+
+def list_page(endpoint):
+    def request(rng, ids):
+        path = f"{endpoint}?format=json&limit=50"
+        if rng.random() < 0.5:
+            path += f"&after={rng.randint(1, 10000)}"
+        return f"{endpoint} (json)", 'GET', path, None
+    return request
+
+def html_page(endpoint):
+    return lambda rng, ids: (endpoint, 'GET', endpoint, None)
+
+def api_batch(rng, ids):
+    batch = ','.join(str(i) for i in rng.sample(ids['customers'], 20))
+    return '/api/v1/customers?ids=', 'GET', f"/api/v1/customers?ids={batch}&fields=Cname,Email", None
+
+def api_page(resource, fields):
+    def request(rng, ids):
+        path = f"/api/v1/{resource}?fields={fields}&limit=100"
+        if rng.random() < 0.5:
+            path += f"&after={rng.randint(1, 10000)}"
+        return f"/api/v1/{resource}", 'GET', path, None
+    return request
+
+def customer_history(rng, ids):
+    return '/customers/<id>/history', 'GET', f"/customers/{rng.choice(ids['customers'])}/history?format=json", None
+
+def package_search(rng, ids):
+    args = {'destination': ','.join(str(d) for d in rng.sample(ids['destinations'], 2)), 'max_price': rng.randint(20000, 90000),
+            'sort': rng.choice(['price', '-rating', 'duration']), 'limit': 20}
+    return '/packages/search', 'GET', '/packages/search?' + urlencode(args), None
+
+def package_cost(rng, ids):
+    return '/packages/<id>/cost', 'GET', f"/packages/{rng.choice(ids['packages'])}/cost", None
+
+def hotel_availability(rng, ids):
+    check_in = date.today() + timedelta(days=rng.randint(0, 90))
+    args = {'check_in': check_in.isoformat(), 'check_out': (check_in + timedelta(days=rng.randint(1, 7))).isoformat(), 'rooms': 1}
+    return '/hotels/availability', 'GET', '/hotels/availability?' + urlencode(args), None
+
+def journey_plan(rng, ids):
+    origin, destination = rng.sample(CITIES, 2)
+    args = {'from': f"{PREFIX} {origin}", 'to': f"{PREFIX} {destination}",
+            'depart_after': (date.today() + timedelta(days=rng.randint(0, 30))).isoformat() + 'T08:00'}
+    return '/transports/plan', 'GET', '/transports/plan?' + urlencode(args), None
+
+def run_procedure(rng, ids):
+    return '/procedures/run_procedure', 'POST', '/procedures/run_procedure', {'package_id': rng.choice(ids['packages'])}
+
+def run_function(rng, ids):
+    return '/procedures/run_function', 'POST', '/procedures/run_function', {'customer_id': rng.choice(ids['customers'])}
+
+def add_booking(rng, ids):
+    form = {'booking_date': date.today().isoformat(), 'status': 'Pending',
+            'customer_id': rng.choice(ids['customers']), 'package_id': rng.choice(ids['packages'])}
+    return '/bookings/add', 'POST', '/bookings/add', form
+
+def update_booking(rng, ids):
+    form = {'booking_id': rng.choice(ids['bookings']), 'booking_date': date.today().isoformat(),
+            'status': rng.choice(['Pending', 'Confirmed']), 'customer_id': rng.choice(ids['customers']),
+            'package_id': rng.choice(ids['packages'])}
+    return '/bookings/update', 'POST', '/bookings/update', form
+
+def add_payment(rng, ids):
+    form = {'booking_id': rng.choice(ids['bookings']), 'amount': rng.randint(1000, 50000),
+            'payment_date': date.today().isoformat(), 'method': 'Bench'}
+    return '/payments/add', 'POST', '/payments/add', form
+
+def add_dependent(rng, ids):
+    form = {'dependent_name': f"{PREFIX} Dependent", 'age': rng.randint(1, 80), 'relation': 'Child',
+            'customer_id': rng.choice(ids['customers'])}
+    return '/customers/add_dependent', 'POST', '/customers/add_dependent', form
+
+# scenario -> [(weight, request factory)]
+SCENARIOS = {
+    'dashboard': [(1, dashboard)],
+    'lists': [(1, list_page(endpoint)) for endpoint in
+              ('/customers', '/bookings', '/payments', '/packages', '/hotels', '/destinations', '/transports')]
+             + [(1, html_page('/customers')), (1, html_page('/packages')), (1, html_page('/hotels'))],
+    'reports': [(2, html_page('/queries/run_a')), (2, html_page('/queries/run_b')), (2, html_page('/queries/run_c')),
+                (2, run_procedure), (2, run_function), (3, customer_history), (3, package_search),
+                (1, html_page('/packages/costs')), (2, package_cost), (2, hotel_availability), (2, journey_plan)],
+    'api': [(2, api_batch), (1, api_page('customers', 'Cname,City')), (1, api_page('bookings', 'Status,CustomerID')),
+            (1, api_page('payments', 'Amount,BookingID'))],
+    'crud': [(4, list_page('/bookings')), (3, list_page('/payments')), (2, customer_history),
+             (2, add_booking), (2, update_booking), (2, add_payment), (1, add_dependent)],
+}
+
+# --- Targets ---
+
+class ClientTarget:
+    """In-process requests through the Flask test client (one client per thread)."""
+    kind = 'client'
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def request(self, method, path, data):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = app.test_client()
+            with client.session_transaction() as sess:
+                sess.update(BENCH_SESSION)
+        response = client.open(path, method=method, data=data)
+        response.close()
+        return response.status_code
+
+    def close(self):
+        pass
+
+class HttpTarget:
+    """Keep-alive HTTP requests to a real WSGI server; every request carries a signed admin session cookie."""
+    kind = 'server'
+
+    def __init__(self, base_url=None):
+        self._server = None
+        if base_url is None:
+            self._server = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            base_url = f"http://127.0.0.1:{self._server.server_port}"
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.cookie = session_cookie(app)
+        self._local = threading.local()
+
+    def request(self, method, path, data):
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            con = self._local.con = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        headers = {'Cookie': self.cookie}
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            con.request(method, path, body=body, headers=headers)
+            response = con.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            self._local.con = None
+            con.close()
+            raise
+        return response.status
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+# --- Runner ---
+
+def run_scenario(target, name, ids, requests, threads, warmup, rng_seed):
+    """Runs `requests` weighted requests over `threads` workers. Returns {route: stats}."""
+    weights, factories = zip(*SCENARIOS[name])
+    samples = {}
+    errors = {}
+    lock = threading.Lock()
+
+    def worker(n, count, record):
+        rng = random.Random(rng_seed * 1000 + n)
+        local = {}
+        local_errors = {}
+        for _ in range(count):
+            route, method, path, data = rng.choices(factories, weights)[0](rng, ids)
+            start = time.perf_counter()
+            try:
+                status = target.request(method, path, data)
+            except Exception:
+                status = 599
+            elapsed = time.perf_counter() - start
+            local.setdefault(route, []).append(elapsed)
+            if status >= 400:
+                local_errors[route] = local_errors.get(route, 0) + 1
+        if record:
+            with lock:
+                for route, timings in local.items():
+                    samples.setdefault(route, []).extend(timings)
+                for route, count in local_errors.items():
+                    errors[route] = errors.get(route, 0) + count
+
+    def run(total, record):
+        per_thread = [total // threads + (1 if n < total % threads else 0) for n in range(threads)]
+        workers = [threading.Thread(target=worker, args=(n, per_thread[n], record)) for n in range(threads)]
+        started = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        return time.perf_counter() - started
+
+    run(warmup, False)
+    wall = run(requests, True)
+    results = {}
+    for route, timings in sorted(samples.items()):
+        ms = [t * 1000 for t in timings]
+        results[route] = {
+            'requests': len(ms), 'errors': errors.get(route, 0),
+            'rps': round(len(ms) / wall, 2),
+            'p50': round(percentile(ms, 50), 3), 'p95': round(percentile(ms, 95), 3), 'p99': round(percentile(ms, 99), 3),
+        }
+    all_ms = [t * 1000 for timings in samples.values() for t in timings]
+    results['(all)'] = {
+        'requests': len(all_ms), 'errors': sum(errors.values()), 'rps': round(len(all_ms) / wall, 2),
+        'p50': round(percentile(all_ms, 50), 3), 'p95': round(percentile(all_ms, 95), 3), 'p99': round(percentile(all_ms, 99), 3),
+    }
+    return results
+
+def compare(results, baseline, tolerance):
+    """Routes whose p95 or throughput moved past tolerance against the baseline: [(route, message)]."""
+    regressions = []
+    for route, now in results.items():
+        before = baseline.get(route)
+        if not before:
+            continue
+        if now['p95'] > before['p95'] * (1 + tolerance):
+            regressions.append((route, f"p95 {before['p95']:.2f} -> {now['p95']:.2f} ms"))
+        if now['rps'] < before['rps'] * (1 - tolerance):
+            regressions.append((route, f"throughput {before['rps']:.1f} -> {now['rps']:.1f} req/s"))
+    return regressions
+
+def print_results(name, results):
+    print(f"\n{name}")
+    print(f"  {'route':<34} {'reqs':>6} {'errs':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, r in results.items():
+        print(f"  {route:<34} {r['requests']:>6} {r['errors']:>5} {r['rps']:>8.1f} {r['p50']:>8.2f} {r['p95']:>8.2f} {r['p99']:>8.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help='repeatable; default: all')
+    parser.add_argument('--target', default='client', help="'client', 'server' or the base URL of a running server")
+    parser.add_argument('--requests', type=int, default=1000, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=100, help='unmeasured requests per scenario')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--rng-seed', type=int, default=7)
+    parser.add_argument('--baseline-file', default=BASELINES)
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='compare with the stored baseline and exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    ids = seeded_ids(limit=100000)
+    if not ids['customers'] or not ids['packages'] or not ids['bookings']:
+        sys.exit("No seeded rows found; run benchmarks/seed.py first.")
+
+    if args.target == 'client':
+        target = ClientTarget()
+    elif args.target == 'server':
+        target = HttpTarget()
+    else:
+        target = HttpTarget(args.target)
+
+    baselines = {}
+    if os.path.exists(args.baseline_file):
+        with open(args.baseline_file) as f:
+            baselines = json.load(f)
+
+    regressions = []
+    try:
+        for name in args.scenario or list(SCENARIOS):
+            results = run_scenario(target, name, ids, args.requests, args.threads, args.warmup, args.rng_seed)
+            print_results(f"{name} ({target.kind}, {args.threads} threads)", results)
+            key = f"{target.kind}:{name}"
+            if args.compare:
+                for route, message in compare(results, baselines.get(key, {}), args.tolerance):
+                    regressions.append((key, route, message))
+            if args.save_baseline:
+                baselines[key] = results
+    finally:
+        target.close()
+
+    if args.save_baseline:
+        with open(args.baseline_file, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline_file}")
+    if args.compare:
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for key, route, message in regressions:
+                print(f"  {key} {route}: {message}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark for /hotels/availability.
+
+Builds a RoomInventory in memory for 10k hotels x 365 nights (no database
+needed), filled with synthetic stays, and reports build time and p50/p99
+latency of "which hotels have N rooms free from X to Y".
+
+    python benchmarks/hotel_availability.py --hotels 10000 --days 365 --stays 2000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import RoomInventory
+from common import percentile
+
+def synthetic_stays(hotels, days, stays, start):
+    rng = random.Random(42)
+    rows = []
+    for _ in range(stays):
+        check_in = start + timedelta(days=rng.randrange(days))
+        rows.append((rng.randint(1, hotels), check_in, check_in + timedelta(days=rng.randint(1, 10))))
+    return rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hotels', type=int, default=10_000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--stays', type=int, default=2_000_000)
+    parser.add_argument('--rooms', type=int, default=10, help='rooms per hotel')
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    start = date(2025, 1, 1)
+    stays = synthetic_stays(args.hotels, args.days, args.stays, start)
+    t0 = time.perf_counter()
+    inventory = RoomInventory(range(1, args.hotels + 1), [args.rooms] * args.hotels, stays, start, args.days)
+    print(f"indexed {len(stays):,} stays for {args.hotels:,} hotels x {args.days} nights in {time.perf_counter() - t0:.2f} s")
+
+    rng = random.Random(7)
+    timings, matches = [], 0
+    for _ in range(args.requests):
+        nights = rng.randint(1, 14)
+        check_in = start + timedelta(days=rng.randrange(args.days - nights))
+        t0 = time.perf_counter()
+        hotel_ids, _ = inventory.available(check_in, check_in + timedelta(days=nights), rng.randint(1, 4))
+        timings.append((time.perf_counter() - t0) * 1000)
+        matches += len(hotel_ids)
+
+    print(f"{args.requests} availability queries, {matches / args.requests:,.0f} hotels matched on average")
+    print(f"p50 {percentile(timings, 50):.2f} ms   p99 {percentile(timings, 99):.2f} ms   max {max(timings):.2f} ms")
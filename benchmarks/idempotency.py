@@ -0,0 +1,92 @@
+"""
+Load test for idempotency keys on mutating POST routes.
+
+Fires bursts of concurrent duplicate /payments/add submissions that share one
+idempotency key (a double-clicking user, a retrying proxy) and checks that each
+burst inserts exactly one Payment row. Reports p50/p99 latency of the first
+attempt and of the replayed duplicates.
+
+    python benchmarks/idempotency.py --bursts 50 --concurrency 16
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mysql.connector
+from app import app, DB_CONFIGS
+from common import BENCH_SESSION, percentile
+
+def payment_count(booking_id):
+    con = mysql.connector.connect(**DB_CONFIGS['admin'])
+    cur = con.cursor()
+    cur.execute("SELECT COUNT(*) FROM Payment WHERE BookingID = %s", (booking_id,))
+    count = cur.fetchone()[0]
+    con.close()
+    return count
+
+def burst(booking_id, concurrency, first, replayed):
+    form = {
+        'idempotency_key': uuid.uuid4().hex,
+        'booking_id': booking_id,
+        'amount': '1.00',
+        'payment_date': date.today().isoformat(),
+        'method': 'Bench',
+    }
+    start = threading.Barrier(concurrency)
+
+    def submit():
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess.update(BENCH_SESSION)
+        start.wait()
+        t0 = time.perf_counter()
+        response = client.post('/payments/add', data=form)
+        elapsed = (time.perf_counter() - t0) * 1000
+        (replayed if response.headers.get('Idempotent-Replayed') else first).append(elapsed)
+
+    threads = [threading.Thread(target=submit) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--bursts', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--booking', type=int, help="BookingID to attach test payments to (default: the latest booking)")
+    args = parser.parse_args()
+
+    booking_id = args.booking
+    if booking_id is None:
+        con = mysql.connector.connect(**DB_CONFIGS['admin'])
+        cur = con.cursor()
+        cur.execute("SELECT MAX(BookingID) FROM Booking")
+        booking_id = cur.fetchone()[0]
+        con.close()
+    if booking_id is None:
+        sys.exit("No bookings found; create one or pass --booking.")
+
+    before = payment_count(booking_id)
+    first, replayed = [], []
+    for _ in range(args.bursts):
+        burst(booking_id, args.concurrency, first, replayed)
+    inserted = payment_count(booking_id) - before
+
+    print(f"{args.bursts} bursts x {args.concurrency} duplicate submissions against booking {booking_id}")
+    print(f"payments inserted: {inserted} (expected {args.bursts})")
+    print(f"first attempts:  {len(first):>6}  p50 {percentile(first, 50):7.2f} ms  p99 {percentile(first, 99):7.2f} ms")
+    if replayed:
+        print(f"replayed:        {len(replayed):>6}  p50 {percentile(replayed, 50):7.2f} ms  p99 {percentile(replayed, 99):7.2f} ms")
+    print("Remove the test rows with: DELETE FROM Payment WHERE PaymentMethod = 'Bench';")
+    sys.exit(0 if inserted == args.bursts else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark for the /transports/plan journey planner.
+
+Builds a TransportGraph in memory from synthetic connections (1M by default,
+no database needed) and reports p50/p99 latency of earliest-arrival and
+cheapest journey searches.
+
+    python benchmarks/journey_planner.py --connections 1000000 --requests 500
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import TransportGraph
+from common import percentile
+
+DAY = 86400
+
+def synthetic_rows(connections, locations, days):
+    """Random legs between `locations` cities, spread over `days` days."""
+    rng = random.Random(42)
+    cities = [f"City {i}" for i in range(locations)]
+    types = [('Flight', 60, 240, 3000, 25000), ('Train', 120, 900, 500, 4000), ('Bus', 120, 720, 300, 2500)]
+    rows = []
+    for transport_id in range(1, connections + 1):
+        origin, target = rng.sample(cities, 2)
+        kind, shortest, longest, cheapest, dearest = rng.choice(types)
+        depart = rng.randrange(days * DAY)
+        rows.append((transport_id, kind, origin, target, depart,
+                     depart + rng.randint(shortest, longest) * 60, rng.randint(cheapest, dearest)))
+    return rows, cities
+
+def run(graph, cities, requests, days, window_hours, layover_minutes):
+    rng = random.Random(7)
+    timings = {'earliest': [], 'cheapest': []}
+    found = 0
+    for _ in range(requests):
+        origin, target = rng.sample(cities, 2)
+        start = rng.randrange((days - 2) * DAY)
+        end = start + window_hours * 3600
+        for name in timings:
+            t0 = time.perf_counter()
+            legs = getattr(graph, name)(origin, target, start, end, layover_minutes * 60)
+            timings[name].append((time.perf_counter() - t0) * 1000)
+        found += legs is not None
+
+    print(f"{requests} plans over {len(graph):,} connections, {window_hours} h window ({found} found)")
+    for name, samples in timings.items():
+        print(f"{name:>9}: p50 {percentile(samples, 50):.2f} ms   p99 {percentile(samples, 99):.2f} ms   max {max(samples):.2f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=1_000_000)
+    parser.add_argument('--locations', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--window', type=int, default=48, help='hours between depart_after and arrive_by')
+    parser.add_argument('--layover', type=int, default=30, help='minimum layover in minutes')
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    rows, cities = synthetic_rows(args.connections, args.locations, args.days)
+    t0 = time.perf_counter()
+    graph = TransportGraph(rows)
+    print(f"indexed {len(graph):,} connections in {time.perf_counter() - t0:.2f} s")
+    run(graph, cities, args.requests, args.days, args.window, args.layover)
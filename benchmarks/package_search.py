@@ -0,0 +1,81 @@
+"""
+Benchmark for the /packages/search index.
+
+Builds a synthetic PackageIndex in memory (100k packages by default, no
+database needed) and reports p50/p99 latency for a mix of filtered and
+faceted searches.
+
+    python benchmarks/package_search.py --packages 100000 --requests 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import PackageIndex, package_record
+from common import percentile
+
+TRANSPORT_TYPES = ['Flight', 'Train', 'Bus', 'Cab', 'Ferry']
+
+def build(packages, destinations, hotels, transports):
+    rng = random.Random(42)
+    hotel_rows = {h: (round(rng.uniform(1, 5), 1), float(rng.randint(1000, 20000))) for h in range(1, hotels + 1)}
+    transport_rows = {t: rng.choice(TRANSPORT_TYPES) for t in range(1, transports + 1)}
+    destination_rows = {d: f"Destination {d}" for d in range(1, destinations + 1)}
+    records = {}
+    for package_id in range(1, packages + 1):
+        record = package_record((package_id, f"Bench Package {package_id}", rng.randint(5000, 90000),
+                                 rng.randint(2, 14), rng.randint(1, 6)))
+        record['destinations'].update(rng.sample(range(1, destinations + 1), rng.randint(1, 3)))
+        record['hotels'].update(rng.sample(range(1, hotels + 1), rng.randint(0, 3)))
+        record['transports'].update(rng.sample(range(1, transports + 1), rng.randint(1, 2)))
+        records[package_id] = record
+
+    index = PackageIndex(hotel_rows, transport_rows, destination_rows)
+    t0 = time.perf_counter()
+    index.build(records)
+    print(f"indexed {packages:,} packages in {time.perf_counter() - t0:.2f} s")
+    return index
+
+def random_query(rng, destinations):
+    query = {'ranges': {}, 'sort': rng.choice(['price', '-price', 'duration', '-rating'])}
+    if rng.random() < 0.5:
+        query['destinations'] = rng.sample(range(1, destinations + 1), rng.randint(1, 3))
+    if rng.random() < 0.5:
+        query['transport_types'] = rng.sample(TRANSPORT_TYPES, rng.randint(1, 2))
+    if rng.random() < 0.6:
+        low = rng.randint(5000, 60000)
+        query['ranges']['price'] = (low, low + rng.randint(5000, 30000))
+    if rng.random() < 0.4:
+        query['ranges']['rating'] = (rng.choice([3.0, 3.5, 4.0, 4.5]), None)
+    if rng.random() < 0.3:
+        query['ranges']['duration'] = (rng.randint(2, 6), rng.randint(7, 14))
+    if rng.random() < 0.3:
+        query['ranges']['travelers'] = (rng.randint(1, 4), None)
+    return query
+
+def run(index, requests, destinations):
+    rng = random.Random(7)
+    timings = []
+    for _ in range(requests):
+        query = random_query(rng, destinations)
+        t0 = time.perf_counter()
+        index.search(**query)
+        timings.append((time.perf_counter() - t0) * 1000)
+
+    print(f"{requests} searches over {len(index.packages):,} packages")
+    print(f"p50 {percentile(timings, 50):.2f} ms   p99 {percentile(timings, 99):.2f} ms   max {max(timings):.2f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--packages', type=int, default=100_000)
+    parser.add_argument('--destinations', type=int, default=500)
+    parser.add_argument('--hotels', type=int, default=5000)
+    parser.add_argument('--transports', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+    run(build(args.packages, args.destinations, args.hotels, args.transports), args.requests, args.destinations)
@@ -0,0 +1,222 @@
+"""
+Synthetic data set for the benchmarks.
+
+Inserts customers (with referral chains through Refers), phones, dependents,
+destinations, hotels, transports, packages with their Covers / GuestStayIn /
+IncludesTravelBy links, bookings, payments and itineraries. Every row is
+tagged (emails end in @bench.example, names and transport locations start
+with "Bench") so --clear removes exactly what was seeded. Run it against an
+otherwise idle database: IDs of each batch are taken as consecutive from
+lastrowid.
+
+    python benchmarks/seed.py --scale 1           # 10k customers, 50k bookings
+    python benchmarks/seed.py --scale 20 --clear  # replace with 200k / 1M
+    python benchmarks/seed.py --bookings 1000000 --customers 100000 --packages 500
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+from app import DB_CONFIGS
+
+EMAIL_DOMAIN = '@bench.example'
+PREFIX = 'Bench'
+BATCH = 10000
+
+# Row counts at --scale 1. Link tables and payments/itineraries are derived per row.
+BASE_COUNTS = {
+    'customers': 10_000,
+    'destinations': 100,
+    'hotels': 1_000,
+    'transports': 5_000,
+    'packages': 500,
+    'bookings': 50_000,
+}
+REFERRAL_FANOUT = 3      # customer n refers to customer n // REFERRAL_FANOUT: chains ~log3(customers) deep
+REFERRAL_SHARE = 0.6     # share of customers with a referrer
+PAYMENT_SHARE = 0.7      # share of bookings with a payment
+ITINERARY_SHARE = 0.5    # share of bookings with a hotel stay
+CITIES = [
+    'Delhi', 'Mumbai', 'Bengaluru', 'Chennai', 'Kolkata', 'Hyderabad', 'Goa', 'Jaipur', 'Kochi', 'Pune',
+    'Dubai', 'Singapore', 'Bangkok', 'Kathmandu', 'Colombo', 'Male', 'London', 'Paris', 'Tokyo', 'Sydney',
+]
+TRANSPORT_TYPES = ['Flight', 'Train', 'Bus', 'Cruise']
+STATUSES = ['Pending', 'Confirmed', 'Cancelled']
+METHODS = ['UPI', 'Card', 'Cash', 'NetBanking']
+
+def scaled_counts(scale, **overrides):
+    counts = {name: max(1, int(count * scale)) for name, count in BASE_COUNTS.items()}
+    counts.update({name: value for name, value in overrides.items() if value is not None})
+    return counts
+
+def insert_many(cur, sql, rows):
+    """Inserts rows in BATCH-sized multi-row statements; returns the ID of every row."""
+    ids = []
+    for offset in range(0, len(rows), BATCH):
+        chunk = rows[offset:offset + BATCH]
+        cur.executemany(sql, chunk)
+        ids.extend(range(cur.lastrowid, cur.lastrowid + len(chunk)))
+    return ids
+
+def seed(counts, rng_seed=42, verbose=True):
+    """Inserts a synthetic data set with the given row counts. Returns the IDs created, by table."""
+    con = mysql.connector.connect(**DB_CONFIGS['admin'])
+    cur = con.cursor()
+    rng = random.Random(rng_seed)
+    started = time.perf_counter()
+
+    def done(label, n):
+        con.commit()
+        if verbose:
+            print(f"  {label:<16} {n:>10,}  ({time.perf_counter() - started:6.1f} s)", flush=True)
+
+    customers = insert_many(
+        cur,
+        "INSERT INTO Customer (Cname, Email, State, City, Street, Country) VALUES (%s, %s, %s, %s, %s, %s)",
+        [(f"{PREFIX} Customer {i}", f"c{i}.{rng_seed}{EMAIL_DOMAIN}", 'KA', rng.choice(CITIES), f"{i} Bench Street", 'India')
+         for i in range(counts['customers'])],
+    )
+    referrals = [(customers[i // REFERRAL_FANOUT], customers[i]) for i in range(1, len(customers)) if rng.random() < REFERRAL_SHARE]
+    for offset in range(0, len(referrals), 1000):
+        chunk = referrals[offset:offset + 1000]
+        # One UPDATE per chunk: CASE maps each customer to its referrer.
+        cur.execute(
+            "UPDATE Customer SET Refers = CASE CustomerID " + ' '.join(['WHEN %s THEN %s'] * len(chunk)) + " END "
+            "WHERE CustomerID IN (" + ', '.join(['%s'] * len(chunk)) + ")",
+            [value for referrer, customer in chunk for value in (customer, referrer)] + [customer for _, customer in chunk],
+        )
+    done('customers', len(customers))
+
+    cur.executemany("INSERT INTO Cust_Phone (CustomerID, CPhone) VALUES (%s, %s)",
+                    [(c, f"9{rng.randrange(10**9):09d}") for c in customers])
+    dependents = [(f"{PREFIX} Dependent {i}", rng.randint(1, 80), rng.choice(['Spouse', 'Child', 'Parent']), rng.choice(customers))
+                  for i in range(len(customers) // 2)]
+    for offset in range(0, len(dependents), BATCH):
+        cur.executemany("INSERT INTO TravelDependent (DependentName, Age, Relation, CustomerID) VALUES (%s, %s, %s, %s)",
+                        dependents[offset:offset + BATCH])
+    done('dependents', len(dependents))
+
+    destinations = insert_many(
+        cur, "INSERT INTO Destination (DestinationName, Dlocation) VALUES (%s, %s)",
+        [(f"{PREFIX} Destination {i}", rng.choice(CITIES)) for i in range(counts['destinations'])],
+    )
+    hotels = insert_many(
+        cur, "INSERT INTO Hotel (HotelName, Address, Rating, HotelPrice) VALUES (%s, %s, %s, %s)",
+        [(f"{PREFIX} Hotel {i}", rng.choice(CITIES), round(rng.uniform(2.5, 5.0), 1), rng.randint(1500, 25000))
+         for i in range(counts['hotels'])],
+    )
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    transport_rows = []
+    for _ in range(counts['transports']):
+        depart_from, arrive_at = (f"{PREFIX} {city}" for city in rng.sample(CITIES, 2))
+        depart = now + timedelta(hours=rng.randrange(24 * 60))
+        transport_rows.append((rng.choice(TRANSPORT_TYPES), depart_from, arrive_at, depart,
+                               depart + timedelta(minutes=rng.randint(45, 14 * 60)), rng.randint(500, 40000)))
+    transports = insert_many(
+        cur,
+        "INSERT INTO Transport (TransportType, DepartLocation, ArrivalLocation, DepartDateTime, ArrivalDateTime, TransportPrice) "
+        "VALUES (%s, %s, %s, %s, %s, %s)",
+        transport_rows,
+    )
+    done('catalogue', len(destinations) + len(hotels) + len(transports))
+
+    packages = insert_many(
+        cur, "INSERT INTO TourPackage (PackageName, PackagePrice, Duration, No_of_Travelers) VALUES (%s, %s, %s, %s)",
+        [(f"{PREFIX} Package {i}", rng.randint(5000, 90000), rng.randint(2, 14), rng.randint(1, 6)) for i in range(counts['packages'])],
+    )
+    for table, column, pool, most in (('Covers', 'DestinationID', destinations, 3),
+                                      ('GuestStayIn', 'HotelID', hotels, 3),
+                                      ('IncludesTravelBy', 'TransportID', transports, 4)):
+        links = [(p, linked) for p in packages for linked in rng.sample(pool, min(len(pool), rng.randint(1, most)))]
+        for offset in range(0, len(links), BATCH):
+            cur.executemany(f"INSERT INTO {table} (PackageID, {column}) VALUES (%s, %s)", links[offset:offset + BATCH])
+    done('packages', len(packages))
+
+    start = date.today() - timedelta(days=730)
+    booking_count = 0
+    payments = itineraries = 0
+    for offset in range(0, counts['bookings'], BATCH):
+        rows = [(start + timedelta(days=rng.randrange(1000)), rng.choice(STATUSES), rng.choice(customers), rng.choice(packages))
+                for _ in range(min(BATCH, counts['bookings'] - offset))]
+        cur.executemany("INSERT INTO Booking (BookingDate, Status, CustomerID, PackageID) VALUES (%s, %s, %s, %s)", rows)
+        first_id = cur.lastrowid
+        pay = [(rng.randint(1000, 90000), rows[i][0], rng.choice(METHODS), first_id + i)
+               for i in range(len(rows)) if rng.random() < PAYMENT_SHARE]
+        cur.executemany("INSERT INTO Payment (Amount, PaymentDate, PaymentMethod, BookingID) VALUES (%s, %s, %s, %s)", pay)
+        stays = []
+        for i in range(len(rows)):
+            if rng.random() < ITINERARY_SHARE:
+                check_in = rows[i][0] + timedelta(days=rng.randint(1, 60))
+                stays.append((first_id + i, rng.choice(hotels), rng.choice(transports), rng.choice(['Standard', 'Deluxe', 'Suite']),
+                              check_in, check_in + timedelta(days=rng.randint(1, 10)), rng.choice(['Economy', 'Business'])))
+        cur.executemany(
+            "INSERT INTO Itinerary (BookingID, HotelID, TransportID, RoomType, CheckInDate, CheckOutDate, SeatClass) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)", stays,
+        )
+        con.commit()
+        booking_count += len(rows)
+        payments += len(pay)
+        itineraries += len(stays)
+        if verbose:
+            print(f"  bookings         {booking_count:>10,}", end='\r', flush=True)
+    done('bookings', booking_count)
+    if verbose:
+        print(f"  payments         {payments:>10,}\n  itineraries      {itineraries:>10,}")
+    con.close()
+    return {'customers': customers, 'packages': packages, 'hotels': hotels, 'transports': transports, 'destinations': destinations}
+
+def clear():
+    """Deletes every seeded row. Bookings, payments, itineraries, phones and dependents go with their customer."""
+    con = mysql.connector.connect(**DB_CONFIGS['admin'])
+    cur = con.cursor()
+    for sql in (
+        f"DELETE FROM Customer WHERE Email LIKE '%{EMAIL_DOMAIN}'",
+        f"DELETE FROM TourPackage WHERE PackageName LIKE '{PREFIX} Package %'",
+        f"DELETE FROM Transport WHERE DepartLocation LIKE '{PREFIX} %'",
+        f"DELETE FROM Hotel WHERE HotelName LIKE '{PREFIX} Hotel %'",
+        f"DELETE FROM Destination WHERE DestinationName LIKE '{PREFIX} Destination %'",
+    ):
+        cur.execute(sql)
+        con.commit()
+    con.close()
+
+def seeded_ids(limit=None):
+    """IDs of the seeded rows already in the database, by table (for benchmarks run without --seed)."""
+    con = mysql.connector.connect(**DB_CONFIGS['admin'])
+    cur = con.cursor()
+    queries = {
+        'customers': f"SELECT CustomerID FROM Customer WHERE Email LIKE '%{EMAIL_DOMAIN}'",
+        'packages': f"SELECT PackageID FROM TourPackage WHERE PackageName LIKE '{PREFIX} Package %'",
+        'hotels': f"SELECT HotelID FROM Hotel WHERE HotelName LIKE '{PREFIX} Hotel %'",
+        'destinations': f"SELECT DestinationID FROM Destination WHERE DestinationName LIKE '{PREFIX} Destination %'",
+        'bookings': f"SELECT b.BookingID FROM Booking b JOIN Customer c ON c.CustomerID = b.CustomerID WHERE c.Email LIKE '%{EMAIL_DOMAIN}'",
+    }
+    ids = {}
+    for name, sql in queries.items():
+        cur.execute(sql + (f" LIMIT {int(limit)}" if limit else ''))
+        ids[name] = [row[0] for row in cur.fetchall()]
+    con.close()
+    return ids
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier for every row count')
+    for name in BASE_COUNTS:
+        parser.add_argument(f'--{name}', type=int, help=f'override the {name} count')
+    parser.add_argument('--clear', action='store_true', help='delete previously seeded rows first')
+    parser.add_argument('--clear-only', action='store_true', help='delete previously seeded rows and stop')
+    parser.add_argument('--rng-seed', type=int, default=42)
+    args = parser.parse_args()
+    if args.clear or args.clear_only:
+        clear()
+        print("Cleared seeded rows.")
+    if not args.clear_only:
+        counts = scaled_counts(args.scale, **{name: getattr(args, name) for name in BASE_COUNTS})
+        print("Seeding " + ', '.join(f"{count:,} {name}" for name, count in counts.items()))
+        seed(counts, rng_seed=args.rng_seed)
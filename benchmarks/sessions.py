@@ -0,0 +1,101 @@
+"""
+Session backend comparison: signed cookie vs server-side (memory LRU, SQLite).
+
+For each backend, measures the Cookie / Set-Cookie header bytes a logged-in
+user carries while flash messages pile up (an import that reports row errors,
+a batch of failed edits), and the per-request cost of loading the session and
+of loading + saving a modified one. "sqlite-cold" loads through a second store
+whose LRU never saw the session, as another worker would.
+
+No MySQL is needed; a throwaway SQLite file is used for the shared store.
+
+    python benchmarks/sessions.py --flashes 20 --requests 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('SESSION_DB', os.path.join(tempfile.mkdtemp(), 'sessions.sqlite3'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import request
+from flask.sessions import SecureCookieSessionInterface
+from app import app, SESSION_DB, SessionStore, ServerSessionInterface
+from common import BENCH_SESSION, percentile
+
+def backends():
+    shared = SessionStore(SESSION_DB)
+    return [
+        ('cookie', SecureCookieSessionInterface(), None),
+        ('memory', ServerSessionInterface(SessionStore(None)), None),
+        ('sqlite', ServerSessionInterface(shared), None),
+        ('sqlite-cold', ServerSessionInterface(shared), ServerSessionInterface(SessionStore(SESSION_DB, capacity=0))),
+    ]
+
+def round_trip(iface, cookie, modify=None):
+    """Opens the session a request with this cookie would see, optionally modifies and saves it."""
+    headers = {'Cookie': f"{app.config['SESSION_COOKIE_NAME']}={cookie}"} if cookie else {}
+    with app.test_request_context('/', headers=headers):
+        sess = iface.open_session(app, request)
+        if modify is None:
+            return sess, None
+        modify(sess)
+        response = app.response_class()
+        iface.save_session(app, sess, response)
+        return sess, response.headers.get('Set-Cookie', '')
+
+def cookie_value(set_cookie, previous):
+    if not set_cookie:
+        return previous
+    return set_cookie.split(';', 1)[0].split('=', 1)[1]
+
+def run(name, iface, reader, flashes, requests):
+    def login(sess):
+        sess.update(BENCH_SESSION)
+
+    def add_flash(sess):
+        sess['_flashes'] = sess.get('_flashes', []) + [('error', f"Row {len(sess.get('_flashes', [])) + 2}: booking date must be before the travel date")]
+
+    _, set_cookie = round_trip(iface, None, login)
+    cookie = cookie_value(set_cookie, None)
+    set_cookie_bytes = len(set_cookie)
+    for _ in range(flashes):
+        _, set_cookie = round_trip(iface, cookie, add_flash)
+        cookie = cookie_value(set_cookie, cookie)
+        set_cookie_bytes = max(set_cookie_bytes, len(set_cookie))
+
+    loader = reader or iface
+    load, save = [], []
+    for _ in range(requests):
+        start = time.perf_counter()
+        sess, _ = round_trip(loader, cookie)
+        load.append((time.perf_counter() - start) * 1000)
+        assert sess.get('user_id') == BENCH_SESSION['user_id'], name
+    for _ in range(requests):
+        start = time.perf_counter()
+        _, set_cookie = round_trip(iface, cookie, lambda s: s.__setitem__('last_seen', time.time()))
+        save.append((time.perf_counter() - start) * 1000)
+        cookie = cookie_value(set_cookie, cookie)
+
+    header = len(f"Cookie: {app.config['SESSION_COOKIE_NAME']}={cookie}")
+    print(f"{name:<12} cookie={header:>5}B set-cookie(max)={set_cookie_bytes:>5}B "
+          f"load p50={percentile(load, 50):.3f}ms p99={percentile(load, 99):.3f}ms "
+          f"load+save p50={percentile(save, 50):.3f}ms p99={percentile(save, 99):.3f}ms")
+    if header > 4096:
+        print(f"{'':<12} over the 4096-byte cookie limit browsers enforce: flashes would be dropped")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--flashes', type=int, default=20, help='flash messages accumulated in the session')
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{args.flashes} pending flashes, {args.requests} requests per measurement, shared store {SESSION_DB}")
+    for name, iface, reader in backends():
+        run(name, iface, reader, args.flashes, args.requests)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+-- Secondary indexes for /customers/<id>/history.
+-- Fresh installs already get these from the main SQL file; run this on existing databases:
+--   mysql -u admin -p Tourism_and_Travel_Booking_System < migrations/001_customer_history_indexes.sql
+-- Safe to run more than once.
+
+USE Tourism_and_Travel_Booking_System;
+
+DROP PROCEDURE IF EXISTS add_index_if_missing;
+DELIMITER $$
+CREATE PROCEDURE add_index_if_missing(IN tbl VARCHAR(64), IN idx VARCHAR(64), IN cols VARCHAR(255))
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = tbl AND index_name = idx
+    ) THEN
+        SET @ddl = CONCAT('CREATE INDEX ', idx, ' ON ', tbl, ' (', cols, ')');
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END$$
+DELIMITER ;
+
+-- A customer's bookings, newest first
+CALL add_index_if_missing('Booking', 'idx_booking_customer_date', 'CustomerID, BookingDate');
+
+-- Payments of those bookings, in date order
+CALL add_index_if_missing('Payment', 'idx_payment_booking_date', 'BookingID, PaymentDate');
+
+-- A customer's dependents. On existing databases the foreign key's own index on
+-- CustomerID already covers this, so the named index is only created if that one was dropped.
+SET @fk_index = (
+    SELECT COUNT(*) FROM information_schema.statistics
+    WHERE table_schema = DATABASE() AND table_name = 'TravelDependent'
+      AND column_name = 'CustomerID' AND seq_in_index = 1
+);
+SET @ddl = IF(@fk_index = 0, 'CREATE INDEX idx_dependent_customer ON TravelDependent (CustomerID)', 'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+DROP PROCEDURE add_index_if_missing;
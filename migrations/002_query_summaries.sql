@@ -0,0 +1,177 @@
+-- Materialised summaries behind the advanced queries page (/queries/run_a, run_b, run_c).
+--   mysql -u admin -p Tourism_and_Travel_Booking_System < migrations/002_query_summaries.sql
+-- Safe to run more than once.
+--
+-- Triggers append the key of every changed row to mv_changelog. The app's
+-- SummaryRefresher consumes those entries and recomputes only the affected summary rows.
+-- Foreign-key cascades do not fire triggers, so a customer change also refreshes that
+-- customer's stays, and a booking change also refreshes that booking's itineraries.
+
+USE Tourism_and_Travel_Booking_System;
+
+CREATE TABLE IF NOT EXISTS mv_changelog (
+    ChangeID BIGINT AUTO_INCREMENT PRIMARY KEY,
+    KeyType ENUM('customer','booking','hotel','package') NOT NULL,
+    RowKey INT NOT NULL
+);
+
+-- One row per summary set: the last applied ChangeID and when it was refreshed
+CREATE TABLE IF NOT EXISTS mv_state (
+    Name VARCHAR(32) PRIMARY KEY,
+    Watermark BIGINT NOT NULL DEFAULT 0,
+    RefreshedAt DATETIME NULL
+);
+
+-- run_a: dependents per customer
+CREATE TABLE IF NOT EXISTS mv_customer_dependents (
+    CustomerID INT PRIMARY KEY,
+    Cname VARCHAR(100) NOT NULL,
+    Total_Dependents INT NOT NULL
+);
+
+-- run_b: top 3 packages by price
+CREATE TABLE IF NOT EXISTS mv_top_packages (
+    PackageID INT PRIMARY KEY,
+    PackageName VARCHAR(100) NOT NULL,
+    PackagePrice DECIMAL(12,2) NOT NULL
+);
+
+-- run_c: confirmed/paid bookings with their itinerary hotels
+CREATE TABLE IF NOT EXISTS mv_confirmed_stays (
+    BookingID INT NOT NULL,
+    HotelID INT NOT NULL,
+    TransportID INT NOT NULL,
+    CustomerID INT NOT NULL,
+    Cname VARCHAR(100) NOT NULL,
+    HotelName VARCHAR(150) NOT NULL,
+    Rating DECIMAL(2,1),
+    PRIMARY KEY (BookingID, HotelID, TransportID),
+    INDEX idx_mv_stays_customer (CustomerID),
+    INDEX idx_mv_stays_hotel (HotelID)
+);
+
+DELIMITER $$
+DROP TRIGGER IF EXISTS trg_mv_customer_insert$$
+CREATE TRIGGER trg_mv_customer_insert AFTER INSERT ON Customer
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('customer', NEW.CustomerID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_customer_update$$
+CREATE TRIGGER trg_mv_customer_update AFTER UPDATE ON Customer
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('customer', OLD.CustomerID);
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('customer', NEW.CustomerID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_customer_delete$$
+CREATE TRIGGER trg_mv_customer_delete AFTER DELETE ON Customer
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('customer', OLD.CustomerID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_dependent_insert$$
+CREATE TRIGGER trg_mv_dependent_insert AFTER INSERT ON TravelDependent
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('customer', NEW.CustomerID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_dependent_update$$
+CREATE TRIGGER trg_mv_dependent_update AFTER UPDATE ON TravelDependent
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('customer', OLD.CustomerID);
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('customer', NEW.CustomerID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_dependent_delete$$
+CREATE TRIGGER trg_mv_dependent_delete AFTER DELETE ON TravelDependent
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('customer', OLD.CustomerID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_booking_insert$$
+CREATE TRIGGER trg_mv_booking_insert AFTER INSERT ON Booking
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('booking', NEW.BookingID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_booking_update$$
+CREATE TRIGGER trg_mv_booking_update AFTER UPDATE ON Booking
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('booking', OLD.BookingID);
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('booking', NEW.BookingID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_booking_delete$$
+CREATE TRIGGER trg_mv_booking_delete AFTER DELETE ON Booking
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('booking', OLD.BookingID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_itinerary_insert$$
+CREATE TRIGGER trg_mv_itinerary_insert AFTER INSERT ON Itinerary
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('booking', NEW.BookingID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_itinerary_update$$
+CREATE TRIGGER trg_mv_itinerary_update AFTER UPDATE ON Itinerary
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('booking', OLD.BookingID);
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('booking', NEW.BookingID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_itinerary_delete$$
+CREATE TRIGGER trg_mv_itinerary_delete AFTER DELETE ON Itinerary
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('booking', OLD.BookingID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_hotel_update$$
+CREATE TRIGGER trg_mv_hotel_update AFTER UPDATE ON Hotel
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('hotel', OLD.HotelID);
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('hotel', NEW.HotelID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_hotel_delete$$
+CREATE TRIGGER trg_mv_hotel_delete AFTER DELETE ON Hotel
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('hotel', OLD.HotelID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_package_insert$$
+CREATE TRIGGER trg_mv_package_insert AFTER INSERT ON TourPackage
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('package', NEW.PackageID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_package_update$$
+CREATE TRIGGER trg_mv_package_update AFTER UPDATE ON TourPackage
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('package', NEW.PackageID);
+END$$
+
+DROP TRIGGER IF EXISTS trg_mv_package_delete$$
+CREATE TRIGGER trg_mv_package_delete AFTER DELETE ON TourPackage
+FOR EACH ROW
+BEGIN
+    INSERT INTO mv_changelog (KeyType, RowKey) VALUES ('package', OLD.PackageID);
+END$$
+DELIMITER ;
@@ -0,0 +1,32 @@
+-- Room inventory for /hotels/availability and the capacity check in add_booking.
+--   mysql -u root -p Tourism_and_Travel_Booking_System < migrations/003_hotel_inventory.sql
+-- (root, or any user allowed to GRANT: the last section extends the agent role.)
+-- Safe to run more than once.
+
+USE Tourism_and_Travel_Booking_System;
+
+-- Rooms per hotel; one Itinerary row occupies one room per night from CheckInDate up to CheckOutDate.
+SET @has_rooms = (
+    SELECT COUNT(*) FROM information_schema.columns
+    WHERE table_schema = DATABASE() AND table_name = 'Hotel' AND column_name = 'Rooms'
+);
+SET @ddl = IF(@has_rooms = 0, 'ALTER TABLE Hotel ADD COLUMN Rooms INT NOT NULL DEFAULT 10 CHECK (Rooms > 0)', 'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Stays overlapping a date range at one hotel (the locked capacity check)
+SET @has_index = (
+    SELECT COUNT(*) FROM information_schema.statistics
+    WHERE table_schema = DATABASE() AND table_name = 'Itinerary' AND index_name = 'idx_itinerary_hotel_dates'
+);
+SET @ddl = IF(@has_index = 0, 'CREATE INDEX idx_itinerary_hotel_dates ON Itinerary (HotelID, CheckInDate, CheckOutDate)', 'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Agents add bookings with a stay: they read and insert Itinerary rows and lock the
+-- hotel row (SELECT ... FOR UPDATE needs LOCK TABLES alongside SELECT on Hotel).
+GRANT SELECT, INSERT ON Tourism_and_Travel_Booking_System.Itinerary TO 'agent'@'localhost';
+GRANT LOCK TABLES ON Tourism_and_Travel_Booking_System.* TO 'agent'@'localhost';
+FLUSH PRIVILEGES;
@@ -0,0 +1,16 @@
+-- Queued payment ingestion (PAYMENT_QUEUE=1).
+--   mysql -u admin -p Tourism_and_Travel_Booking_System < migrations/004_payment_queue.sql
+-- Safe to run more than once.
+
+USE Tourism_and_Travel_Booking_System;
+
+-- Reference of the queue entry a payment came from. Unique, so a batch retried after a
+-- crash finds the payment it already inserted instead of inserting it twice.
+SET @has_ref = (
+    SELECT COUNT(*) FROM information_schema.columns
+    WHERE table_schema = DATABASE() AND table_name = 'Payment' AND column_name = 'QueueRef'
+);
+SET @ddl = IF(@has_ref = 0, 'ALTER TABLE Payment ADD COLUMN QueueRef CHAR(32) NULL, ADD UNIQUE INDEX uq_payment_queue_ref (QueueRef)', 'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
@@ -0,0 +1,48 @@
+"""
+gunicorn settings and hooks for `flask serve`, which fills them in from its options:
+
+    flask --app app serve --workers 9 --threads 4 --bind 0.0.0.0:8000
+
+(or directly: SERVE_WORKERS=9 gunicorn -c serve.py app:app).
+
+Workers are pre-forked gthread workers. Each one imports the app itself after the fork
+(unless --preload) and warms its pools and caches before it accepts a request. The master logs
+when it is listening, and every worker logs when it is ready and what warming cost.
+
+kill -HUP <master pid> reloads gracefully: new workers start (loading new code unless
+--preload) and warm up, while the old ones stop accepting and finish their in-flight
+requests within graceful_timeout; connections arriving meanwhile wait in the listen
+backlog. kill -TERM stops the same way.
+"""
+import os
+import time
+
+bind = os.environ.get('SERVE_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('SERVE_WORKERS', 2 * (os.cpu_count() or 1) + 1))
+threads = int(os.environ.get('SERVE_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('SERVE_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30))  # seconds old workers get to finish on reload/stop
+keepalive = 5
+preload_app = os.environ.get('SERVE_PRELOAD') == '1'
+warm = os.environ.get('SERVE_WARM', '1') == '1'
+started_at = float(os.environ.get('SERVE_STARTED_AT', time.time()))
+
+def when_ready(server):
+    server.log.info("Listening on %s %.2fs after launch; starting %d workers x %d threads",
+                    ', '.join(bind.split(',')), time.time() - started_at, server.num_workers, threads)
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+
+def post_worker_init(worker):
+    """Runs in the worker once the app is loaded, before it accepts connections."""
+    from app import warm_worker, worker_state
+    state = warm_worker(notify=worker.notify) if warm else worker_state
+    failed = [name for name, result in state['steps'].items() if isinstance(result, str)]
+    worker.log.info("Worker %s ready in %.2fs (warm-up %s)%s", worker.pid, time.monotonic() - worker.forked_at,
+                    f"{state['warm_seconds']:.2f}s" if state['warm_seconds'] is not None else 'off',
+                    f"; failed: {', '.join(failed)}" if failed else '')
+
+def on_reload(server):
+    server.log.info("Reloading: starting new workers; old ones finish their requests within %ds", graceful_timeout)
@@ -42,6 +42,7 @@ CREATE TABLE Booking (
     Status ENUM('Confirmed','Pending','Cancelled','Paid') DEFAULT 'Pending',
     CustomerID INT NOT NULL,
     PackageID INT NOT NULL,
+    INDEX idx_booking_customer_date (CustomerID, BookingDate),
     FOREIGN KEY (CustomerID) REFERENCES Customer(CustomerID) ON DELETE CASCADE ON UPDATE CASCADE,
     FOREIGN KEY (PackageID) REFERENCES TourPackage(PackageID) ON DELETE RESTRICT ON UPDATE CASCADE
 );
@@ -53,6 +54,7 @@ CREATE TABLE Payment (
     PaymentDate DATE NOT NULL,
     PaymentMethod VARCHAR(50),
     BookingID INT NOT NULL,
+    INDEX idx_payment_booking_date (BookingID, PaymentDate),
     FOREIGN KEY (BookingID) REFERENCES Booking(BookingID) ON DELETE CASCADE ON UPDATE CASCADE
 );
 
@@ -91,6 +93,7 @@ CREATE TABLE TravelDependent (
     Age INT CHECK (Age >= 0),
     Relation VARCHAR(50),
     CustomerID INT NOT NULL,
+    INDEX idx_dependent_customer (CustomerID),
     FOREIGN KEY (CustomerID) REFERENCES Customer(CustomerID) ON DELETE CASCADE ON UPDATE CASCADE
 );
 
@@ -379,6 +382,8 @@ GRANT SELECT ON Tourism_and_Travel_Booking_System.Payment TO 'agent'@'localhost'
 GRANT SELECT ON Tourism_and_Travel_Booking_System.Hotel TO 'agent'@'localhost';
 GRANT SELECT ON Tourism_and_Travel_Booking_System.Destination TO 'agent'@'localhost';
 GRANT SELECT ON Tourism_and_Travel_Booking_System.Transport TO 'agent'@'localhost';
+GRANT SELECT, INSERT ON Tourism_and_Travel_Booking_System.Itinerary TO 'agent'@'localhost';
+GRANT LOCK TABLES ON Tourism_and_Travel_Booking_System.* TO 'agent'@'localhost';
 
 
 -- accountant: 